@@ -0,0 +1,26 @@
+from modules.bm25_index import BM25Index, BM25IndexRetriever, BM25IndexWriter
+from modules.compressed_io import CompressedFileSystemBlobLoader
+from modules.ingest_pipeline import split_blob
+from modules.json_parser import JsonParser
+from modules.offset_splitter import OffsetTextSplitter
+
+content_func = lambda x: [i["paragraph"] for i in x["paragraphs"]]
+metadata_func = lambda x: [
+    {"title": x["title"], "author": x["authors"], "paragraph_id": i["paragraph_idx"]}
+    for i in x["paragraphs"]
+]
+path = "./data/240229-10k/"
+fs_blob_loader = CompressedFileSystemBlobLoader(path=path, glob="**/*.json")
+json_parser = JsonParser(content_func, metadata_func, item_path="paragraphs[*]")
+splitter = OffsetTextSplitter()
+
+with BM25IndexWriter("./data/bm25-240229-10k/") as writer:
+    for blob in fs_blob_loader.yield_blobs():
+        for _, chunks in split_blob(json_parser, splitter, blob):
+            writer.add_documents(chunks)
+
+retriever = BM25IndexRetriever(
+    index=BM25Index("./data/bm25-240229-10k/"),
+    fields={"metadata.title": 2.0, "text": 1.0},
+)
+print(retriever.invoke("sodium ion battery cathode"))
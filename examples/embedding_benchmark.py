@@ -0,0 +1,46 @@
+"""\
+Throughput of CPUEmbeddings against the HuggingFaceEmbeddings default on CPU.
+
+% python -m examples.embedding_benchmark ./data/240229-10k/ 2000
+"""
+
+
+from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
+from modules.cpu_embeddings import CPUEmbeddings
+import glob
+import json
+import sys
+import time
+
+path = sys.argv[1] if len(sys.argv) > 1 else "./data/240229-10k/"
+n_texts = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+texts = []
+for file in sorted(glob.glob(path + "**/*.json", recursive=True)):
+    with open(file, "r") as f:
+        texts.extend(i["paragraph"] for i in json.load(f)["paragraphs"])
+    if len(texts) >= n_texts:
+        break
+texts = texts[:n_texts]
+print(f"{len(texts)} paragraphs")
+
+backends = {
+    "HuggingFaceEmbeddings(cpu)": HuggingFaceEmbeddings(model_kwargs={"device": "cpu"}),
+    "CPUEmbeddings": CPUEmbeddings(),
+    "CPUEmbeddings(int8)": CPUEmbeddings(quantize=True),
+}
+reference = None
+for name, embeddings in backends.items():
+    embeddings.embed_documents(texts[:8])  # warm up
+    start = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    elapsed = time.perf_counter() - start
+    if reference is None:
+        reference = vectors
+    # mean cosine similarity to the default backend, 1.0 means identical vectors
+    cosine = sum(
+        sum(a * b for a, b in zip(u, v))
+        / (sum(a * a for a in u) * sum(b * b for b in v)) ** 0.5
+        for u, v in zip(reference, vectors)
+    ) / len(texts)
+    print(f"{name:28s} {len(texts) / elapsed:8.1f} texts/s  cosine to default {cosine:.4f}")
@@ -20,6 +20,7 @@ from langchain.prompts import StringPromptTemplate
 from langchain.schema import AgentAction, AgentFinish  # langchain_core.agents
 from langchain.tools.retriever import create_retriever_tool
 from modules.ES_query_retriever import ESQueryRetriever
+from modules.retriever_cache import CachedRetriever, RetrievalCache
 
 # from qwen_chat import QwenChatModel
 import re
@@ -35,7 +36,10 @@ es = Elasticsearch(
     config["ES_HOST"], http_auth=(config["ES_USER"], config["ES_SECRET"])
 )
 
-retriever = ESQueryRetriever(index="chem_papers.en.*")
+retriever = CachedRetriever(
+    retriever=ESQueryRetriever(index="chem_papers.en.*", es_client=es),
+    cache=RetrievalCache(ttl=300),
+)
 retriever_tool = create_retriever_tool(
     retriever,
     name="Elasticsearch Query API Retriever",
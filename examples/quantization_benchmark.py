@@ -0,0 +1,58 @@
+"""\
+recall@k, memory and latency of each LocalVectorStore quantization mode.
+
+Runs on the vectors of an existing LocalVectorStore, or on synthetic clustered
+768-d vectors if no path is given:
+
+% python -m examples.quantization_benchmark [./data/vectorstore/]
+"""
+
+
+from modules.local_vectorstore import LocalVectorStore
+import numpy as np
+import shutil
+import sys
+import tempfile
+import time
+
+k = 10
+n_queries = 200
+source = sys.argv[1] if len(sys.argv) > 1 else None
+
+rng = np.random.default_rng(0)
+if source:
+    vectors = np.asarray(LocalVectorStore(source).vectors)
+else:
+    centers = rng.normal(size=(1000, 768)).astype(np.float32)
+    vectors = centers[rng.integers(0, 1000, 100_000)] + 0.5 * rng.normal(
+        size=(100_000, 768)
+    ).astype(np.float32)
+queries = vectors[rng.choice(len(vectors), n_queries, replace=False)]
+queries = queries + 0.1 * rng.normal(size=queries.shape).astype(np.float32)
+
+workdir = tempfile.mkdtemp()
+store = LocalVectorStore(workdir)
+for start in range(0, len(vectors), 10_000):
+    batch = vectors[start : start + 10_000]
+    store.add_embeddings(zip([""] * len(batch), batch.tolist()))
+truth, _ = store.search_vectors(queries, k, exact=True)
+
+
+def run(name: str, bytes_per_vector: float) -> None:
+    store.search_vectors(queries[:5], k)  # warm up
+    start = time.perf_counter()
+    found = np.concatenate([store.search_vectors(q[None, :], k)[0] for q in queries])
+    latency = (time.perf_counter() - start) / n_queries * 1000
+    recall = np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)])
+    print(
+        f"{name:10s} recall@{k} {recall:.3f}  {bytes_per_vector:6.0f} B/vector  "
+        f"{latency:7.2f} ms/query"
+    )
+
+
+print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, rescore {store.rescore}x")
+run("float32", vectors.shape[1] * 4)
+for kind, kwargs in [("int8", {}), ("pq", {"m": 96}), ("binary", {})]:
+    store.quantize(kind, **kwargs)
+    run(kind, store._codes.nbytes / store.count)
+shutil.rmtree(workdir)
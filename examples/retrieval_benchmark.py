@@ -0,0 +1,68 @@
+"""\
+recall@k, MRR, latency and QPS of the retrieval backends, offline.
+
+Runs the labelled query set against the BM25 index of build_bm25_index.py
+and, if given, a LocalVectorStore of the same corpus, then compares the
+results with the previous run in ./benchmarks/:
+
+% python -m examples.retrieval_benchmark ./data/queries.jsonl ./data/bm25-240229-10k/ [./data/vectorstore/]
+
+Each line of the query set is {"query": ..., "relevant": [title, ...]}.
+"""
+
+
+from modules.bm25_index import BM25Index, BM25IndexRetriever
+from modules.cpu_embeddings import CPUEmbeddings
+from modules.hybrid_retriever import HybridRetriever
+from modules.local_vectorstore import LocalVectorStore
+from modules.retrieval_benchmark import (
+    compare,
+    format_results,
+    load_queries,
+    read_results,
+    run_benchmark,
+    snapshot_id,
+    write_results,
+)
+import glob
+import sys
+import time
+
+queries = load_queries(sys.argv[1] if len(sys.argv) > 1 else "./data/queries.jsonl")
+index_path = sys.argv[2] if len(sys.argv) > 2 else "./data/bm25-240229-10k/"
+vectorstore_path = sys.argv[3] if len(sys.argv) > 3 else None
+
+index = BM25Index(index_path)
+backends = {
+    "bm25-title": BM25IndexRetriever(index=index, k=10),
+    "bm25-title+text": BM25IndexRetriever(
+        index=index, k=10, fields={"metadata.title": 2.0, "text": 1.0}
+    ),
+}
+if vectorstore_path:
+    store = LocalVectorStore(vectorstore_path, embedding=CPUEmbeddings())
+    backends["vector"] = store.as_retriever(search_kwargs={"k": 10})
+    # without a shared id, chunks found by both are matched by their text
+    backends["hybrid"] = HybridRetriever(
+        retrievers=[backends["bm25-title+text"], backends["vector"]], k=10
+    )
+
+results = run_benchmark(
+    backends,
+    queries,
+    k=10,
+    key="title",
+    concurrency=(1, 4, 16),
+    corpus=snapshot_id(index_path),
+)
+print(format_results(results))
+
+previous = sorted(glob.glob("./benchmarks/retrieval-*.json"))
+output = f"./benchmarks/retrieval-{time.strftime('%Y%m%d-%H%M%S')}.json"
+write_results(results, output)
+print(f"results written to {output}")
+if previous:
+    baseline = read_results(previous[-1])
+    if baseline["meta"]["corpus"] == results["meta"]["corpus"]:
+        print(f"compared with {previous[-1]}")
+        print(compare(baseline, results))
@@ -8,7 +8,10 @@ from dotenv import dotenv_values
 from elasticsearch import Elasticsearch
 from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores.elasticsearch import ElasticsearchStore
-from modules.database_api import Database, FileSystemBlobLoader
+from modules.compressed_io import CompressedFileSystemBlobLoader
+from modules.database_api import Database
+from modules.embedding_cache import CachedEmbeddings
+from modules.es_bulk_writer import ESBulkWriter
 from modules.json_parser import JsonParser
 
 config = dotenv_values("./.env")
@@ -22,7 +25,10 @@ es = Elasticsearch(
     ),
 )
 
-embedding = HuggingFaceEmbeddings(model_kwargs={"device": "cuda:0"})
+embedding = CachedEmbeddings(
+    HuggingFaceEmbeddings(model_kwargs={"device": "cuda:0"}),
+    "./data/embeddings.sqlite",
+)
 es_store = ElasticsearchStore(
     index_name="chem_papers.en.240229-10k", embedding=embedding, es_connection=es
 )
@@ -32,9 +38,13 @@ metadata_func = lambda x: [
     for i in x["paragraphs"]
 ]
 path = "./data/240229-10k/"
-fs_blob_loader = FileSystemBlobLoader(path=path, glob="**/*.json")
-json_parser = JsonParser(content_func, metadata_func)
+fs_blob_loader = CompressedFileSystemBlobLoader(path=path, glob="**/*.json")
+json_parser = JsonParser(content_func, metadata_func, item_path="paragraphs[*]")
 db = Database(
-    path=path, blob_parser=json_parser, vectorstore=es_store
+    path=path,
+    blob_loader=fs_blob_loader,
+    blob_parser=json_parser,
+    vectorstore=es_store,
+    indexer=ESBulkWriter.from_vectorstore(es_store, workers=4),
 )
-db.store()
+print(db.store(batch_size=256))
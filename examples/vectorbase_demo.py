@@ -19,6 +19,8 @@ from langchain_openai import ChatOpenAI
 from langchain.prompts import StringPromptTemplate
 from langchain.schema import AgentAction, AgentFinish  # langchain_core.agents
 from langchain.tools.retriever import create_retriever_tool
+from modules.embedding_cache import CachedEmbeddings
+from modules.retriever_cache import CachedRetriever, RetrievalCache
 
 # from qwen_chat import QwenChatModel
 import re
@@ -33,11 +35,18 @@ llm = ChatOpenAI(model_name="gpt-3.5-turbo-1106", temperature=0)
 es = Elasticsearch(
     config["ES_HOST"], http_auth=(config["ES_USER"], config["ES_SECRET"])
 )
-embedding = HuggingFaceEmbeddings(model_kwargs={"device": "cuda:0"})
+# the semantic cache tier and the vector search embed the query once
+embedding = CachedEmbeddings(
+    HuggingFaceEmbeddings(model_kwargs={"device": "cuda:0"}),
+    "./data/embeddings.sqlite",
+)
 es_store = ElasticsearchStore(
     index_name="chem_papers.en.*", embedding=embedding, es_connection=es
 )
-retriever = es_store.as_retriever()
+retriever = CachedRetriever(
+    retriever=es_store.as_retriever(),
+    cache=RetrievalCache(ttl=300, embedding=embedding, similarity_threshold=0.95),
+)
 retriever_tool = create_retriever_tool(
     retriever,
     name="ElasticsearchStore Retriever",
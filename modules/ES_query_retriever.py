@@ -1,43 +1,381 @@
-from dotenv import dotenv_values, load_dotenv
-from elasticsearch import Elasticsearch
+from dotenv import dotenv_values
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
 from langchain_core.callbacks.base import Callbacks
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.retrievers import BaseRetriever
-from .search_utils import SEARCH_ENGINES, web_search
 from typing import Any, Dict, List, Optional
+import asyncio
+import os
+import threading
 
 
-config = dotenv_values()
-es = Elasticsearch(
-            config["ES_HOST"],
-            http_auth=(
-                (
-                    config["ES_USER"],
-                    config["ES_SECRET"],
-                )
-            ),
-        )
+_clients: Dict[tuple, Elasticsearch] = {}
+_async_clients: Dict[asyncio.AbstractEventLoop, Dict[tuple, AsyncElasticsearch]] = {}
+_clients_pid: Optional[int] = None
+_clients_lock = threading.Lock()
+
+
+def get_client(
+    hosts: str | list[str] | None = None,
+    user: str | None = None,
+    secret: str | None = None,
+    env_file: str = ".env",
+    connections_per_node: int = 10,
+    request_timeout: float = 10.0,
+    max_retries: int = 3,
+    retry_on_timeout: bool = True,
+    sniff_on_start: bool = False,
+    sniff_on_node_failure: bool = False,
+    min_delay_between_sniffing: float = 60.0,
+    http_compress: bool = False,
+    asynchronous: bool = False,
+) -> Elasticsearch | AsyncElasticsearch:
+    """
+    Shared Elasticsearch client, created on first use.
+
+    Clients are cached per process and per settings. The client is thread-safe
+    and keeps a pool of keep-alive connections per node; a forked worker
+    process gets clients of its own instead of the parent's sockets.
+
+    With asynchronous, an AsyncElasticsearch client of the running event loop
+    is returned (its connections belong to the loop), so it must be called
+    from a coroutine. It needs aiohttp, `pip install elasticsearch[async]`.
+    Close the clients with close_clients(), and those of an event loop with
+    aclose_clients() before the loop ends.
+    :param hosts: Elasticsearch url(s), defaults to ES_HOST from the environment or env_file.
+    :param user: defaults to ES_USER from the environment or env_file.
+    :param secret: defaults to ES_SECRET from the environment or env_file.
+    :param env_file: dotenv file read for missing settings.
+    :param connections_per_node: size of the connection pool of each node.
+    :param request_timeout: default timeout of a request in seconds, overridable per request.
+    :param max_retries: retries of a failed request on other nodes.
+    :param retry_on_timeout: also retry requests that timed out.
+    :param sniff_on_start: discover the cluster nodes when the client is created.
+    :param sniff_on_node_failure: rediscover the nodes when a node fails.
+    :param min_delay_between_sniffing: seconds between two node discoveries.
+    :param http_compress: gzip request bodies.
+    :param asynchronous: return an AsyncElasticsearch client.
+    """
+    global _clients_pid
+    if hosts is None or user is None or secret is None:
+        config = {**dotenv_values(env_file), **os.environ}
+        if hosts is None:
+            hosts = config.get("ES_HOST", "http://localhost:9200")
+        if user is None:
+            user = config.get("ES_USER")
+        if secret is None:
+            secret = config.get("ES_SECRET")
+    settings = dict(
+        connections_per_node=connections_per_node,
+        request_timeout=request_timeout,
+        max_retries=max_retries,
+        retry_on_timeout=retry_on_timeout,
+        sniff_on_start=sniff_on_start,
+        sniff_on_node_failure=sniff_on_node_failure,
+        min_delay_between_sniffing=min_delay_between_sniffing,
+        http_compress=http_compress,
+    )
+    key = (str(hosts), user, secret, *settings.values())
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            # sockets inherited through fork belong to the parent
+            _clients.clear()
+            _async_clients.clear()
+            _clients_pid = os.getpid()
+        if asynchronous:
+            for loop in [loop for loop in _async_clients if loop.is_closed()]:
+                del _async_clients[loop]
+            clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+        else:
+            clients = _clients
+        if key not in clients:
+            client_class = AsyncElasticsearch if asynchronous else Elasticsearch
+            clients[key] = client_class(
+                hosts,
+                basic_auth=(user, secret) if user else None,
+                **settings,
+            )
+        return clients[key]
+
+
+def close_clients() -> None:
+    """Close the shared clients of get_client()."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+async def aclose_clients() -> None:
+    """Close the shared async clients of get_client() of the running event loop."""
+    with _clients_lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.close()
 
 
 class ESQueryRetriever(BaseRetriever):
-    index = "chem_papers.en.*"
+    """
+    Match queries against the paper titles of an Elasticsearch index.
+
+    Uses es_client if given, otherwise the shared client of get_client()
+    created with es_options on the first query. Async retrieval (ainvoke,
+    abatch_retrieve) uses es_async_client, or the shared async client of the
+    running event loop.
+
+    Only the top k hits are fetched, with only the text field and the
+    metadata (or the metadata_fields of it) in _source. With highlight, the
+    text is not fetched at all: page_content is made of the fragments of the
+    text that match the query, which keeps responses and prompts short.
+
+    With id_key and score_key, the _id and _score of each hit are added to
+    the metadata, e.g. for HybridRetriever.
+
+    batch_retrieve() sends many queries in _msearch requests of msearch_size
+    searches each, instead of one search request per query.
+    """
+
+    index: str = "chem_papers.en.*"
+    es_client: Optional[Elasticsearch] = None
+    es_async_client: Optional[AsyncElasticsearch] = None
+    es_options: Dict[str, Any] = {}
+    request_timeout: Optional[float] = None
+    k: int = 4
+    query_field: str = "metadata.title"
+    text_field: str = "text"
+    metadata_fields: Optional[List[str]] = None
+    highlight: bool = False
+    fragment_size: int = 200
+    number_of_fragments: int = 3
+    id_key: Optional[str] = None
+    score_key: Optional[str] = None
+    msearch_size: int = 100
+
     class Config:
         arbitrary_types_allowed = True
 
-    def __init__(self, index):
-        super().__init__()
-        self.index = index
+    def __init__(self, index: str = "chem_papers.en.*", **kwargs):
+        super().__init__(index=index, **kwargs)
+
+    @property
+    def client(self) -> Elasticsearch:
+        if self.es_client is not None:
+            return self.es_client
+        return get_client(**self.es_options)
+
+    @property
+    def async_client(self) -> AsyncElasticsearch:
+        if self.es_async_client is not None:
+            return self.es_async_client
+        return get_client(**self.es_options, asynchronous=True)
+
+    def _search_request(self, query: str, vector: Optional[List[float]]) -> Dict:
+        return {"query": {"match": {self.query_field: query}}}
+
+    def _search_body(self, query: str, vector: Optional[List[float]] = None) -> Dict:
+        if self.metadata_fields is None:
+            includes = ["metadata"]
+        else:
+            includes = [f"metadata.{field}" for field in self.metadata_fields]
+        body = self._search_request(query, vector)
+        body["size"] = self.k
+        body["track_total_hits"] = False
+        if self.highlight:
+            body["highlight"] = {
+                "fields": {
+                    self.text_field: {
+                        "fragment_size": self.fragment_size,
+                        "number_of_fragments": self.number_of_fragments,
+                        # the start of the text if no fragment matches
+                        "no_match_size": self.fragment_size,
+                    }
+                },
+                "highlight_query": {"match": {self.text_field: query}},
+                "pre_tags": [""],
+                "post_tags": [""],
+            }
+        else:
+            includes.append(self.text_field)
+        body["_source"] = {"includes": includes}
+        return body
+
+    def _search_client(self, asynchronous: bool = False):
+        client = self.async_client if asynchronous else self.client
+        if self.request_timeout is not None:
+            client = client.options(request_timeout=self.request_timeout)
+        return client
 
     def _es_search(self, query) -> Dict:
-        results = es.search(
-            index=self.index,
-            body={"query": {"match": {"metadata.title": query}}}
+        results = self._search_client().search(
+            index=self.index, body=self._search_body(query)
+        )
+        return results
+
+    async def _aes_search(self, query) -> Dict:
+        results = await self._search_client(asynchronous=True).search(
+            index=self.index, body=await self._asearch_body(query)
         )
         return results
 
-    def _get_relevant_documents(self, query: str) -> List[Document]:
+    async def _asearch_body(self, query: str) -> Dict:
+        return self._search_body(query)
+
+    def _search_bodies(self, queries: List[str]) -> List[Dict]:
+        return [self._search_body(query) for query in queries]
+
+    async def _asearch_bodies(self, queries: List[str]) -> List[Dict]:
+        return self._search_bodies(queries)
+
+    def _msearch_requests(self, bodies: List[Dict]) -> List[List[Dict]]:
+        requests = []
+        for start in range(0, len(bodies), self.msearch_size):
+            searches = []
+            for body in bodies[start : start + self.msearch_size]:
+                searches.append({"index": self.index})
+                searches.append(body)
+            requests.append(searches)
+        return requests
+
+    def _es_msearch(self, bodies: List[Dict]) -> List[Dict]:
+        client = self._search_client()
+        responses = []
+        for searches in self._msearch_requests(bodies):
+            responses.extend(client.msearch(searches=searches)["responses"])
+        return responses
+
+    async def _aes_msearch(self, bodies: List[Dict]) -> List[Dict]:
+        client = self._search_client(asynchronous=True)
+        results = await asyncio.gather(
+            *(
+                client.msearch(searches=searches)
+                for searches in self._msearch_requests(bodies)
+            )
+        )
+        return [response for result in results for response in result["responses"]]
+
+    def _hit2doc(self, hit: Dict) -> Document:
+        source = hit.get("_source", {})
+        if self.highlight:
+            fragments = hit.get("highlight", {}).get(self.text_field, [])
+            page_content = " ... ".join(fragments)
+        else:
+            page_content = source.get(self.text_field, "")
+        metadata = source.get("metadata", {})
+        if self.id_key:
+            metadata[self.id_key] = hit["_id"]
+        if self.score_key:
+            metadata[self.score_key] = hit["_score"]
+        return Document(page_content=page_content, metadata=metadata)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
         results_list = self._es_search(
             query=query,
         )["hits"]["hits"]
-        docs = [Document(page_content=i["_source"]["text"], metadata=i["_source"]["metadata"]) for i in results_list]
+        docs = [self._hit2doc(i) for i in results_list]
+        return docs
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        results_list = (await self._aes_search(query=query))["hits"]["hits"]
+        docs = [self._hit2doc(i) for i in results_list]
         return docs
+
+    def _responses2docs(
+        self, queries: List[str], responses: List[Dict]
+    ) -> List[List[Document]]:
+        results = []
+        for query, response in zip(queries, responses):
+            # _msearch reports a failed search in its response instead of
+            # failing the request; fail the whole batch rather than return
+            # no hits for that query
+            if "error" in response:
+                raise RuntimeError(f"search of {query!r} failed: {response['error']}")
+            results.append([self._hit2doc(hit) for hit in response["hits"]["hits"]])
+        return results
+
+    def batch_retrieve(self, queries: List[str]) -> List[List[Document]]:
+        """
+        Retrieve the documents of many queries with _msearch.
+        :return: the documents of each query, in the order of queries.
+        :raises RuntimeError: if the search of any query failed.
+        """
+        if not queries:
+            return []
+        responses = self._es_msearch(self._search_bodies(queries))
+        return self._responses2docs(queries, responses)
+
+    async def abatch_retrieve(self, queries: List[str]) -> List[List[Document]]:
+        """async version of batch_retrieve, the _msearch requests are sent concurrently."""
+        if not queries:
+            return []
+        responses = await self._aes_msearch(await self._asearch_bodies(queries))
+        return self._responses2docs(queries, responses)
+
+
+class ESVectorRetriever(ESQueryRetriever):
+    """
+    kNN search over the vectors of an ElasticsearchStore index.
+
+    Same options as ESQueryRetriever, with the documents and field names
+    written by ElasticsearchStore by default. batch_retrieve() embeds all
+    queries with one embedding.embed_queries() call if the model has one
+    (CPUEmbeddings, CachedEmbeddings), otherwise with embed_query() per query,
+    like invoke(), so models with query prefixes and query caches give the
+    same hits, then sends the kNN searches with _msearch.
+    """
+
+    embedding: Embeddings
+    vector_field: str = "vector"
+    num_candidates: int = 50
+
+    def _search_request(self, query: str, vector: Optional[List[float]]) -> Dict:
+        if vector is None:
+            vector = self.embedding.embed_query(query)
+        return {
+            "knn": {
+                "field": self.vector_field,
+                "query_vector": vector,
+                "k": self.k,
+                "num_candidates": max(self.num_candidates, self.k),
+            }
+        }
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        embed_queries = getattr(self.embedding, "embed_queries", None)
+        if embed_queries is not None:
+            return embed_queries(queries)
+        return [self.embedding.embed_query(query) for query in queries]
+
+    async def _aembed_queries(self, queries: List[str]) -> List[List[float]]:
+        aembed_queries = getattr(self.embedding, "aembed_queries", None)
+        if aembed_queries is not None:
+            return await aembed_queries(queries)
+        return list(
+            await asyncio.gather(
+                *(self.embedding.aembed_query(query) for query in queries)
+            )
+        )
+
+    async def _asearch_body(self, query: str) -> Dict:
+        return self._search_body(query, await self.embedding.aembed_query(query))
+
+    def _search_bodies(self, queries: List[str]) -> List[Dict]:
+        vectors = self._embed_queries(queries)
+        return [
+            self._search_body(query, vector) for query, vector in zip(queries, vectors)
+        ]
+
+    async def _asearch_bodies(self, queries: List[str]) -> List[Dict]:
+        vectors = await self._aembed_queries(queries)
+        return [
+            self._search_body(query, vector) for query, vector in zip(queries, vectors)
+        ]
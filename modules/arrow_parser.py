@@ -0,0 +1,164 @@
+"""
+Columnar Parquet / Arrow IPC parser.
+
+Instead of calling content_func and metadata_func once per record like
+JsonParser and JsonlParser, ArrowParser selects the content and metadata
+columns of a whole record batch with Arrow compute functions and converts
+them to Python in one call per column. lazy_parse_batches() hands the texts
+and metadatas of a batch to the splitter together, see Database. The row
+groups of a Parquet file and the batches of an Arrow IPC file can be read
+independently, so IngestPipeline parses them in separate worker tasks.
+
+For the 240229 dump (title, authors, paragraphs: list<{paragraph, paragraph_idx}>):
+
+    ArrowParser(
+        "paragraphs.paragraph",
+        {"title": "title", "author": "authors", "paragraph_id": "paragraphs.paragraph_idx"},
+        explode="paragraphs",
+    )
+"""
+
+
+from collections.abc import Iterator
+from langchain_community.document_loaders import Blob
+from langchain_community.document_loaders.base import BaseBlobParser
+from langchain_core.documents import Document
+
+
+class ArrowParser(BaseBlobParser):
+    """
+    Parse Parquet and Arrow IPC (file or stream) blobs by column.
+
+    Columns are selected by dotted paths, where each component after the first
+    is a struct field. With explode set to a list column, each element of that
+    list becomes a row: paths starting with the list column select fields of
+    the elements, other columns are repeated for every element of their row.
+    """
+
+    def __init__(
+        self,
+        content_column: str,
+        metadata_columns: dict[str, str] | list[str] | None = None,
+        explode: str | None = None,
+        batch_size: int = 65536,
+    ) -> None:
+        """
+        :param content_column: path of the text column.
+        :param metadata_columns: {metadata key: column path}, or a list of paths used as keys.
+        :param explode: list column to expand into one row per element.
+        :param batch_size: rows per record batch read from Parquet.
+        """
+        try:
+            import pyarrow
+        except ImportError as e:
+            raise ImportError(
+                "ArrowParser requires pyarrow, `pip install pyarrow`"
+            ) from e
+
+        super().__init__()
+        self.content_column = content_column
+        if metadata_columns is None:
+            metadata_columns = {}
+        elif not isinstance(metadata_columns, dict):
+            metadata_columns = {path: path for path in metadata_columns}
+        self.metadata_columns = metadata_columns
+        self.explode = explode
+        self.batch_size = batch_size
+
+    def _columns(self) -> list[str]:
+        """Top-level columns to read."""
+        paths = [self.content_column, *self.metadata_columns.values()]
+        if self.explode:
+            paths.append(self.explode)
+        return list(dict.fromkeys(path.split(".")[0] for path in paths))
+
+    def parts(self, blob: Blob) -> int:
+        """
+        Number of parts of blob that lazy_parse_batches() can read on their own:
+        row groups of Parquet, record batches of Arrow IPC files, 1 for IPC streams.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        with blob.as_bytes_io() as f:
+            head = f.read(6)
+            f.seek(0)
+            if head.startswith(b"PAR1"):
+                return pq.ParquetFile(f).metadata.num_row_groups
+            elif head == b"ARROW1":
+                return pa.ipc.open_file(f).num_record_batches
+            return 1
+
+    def _record_batches(self, blob: Blob, part: int | None = None) -> Iterator:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        with blob.as_bytes_io() as f:
+            head = f.read(6)
+            f.seek(0)
+            if head.startswith(b"PAR1"):
+                yield from pq.ParquetFile(f).iter_batches(
+                    batch_size=self.batch_size,
+                    row_groups=None if part is None else [part],
+                    columns=self._columns(),
+                )
+            elif head == b"ARROW1":
+                reader = pa.ipc.open_file(f)
+                parts = range(reader.num_record_batches) if part is None else [part]
+                for i in parts:
+                    yield reader.get_batch(i)
+            else:
+                yield from pa.ipc.open_stream(f)
+
+    def _select(self, batch, path: str, parents):
+        import pyarrow.compute as pc
+
+        if self.explode and path.split(".")[0] == self.explode:
+            array = pc.list_flatten(batch.column(self.explode))
+            fields = path.split(".")[1:]
+        else:
+            name, *fields = path.split(".")
+            array = batch.column(name)
+            if parents is not None:
+                array = array.take(parents)
+        for field in fields:
+            array = pc.struct_field(array, field)
+        return array
+
+    def lazy_parse_batches(
+        self, blob: Blob, part: int | None = None
+    ) -> Iterator[tuple[list[str], list[dict]]]:
+        """
+        Yield (texts, metadatas) per record batch, skipping rows without text.
+        :param part: only read this part of blob, see parts().
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        keys = list(self.metadata_columns)
+        for batch in self._record_batches(blob, part):
+            parents = None
+            if self.explode:
+                parents = pc.list_parent_indices(batch.column(self.explode))
+            content = self._select(batch, self.content_column, parents)
+            columns = [
+                self._select(batch, path, parents)
+                for path in self.metadata_columns.values()
+            ]
+            if content.null_count:
+                valid = pc.is_valid(content)
+                content = content.filter(valid)
+                columns = [column.filter(valid) for column in columns]
+            if len(content) == 0:
+                continue
+            texts = content.to_pylist()
+            if columns:
+                metadatas = pa.Table.from_arrays(columns, names=keys).to_pylist()
+            else:
+                metadatas = [{} for _ in texts]
+            yield texts, metadatas
+
+    def lazy_parse(self, blob: Blob) -> Iterator[Document]:
+        for texts, metadatas in self.lazy_parse_batches(blob):
+            for text, metadata in zip(texts, metadatas):
+                yield Document(page_content=text, metadata=metadata)
@@ -0,0 +1,543 @@
+"""
+In-process BM25 index, a stand-in for ESQueryRetriever without a cluster.
+
+BM25IndexWriter indexes the chunks produced by the parsers and splitter of
+Database (see split_blob), BM25Index memory-maps the result and searches it
+with NumPy, and BM25IndexRetriever has the options of ESQueryRetriever:
+
+    with BM25IndexWriter("./data/bm25/", fields=["metadata.title", "text"]) as writer:
+        for blob in loader.yield_blobs():
+            for _, chunks in split_blob(parser, splitter, blob):
+                writer.add_documents(chunks)
+    retriever = BM25IndexRetriever(index=BM25Index("./data/bm25/"), fields={"metadata.title": 2.0, "text": 1.0})
+
+Layout of the index directory, one set of <field>.* arrays per field:
+
+    meta.json               fields, number of documents, k1, b, block size
+    terms.json              vocabulary shared by the fields, term id = position
+    <field>.df.npy          document frequency of each term
+    <field>.idf.npy         BM25 idf of each term
+    <field>.term_max.npy    highest score of each term, for MaxScore
+    <field>.term_blocks.npy first posting block of each term, n_terms + 1
+    <field>.block_last.npy  last document of each block
+    <field>.block_max.npy   highest score in each block
+    <field>.block_offsets.npy
+                            byte offset of each block in postings, n_blocks + 1
+    <field>.postings.npy    blocks of block_size postings: varint document
+                            gaps, then varint term frequencies
+    <field>.norms.npy       k1 * (1 - b + b * length / avgdl) of each document
+    docs.jsonl docs.npy     [id, text, metadata] of each document and the byte
+                            offsets of the lines
+
+Scores follow Lucene's BM25 (idf = ln(1 + (N - df + 0.5) / (df + 0.5)),
+tf / (tf + norm)), so results are close to those of an Elasticsearch match
+query with the standard analyzer; field scores are summed with their boosts.
+"""
+
+
+from array import array
+from collections import Counter
+from collections.abc import Iterable
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from typing import Dict, List, Optional
+import json
+import numpy as np
+import os
+import re
+import shutil
+
+
+# CJK characters are single tokens, like in the standard analyzer
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af"
+_TOKEN = re.compile(f"[{_CJK}]|[^\\W_{_CJK}]+")
+
+_ARRAYS = [
+    "df",
+    "idf",
+    "term_max",
+    "term_blocks",
+    "block_last",
+    "block_max",
+    "block_offsets",
+    "postings",
+    "norms",
+]
+
+
+def analyze(text: str) -> list[str]:
+    """:return: lowercased word tokens of text."""
+    return _TOKEN.findall(text.lower())
+
+
+def field_text(document: Document, field: str) -> str:
+    """:return: page_content for "text", the value of metadata[a][b] for "metadata.a.b"."""
+    if field == "text":
+        return document.page_content
+    value = document.metadata
+    for key in field.split(".")[1:] if field.startswith("metadata.") else [field]:
+        value = value.get(key) if isinstance(value, dict) else None
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(v) for v in value)
+    return str(value)
+
+
+def encode_varints(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """:return: LEB128 bytes of non-negative values, and the byte count of each value."""
+    values = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    for i in range(1, 10):
+        nbytes += values >= np.uint64(1 << (7 * i))
+    starts = np.cumsum(nbytes) - nbytes
+    position = np.arange(int(nbytes.sum())) - np.repeat(starts, nbytes)
+    out = (
+        (np.repeat(values, nbytes) >> (7 * position).astype(np.uint64))
+        & np.uint64(0x7F)
+    ).astype(np.uint8)
+    out[position < np.repeat(nbytes, nbytes) - 1] |= 0x80
+    return out, nbytes
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    """:return: the values of LEB128 bytes."""
+    data = np.asarray(data, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    if len(ends) == len(data):
+        return data.astype(np.int64)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    shifts = (np.arange(len(data)) - np.repeat(starts, ends - starts + 1)) * 7
+    return np.add.reduceat((data & 0x7F).astype(np.int64) << shifts, starts)
+
+
+def _ranges(starts: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    """:return: concatenated aranges from starts, of sizes."""
+    ends = np.cumsum(sizes)
+    return np.arange(int(ends[-1]) if len(ends) else 0) - np.repeat(
+        ends - sizes - starts, sizes
+    )
+
+
+def _kth_largest(values: np.ndarray, k: int) -> float:
+    return float(np.partition(values, len(values) - k)[len(values) - k])
+
+
+class BM25IndexWriter:
+    """
+    Build a BM25Index directory.
+
+    Postings are collected in flat arrays and encoded when the writer is
+    closed; the index is written next to path and moved in place at the end,
+    so readers of an older index at path are not disturbed.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fields: Iterable[str] = ("metadata.title", "text"),
+        k1: float = 1.2,
+        b: float = 0.75,
+        block_size: int = 128,
+    ) -> None:
+        """
+        :param path: index directory, replaced when the writer is closed.
+        :param fields: "text" for page_content and "metadata.<key>" for metadata values.
+        :param k1: BM25 term frequency saturation.
+        :param b: BM25 length normalization.
+        :param block_size: postings per compressed block.
+        """
+        self.path = path
+        self.fields = list(fields)
+        self.k1 = k1
+        self.b = b
+        self.block_size = block_size
+        self._vocabulary: dict[str, int] = {}
+        # flat (term, document, frequency) postings and document lengths per field
+        self._terms = {field: array("I") for field in self.fields}
+        self._docs = {field: array("I") for field in self.fields}
+        self._tfs = {field: array("I") for field in self.fields}
+        self._lengths = {field: array("I") for field in self.fields}
+        self._tmp = f"{path.rstrip('/')}.{os.getpid()}.tmp"
+        if os.path.exists(self._tmp):
+            shutil.rmtree(self._tmp)
+        os.makedirs(self._tmp)
+        self._file = open(os.path.join(self._tmp, "docs.jsonl"), "wb")
+        self._offsets = array("Q", [0])
+        self.n_docs = 0
+
+    def __enter__(self) -> "BM25IndexWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            shutil.rmtree(self._tmp, ignore_errors=True)
+
+    def add_documents(
+        self, documents: Iterable[Document], ids: Iterable[str] | None = None
+    ) -> None:
+        """
+        :param ids: ids of the documents, e.g. the chunk ids of IngestManifest, their position in the index if None.
+        """
+        ids = iter(ids) if ids is not None else None
+        vocabulary = self._vocabulary
+        for document in documents:
+            doc = self.n_docs
+            doc_id = next(ids) if ids is not None else str(doc)
+            for field in self.fields:
+                counts = Counter(analyze(field_text(document, field)))
+                self._terms[field].extend(
+                    vocabulary.setdefault(term, len(vocabulary)) for term in counts
+                )
+                self._docs[field].extend([doc] * len(counts))
+                self._tfs[field].extend(counts.values())
+                self._lengths[field].append(sum(counts.values()))
+            line = json.dumps(
+                [doc_id, document.page_content, document.metadata],
+                ensure_ascii=False,
+                default=str,
+            ).encode("utf8")
+            self._file.write(line + b"\n")
+            self._offsets.append(self._offsets[-1] + len(line) + 1)
+            self.n_docs += 1
+
+    def _write_field(self, field: str) -> None:
+        n_terms = len(self._vocabulary)
+        terms = np.frombuffer(self._terms.pop(field), dtype=np.uint32)
+        order = np.argsort(terms, kind="stable")
+        docs = np.frombuffer(self._docs.pop(field), dtype=np.uint32)[order]
+        tfs = np.frombuffer(self._tfs.pop(field), dtype=np.uint32)[order]
+        lengths = np.frombuffer(self._lengths.pop(field), dtype=np.uint32)
+        n_postings = len(docs)
+        df = np.bincount(terms, minlength=n_terms).astype(np.uint32)
+        del terms, order
+
+        present = lengths > 0
+        avgdl = float(lengths[present].mean()) if present.any() else 1.0
+        norms = (self.k1 * (1 - self.b + self.b * lengths / avgdl)).astype(np.float32)
+        idf = np.log1p((self.n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        term_starts = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(df, out=term_starts[1:])
+        term_of = np.repeat(np.arange(n_terms), df)
+        position = np.arange(n_postings) - term_starts[:-1][term_of]
+        term_blocks = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(
+            (df.astype(np.int64) + self.block_size - 1) // self.block_size,
+            out=term_blocks[1:],
+        )
+        block_starts = np.flatnonzero(position % self.block_size == 0)
+        block_counts = np.diff(np.append(block_starts, n_postings))
+
+        # gaps to the previous document of the term, the first document as is
+        gaps = docs.astype(np.int64)
+        gaps[1:] -= np.where(position[1:] > 0, docs[:-1], 0)
+        scores = idf[term_of] * tfs / (tfs + norms[docs])
+        if n_postings:
+            block_last = docs[block_starts + block_counts - 1]
+            # rounded up, bounds must not be below the scores they bound
+            block_max = np.nextafter(
+                np.maximum.reduceat(scores, block_starts).astype(np.float32),
+                np.float32(np.inf),
+            )
+        else:
+            block_last = np.zeros(0, dtype=np.uint32)
+            block_max = np.zeros(0, dtype=np.float32)
+        term_max = np.zeros(n_terms, dtype=np.float32)
+        used = np.flatnonzero(df)
+        if len(used):
+            term_max[used] = np.maximum.reduceat(block_max, term_blocks[used])
+
+        # each block holds its gaps, then its frequencies
+        start_of = np.repeat(block_starts, block_counts)
+        values = np.empty(2 * n_postings, dtype=np.uint64)
+        index = np.arange(n_postings)
+        values[start_of + index] = gaps
+        values[start_of + np.repeat(block_counts, block_counts) + index] = tfs
+        del scores, position, start_of, index, gaps
+        postings, nbytes = encode_varints(values)
+        value_offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(nbytes, out=value_offsets[1:])
+        block_offsets = value_offsets[np.append(2 * block_starts, len(values))]
+
+        arrays = {
+            "df": df,
+            "idf": idf,
+            "term_max": term_max,
+            "term_blocks": term_blocks.astype(np.uint64),
+            "block_last": block_last.astype(np.uint32),
+            "block_max": block_max,
+            "block_offsets": block_offsets.astype(np.uint64),
+            "postings": postings,
+            "norms": norms,
+        }
+        for name in _ARRAYS:
+            np.save(os.path.join(self._tmp, f"{field}.{name}.npy"), arrays[name])
+
+    def close(self) -> None:
+        """Write the index and move it to path."""
+        self._file.close()
+        np.save(
+            os.path.join(self._tmp, "docs.npy"),
+            np.frombuffer(self._offsets, dtype=np.uint64),
+        )
+        for field in self.fields:
+            self._write_field(field)
+        with open(os.path.join(self._tmp, "terms.json"), "w") as f:
+            json.dump(list(self._vocabulary), f, ensure_ascii=False)
+        meta = {
+            "fields": self.fields,
+            "n_docs": self.n_docs,
+            "k1": self.k1,
+            "b": self.b,
+            "block_size": self.block_size,
+        }
+        with open(os.path.join(self._tmp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        if os.path.exists(self.path):
+            # files of the old index stay readable by processes that mapped them
+            shutil.rmtree(self.path)
+        os.replace(self._tmp, self.path)
+
+
+class BM25Index:
+    """
+    Memory-mapped BM25 index written by BM25IndexWriter.
+
+    search() scores query terms one at a time, highest bound first, into a
+    dense array of scores (MaxScore): once the k-th best score reaches the
+    highest score the remaining terms could add, documents that did not match
+    yet cannot enter the top k, and the remaining terms only decode the blocks
+    that hold candidates whose score could still reach the top k.
+    """
+
+    def __init__(self, path: str) -> None:
+        """:param path: index directory."""
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.fields = meta["fields"]
+        self.n_docs = meta["n_docs"]
+        self.block_size = meta["block_size"]
+        with open(os.path.join(path, "terms.json")) as f:
+            self._vocabulary = {term: i for i, term in enumerate(json.load(f))}
+        self._fields = {
+            field: {
+                name: np.load(os.path.join(path, f"{field}.{name}.npy"), mmap_mode="r")
+                for name in _ARRAYS
+            }
+            for field in self.fields
+        }
+        self._offsets = np.load(os.path.join(path, "docs.npy"), mmap_mode="r")
+        self._docs = (
+            np.memmap(os.path.join(path, "docs.jsonl"), dtype=np.uint8, mode="r")
+            if self._offsets[-1]
+            else b""
+        )
+
+    def __repr__(self) -> str:
+        return f"BM25Index({self.path!r})"
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def document(self, doc: int) -> tuple[str, str, dict]:
+        """:return: id, text and metadata of the document at position doc."""
+        start, stop = int(self._offsets[doc]), int(self._offsets[doc + 1])
+        return tuple(json.loads(bytes(self._docs[start:stop])))
+
+    def _postings(self, arrays: dict, term: int) -> tuple[np.ndarray, np.ndarray]:
+        """:return: documents and frequencies of all postings of term."""
+        first = int(arrays["term_blocks"][term])
+        last = int(arrays["term_blocks"][term + 1])
+        offsets = arrays["block_offsets"]
+        values = decode_varints(arrays["postings"][offsets[first] : offsets[last]])
+        full = (last - first - 1) * self.block_size
+        blocks = values[: 2 * full].reshape(-1, 2, self.block_size)
+        tail = values[2 * full :].reshape(2, -1)
+        docs = np.cumsum(np.concatenate([blocks[:, 0].ravel(), tail[0]]))
+        tfs = np.concatenate([blocks[:, 1].ravel(), tail[1]])
+        return docs, tfs
+
+    def _blocks(
+        self, arrays: dict, term: int, blocks: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """:return: documents and frequencies of some posting blocks of term, in order."""
+        first = int(arrays["term_blocks"][term])
+        last = int(arrays["term_blocks"][term + 1])
+        counts = np.full(len(blocks), self.block_size, dtype=np.int64)
+        counts[blocks == last - 1] = int(arrays["df"][term]) - self.block_size * (
+            last - 1 - first
+        )
+        starts = arrays["block_offsets"][blocks].astype(np.int64)
+        sizes = arrays["block_offsets"][blocks + 1].astype(np.int64) - starts
+        data = arrays["postings"][_ranges(starts, sizes)]
+        values = decode_varints(data)
+        # each block holds its gaps, then its frequencies
+        value_starts = np.repeat(np.cumsum(2 * counts) - 2 * counts, counts)
+        within = _ranges(np.zeros(len(counts), dtype=np.int64), counts)
+        gaps = values[value_starts + within]
+        tfs = values[value_starts + np.repeat(counts, counts) + within]
+        bases = np.where(
+            blocks > first, arrays["block_last"][np.maximum(blocks - 1, 0)], 0
+        )
+        # cumulative sums restarted at each block, from the last document of the previous one
+        sums = np.cumsum(gaps)
+        before = sums[np.cumsum(counts) - counts] - gaps[np.cumsum(counts) - counts]
+        docs = sums - np.repeat(before - bases.astype(np.int64), counts)
+        return docs, tfs
+
+    def _term_scores(
+        self, arrays: dict, term: int, docs: np.ndarray, tfs: np.ndarray
+    ) -> np.ndarray:
+        return arrays["idf"][term] * tfs / (tfs + arrays["norms"][docs])
+
+    def _rescore(
+        self,
+        arrays: dict,
+        term: int,
+        weight: float,
+        candidates: np.ndarray,
+        scores: np.ndarray,
+        threshold: float,
+        remaining: float,
+    ) -> np.ndarray:
+        """Add the scores of term to the candidates, return those that can still reach threshold."""
+        first = int(arrays["term_blocks"][term])
+        last = int(arrays["term_blocks"][term + 1])
+        blocks = np.searchsorted(arrays["block_last"][first:last], candidates)
+        inside = blocks < last - first
+        bound = scores[candidates] + remaining
+        bound[inside] += weight * arrays["block_max"][first + blocks[inside]]
+        keep = bound >= threshold
+        candidates, blocks, inside = candidates[keep], blocks[keep], inside[keep]
+        needed = np.unique(blocks[inside])
+        if not len(needed):
+            return candidates
+        if 2 * len(needed) > last - first:
+            docs, tfs = self._postings(arrays, term)
+        else:
+            docs, tfs = self._blocks(arrays, term, first + needed)
+        found = np.minimum(np.searchsorted(docs, candidates), len(docs) - 1)
+        hit = docs[found] == candidates
+        matched = candidates[hit]
+        scores[matched] += weight * self._term_scores(
+            arrays, term, matched, tfs[found[hit]]
+        )
+        return candidates
+
+    def search(
+        self, query: str, k: int = 10, fields: Dict[str, float] | None = None
+    ) -> list[tuple[int, float]]:
+        """
+        :param fields: {field: boost} to match the query against, all fields with boost 1 if None.
+        :return: (document position, score) of the top k documents, best first.
+        """
+        if fields is None:
+            fields = {field: 1.0 for field in self.fields}
+        counts = Counter(analyze(query))
+        clauses = []
+        for field, boost in fields.items():
+            if field not in self._fields:
+                raise ValueError(
+                    f"field {field!r} is not indexed, indexed fields: {self.fields}"
+                )
+            arrays = self._fields[field]
+            for term, count in counts.items():
+                term_id = self._vocabulary.get(term)
+                if term_id is None or arrays["df"][term_id] == 0:
+                    continue
+                weight = boost * count
+                clauses.append(
+                    (
+                        weight * float(arrays["term_max"][term_id]),
+                        weight,
+                        arrays,
+                        term_id,
+                    )
+                )
+        if not clauses or k <= 0:
+            return []
+        clauses.sort(key=lambda clause: -clause[0])
+        # highest score that the clauses after each clause can add
+        remaining = np.append(
+            np.cumsum([clause[0] for clause in clauses][::-1])[::-1][1:], 0.0
+        )
+
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        matched = np.zeros(0, dtype=np.int64)
+        candidates = None
+        for (_, weight, arrays, term), rest in zip(clauses, remaining):
+            if candidates is None:
+                docs, tfs = self._postings(arrays, term)
+                scores[docs] += weight * self._term_scores(arrays, term, docs, tfs)
+                matched = np.union1d(matched, docs)
+                if len(matched) >= k:
+                    threshold = _kth_largest(scores[matched], k)
+                    if threshold >= rest:
+                        # documents that did not match yet cannot reach the top k
+                        candidates = matched[scores[matched] + rest >= threshold]
+            else:
+                candidates = self._rescore(
+                    arrays, term, weight, candidates, scores, threshold, rest
+                )
+                threshold = _kth_largest(scores[candidates], k)
+        if candidates is None:
+            candidates = matched
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [(int(doc), float(scores[doc])) for doc in candidates]
+
+
+class BM25IndexRetriever(BaseRetriever):
+    """
+    ESQueryRetriever over a BM25Index instead of Elasticsearch.
+
+    The query is matched against query_field, or against the fields of
+    fields with their boosts, e.g. {"metadata.title": 2.0, "text": 1.0}.
+    metadata_fields, id_key and score_key work as in ESQueryRetriever; the
+    _id of a document is the id it was indexed with.
+    """
+
+    index: BM25Index
+    k: int = 4
+    query_field: str = "metadata.title"
+    fields: Optional[Dict[str, float]] = None
+    metadata_fields: Optional[List[str]] = None
+    id_key: Optional[str] = None
+    score_key: Optional[str] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _doc2document(self, doc: int, score: float) -> Document:
+        doc_id, page_content, metadata = self.index.document(doc)
+        if self.metadata_fields is not None:
+            metadata = {
+                field: metadata[field]
+                for field in self.metadata_fields
+                if field in metadata
+            }
+        if self.id_key:
+            metadata[self.id_key] = doc_id
+        if self.score_key:
+            metadata[self.score_key] = score
+        return Document(page_content=page_content, metadata=metadata)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        fields = self.fields if self.fields else {self.query_field: 1.0}
+        results = self.index.search(query, k=self.k, fields=fields)
+        return [self._doc2document(doc, score) for doc, score in results]
+
+    def batch_retrieve(self, queries: List[str]) -> List[List[Document]]:
+        """:return: the documents of each query, in the order of queries."""
+        return [self.invoke(query) for query in queries]
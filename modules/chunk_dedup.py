@@ -0,0 +1,207 @@
+"""
+Exact and near-duplicate chunk elimination, applied by Database between
+splitting and embedding.
+
+Exact duplicates are found by hashing the normalized text. Near duplicates
+(boilerplate with small edits, preprint vs published abstracts) are found with
+MinHash signatures bucketed by locality-sensitive hashing, then confirmed by
+their estimated Jaccard similarity.
+"""
+
+
+from collections.abc import Iterable
+from langchain_core.documents import Document
+import hashlib
+import numpy as np
+import re
+import zlib
+
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD = re.compile(r"\w+")
+
+
+def _lsh_params(threshold: float, num_perm: int) -> tuple[int, int]:
+    """Pick (bands, rows) with bands * rows <= num_perm whose S-curve midpoint is closest to threshold."""
+    best = (num_perm, 1)
+    best_error = float("inf")
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class ChunkDeduplicator:
+    """
+    Drop chunks whose text duplicates, exactly or nearly, a chunk seen before.
+
+    The first occurrence survives. Dropped chunks are recorded in the
+    survivor's metadata under alias_key, as a copy of their own metadata plus
+    "duplicate": "exact" or "near", and always in self.aliases. The survivor's
+    metadata dict is updated in place, so callers that hand kept chunks to
+    other threads must give them a copy first; aliases found after that only
+    reach self.aliases.
+
+    When stored chunks are deleted, e.g. because their file changed, pass
+    their ids to forget(), so that their text is no longer a duplicate.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        num_perm: int = 128,
+        shingle_size: int = 5,
+        near: bool = True,
+        alias_key: str = "aliases",
+        id_key: str = "chunk_id",
+        seed: int = 1,
+    ) -> None:
+        """
+        :param threshold: minimum estimated Jaccard similarity of word shingles for a near duplicate.
+        :param num_perm: number of MinHash permutations.
+        :param shingle_size: number of words per shingle.
+        :param near: if False, only exact duplicates are dropped.
+        :param alias_key: metadata key the aliases of a surviving chunk are stored under.
+        :param id_key: metadata key of the chunk ids passed to forget().
+        :param seed: seed of the MinHash permutations.
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.near = near
+        self.alias_key = alias_key
+        self.id_key = id_key
+        self.bands, self.rows = _lsh_params(threshold, num_perm)
+        # a < 2**31 and 32-bit shingle hashes keep a * x + b within uint64.
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+        self._exact: dict[bytes, int] = {}
+        self._buckets: list[dict[bytes, list[int]]] = [{} for _ in range(self.bands)]
+        self._signatures: list[np.ndarray] = []
+        self._survivors: list[dict | None] = []
+        # survivor index -> (exact digest, band keys), to unregister it in forget()
+        self._keys: list[tuple[bytes, list[bytes] | None]] = []
+        self._ids: dict[str, int] = {}
+        self.aliases: dict[int, list[dict]] = {}
+        self.n_exact = 0
+        self.n_near = 0
+
+    @staticmethod
+    def _normalize(text: str) -> list[str]:
+        return _WORD.findall(text.lower())
+
+    def _minhash(self, words: list[str]) -> np.ndarray:
+        k = min(self.shingle_size, len(words)) or 1
+        shingles = {
+            " ".join(words[i : i + k]) for i in range(max(len(words) - k + 1, 1))
+        }
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf8")) for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        permuted = (hashes[:, None] * self._a + self._b) % np.uint64(_MERSENNE_PRIME)
+        return (permuted & np.uint64(_MAX_HASH)).min(axis=0).astype(np.uint32)
+
+    def _alias(self, survivor: int, chunk: Document, kind: str) -> None:
+        alias = {k: v for k, v in chunk.metadata.items() if k != self.alias_key}
+        alias["duplicate"] = kind
+        self.aliases.setdefault(survivor, []).append(alias)
+        metadata = self._survivors[survivor]
+        metadata[self.alias_key] = metadata.get(self.alias_key, []) + [alias]
+        if kind == "exact":
+            self.n_exact += 1
+        else:
+            self.n_near += 1
+
+    def _find_near(self, signature: np.ndarray) -> tuple[int | None, list[bytes]]:
+        keys = [
+            signature[i * self.rows : (i + 1) * self.rows].tobytes()
+            for i in range(self.bands)
+        ]
+        seen = set()
+        for band, key in enumerate(keys):
+            for candidate in self._buckets[band].get(key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                similarity = np.mean(self._signatures[candidate] == signature)
+                if similarity >= self.threshold:
+                    return candidate, keys
+        return None, keys
+
+    def match(self, chunk: Document) -> dict | None:
+        """
+        Check a chunk against all survivors so far, and register it as a survivor if it is new.
+        Chunks without any word character, e.g. only punctuation, are never duplicates.
+        :return: metadata of the survivor the chunk duplicates, None if it is kept.
+        """
+        words = self._normalize(chunk.page_content)
+        if not words:
+            return None
+        digest = hashlib.sha1(" ".join(words).encode("utf8")).digest()
+        if digest in self._exact:
+            self._alias(self._exact[digest], chunk, "exact")
+            return self._survivors[self._exact[digest]]
+        keys = None
+        signature = None
+        if self.near:
+            signature = self._minhash(words)
+            survivor, keys = self._find_near(signature)
+            if survivor is not None:
+                self._alias(survivor, chunk, "near")
+                return self._survivors[survivor]
+        index = len(self._survivors)
+        # The splitter may share one metadata dict between chunks of a document.
+        chunk.metadata = dict(chunk.metadata)
+        self._survivors.append(chunk.metadata)
+        self._exact[digest] = index
+        self._keys.append((digest, keys))
+        if chunk.metadata.get(self.id_key) is not None:
+            self._ids[str(chunk.metadata[self.id_key])] = index
+        if signature is not None:
+            self._signatures.append(signature)
+            for band, key in enumerate(keys):
+                self._buckets[band].setdefault(key, []).append(index)
+        else:
+            self._signatures.append(np.zeros(self.num_perm, dtype=np.uint32))
+        return None
+
+    def forget(self, chunk_ids: Iterable[str]) -> None:
+        """
+        Unregister the survivors with these ids (metadata[id_key]), so chunks
+        with the same text are kept again. Their aliases are dropped from
+        self.aliases.
+        """
+        for chunk_id in chunk_ids:
+            index = self._ids.pop(str(chunk_id), None)
+            if index is None:
+                continue
+            digest, keys = self._keys[index]
+            if self._exact.get(digest) == index:
+                del self._exact[digest]
+            for band, key in enumerate(keys or ()):
+                bucket = self._buckets[band][key]
+                bucket.remove(index)
+                if not bucket:
+                    del self._buckets[band][key]
+            self._survivors[index] = None
+            self.aliases.pop(index, None)
+
+    def is_duplicate(self, chunk: Document) -> bool:
+        """Check a chunk against all survivors so far, and register it as a survivor if it is new."""
+        return self.match(chunk) is not None
+
+    def filter(self, chunks: Iterable[Document]) -> tuple[list[Document], list[Document]]:
+        """
+        Split chunks into kept and dropped ones.
+        :return: (kept, dropped)
+        """
+        kept, dropped = [], []
+        for chunk in chunks:
+            (dropped if self.is_duplicate(chunk) else kept).append(chunk)
+        return kept, dropped
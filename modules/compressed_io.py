@@ -0,0 +1,118 @@
+"""
+Transparent decompression of gzip, zstd and bz2 corpus files.
+
+The compression is detected from the magic bytes rather than the file name,
+and files are decompressed as a stream through a large read buffer, so
+parsers can read .jsonl.gz or .json.zst dumps without unpacking them to disk.
+"""
+
+
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from langchain_community.document_loaders.blob_loaders.file_system import (
+    FileSystemBlobLoader,
+)
+from langchain_community.document_loaders.blob_loaders.schema import Blob
+from pathlib import Path
+from typing import BinaryIO
+import bz2
+import gzip
+import io
+
+BUFFER_SIZE = 1 << 20
+
+MAGIC = {
+    b"\x1f\x8b": "gzip",
+    b"\x28\xb5\x2f\xfd": "zstd",
+    b"BZh": "bz2",
+}
+
+COMPRESSED_SUFFIXES = (".gz", ".zst", ".bz2")
+
+
+def detect_compression(head: bytes) -> str | None:
+    """:return: "gzip", "zstd", "bz2" or None, from the first bytes of a file."""
+    for magic, kind in MAGIC.items():
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def blob_compression(blob: Blob) -> str | None:
+    with blob.as_bytes_io() as f:
+        return detect_compression(f.read(4))
+
+
+def _decompress(f: BinaryIO, kind: str, buffer_size: int) -> BinaryIO:
+    if kind == "gzip":
+        raw = gzip.GzipFile(fileobj=f)
+    elif kind == "bz2":
+        raw = bz2.BZ2File(f)
+    else:
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError(
+                "reading zstd files requires zstandard, `pip install zstandard`"
+            ) from e
+        raw = zstandard.ZstdDecompressor().stream_reader(f, read_size=buffer_size)
+    return io.BufferedReader(raw, buffer_size)
+
+
+@contextmanager
+def open_blob(blob: Blob, buffer_size: int = BUFFER_SIZE) -> Iterator[BinaryIO]:
+    """
+    Open a blob for binary reading, decompressing it if it is gzip, zstd or bz2.
+    :param buffer_size: read buffer of the file and of the decompressed stream.
+    """
+    if blob.data is None and blob.path:
+        f = open(blob.path, "rb", buffering=buffer_size)
+    else:
+        f = io.BytesIO(blob.as_bytes())
+    try:
+        kind = detect_compression(f.read(4))
+        f.seek(0)
+        if kind is None:
+            yield f
+        else:
+            with _decompress(f, kind, buffer_size) as stream:
+                yield stream
+    finally:
+        f.close()
+
+
+def _plain_suffix(path: Path) -> str:
+    """Suffix of path without its compression suffix, e.g. ".jsonl" for a.jsonl.gz."""
+    if path.suffix in COMPRESSED_SUFFIXES:
+        return Path(path.stem).suffix
+    return path.suffix
+
+
+class CompressedFileSystemBlobLoader(FileSystemBlobLoader):
+    """
+    FileSystemBlobLoader that also matches the compressed variants of its
+    glob, e.g. "**/*.json" also yields a.json.gz, b.json.zst and c.json.bz2,
+    and applies suffixes to the file name without its compression suffix.
+    """
+
+    def _yield_paths(self) -> Iterable[Path]:
+        if self.path.is_file():
+            yield self.path
+            return
+
+        globs = [self.glob]
+        if not self.glob.endswith(COMPRESSED_SUFFIXES):
+            globs += [self.glob + suffix for suffix in COMPRESSED_SUFFIXES]
+        seen = set()
+        for glob in globs:
+            for path in self.path.glob(glob):
+                if path in seen:
+                    continue
+                seen.add(path)
+                if self.exclude:
+                    if any(path.match(pattern) for pattern in self.exclude):
+                        continue
+                if path.is_file():
+                    if self.suffixes and _plain_suffix(path) not in self.suffixes:
+                        continue
+                    yield path
@@ -0,0 +1,147 @@
+"""
+CPU embedding engine for nodes without a GPU.
+
+Texts are sorted by token length and cut into buckets, so each batch is padded
+only to the length of its own longest text, and the forward passes of the
+buckets run on a thread pool sized to the available cores. Linear layers can
+optionally be dynamically quantized to int8.
+
+The HF fast tokenizer can't be used by two threads at once ("Already
+borrowed"), so tokenization is serialized by a lock in the calling thread and
+only the forward passes, which release the GIL, run concurrently.
+"""
+
+
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+import os
+import threading
+
+DEFAULT_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+
+
+class CPUEmbeddings(Embeddings):
+    """
+    sentence-transformers model running on CPU with length-bucketed dynamic batching.
+    Drop-in for the embeddings argument of Database and ElasticsearchStore, and
+    produces the same vectors as HuggingFaceEmbeddings with the same model,
+    up to int8 rounding if quantize is set.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL_NAME,
+        batch_size: int = 32,
+        max_batch_tokens: int = 8192,
+        num_workers: int | None = None,
+        quantize: bool = False,
+        normalize_embeddings: bool = False,
+        num_threads: int | None = None,
+    ) -> None:
+        """
+        :param model_name: sentence-transformers model name or path.
+        :param batch_size: maximum number of texts per batch.
+        :param max_batch_tokens: maximum of batch length * longest text in tokens, i.e. padded tokens per batch.
+        :param num_workers: number of batches encoded concurrently, defaults to one per 4 cores.
+        :param quantize: dynamically quantize Linear layers to int8.
+        :param normalize_embeddings: L2-normalize the returned vectors.
+        :param num_threads: torch intra-op threads, left unchanged if None.
+            torch.set_num_threads is process-wide, cores // num_workers shares the cores between workers.
+        """
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "CPUEmbeddings requires torch and sentence_transformers, "
+                "`pip install sentence-transformers`"
+            ) from e
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.normalize_embeddings = normalize_embeddings
+        self.quantize = quantize
+        cores = (
+            len(os.sched_getaffinity(0))
+            if hasattr(os, "sched_getaffinity")
+            else os.cpu_count() or 1
+        )
+        self.num_workers = num_workers if num_workers else max(1, cores // 4)
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self._torch = torch
+        self.model = SentenceTransformer(model_name, device="cpu").eval()
+        if quantize:
+            self.model = torch.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.tokenizer = self.model.tokenizer
+        self.max_seq_length = self.model.max_seq_length
+        self._tokenizer_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.num_workers)
+
+    def _token_lengths(self, texts: list[str]) -> list[int]:
+        with self._tokenizer_lock:
+            encoded = self.tokenizer(
+                texts,
+                add_special_tokens=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_attention_mask=False,
+                return_token_type_ids=False,
+            )
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def _buckets(self, texts: list[str]) -> list[list[int]]:
+        """Group text indices into batches of similar length under both batch budgets."""
+        lengths = self._token_lengths(texts)
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
+        buckets: list[list[int]] = []
+        bucket: list[int] = []
+        for i in order:
+            # order is ascending, so lengths[i] is the padded length of bucket + [i]
+            if bucket and (
+                len(bucket) >= self.batch_size
+                or (len(bucket) + 1) * lengths[i] > self.max_batch_tokens
+            ):
+                buckets.append(bucket)
+                bucket = []
+            bucket.append(i)
+        if bucket:
+            buckets.append(bucket)
+        return buckets
+
+    def _tokenize(self, texts: list[str]) -> dict:
+        # tokenize was renamed preprocess in sentence-transformers 5
+        tokenize = getattr(self.model, "preprocess", None) or self.model.tokenize
+        with self._tokenizer_lock:
+            return tokenize(texts)
+
+    def _forward(self, features: dict) -> list[list[float]]:
+        """The forward pass of SentenceTransformer.encode, on tokenized texts."""
+        with self._torch.no_grad():
+            embeddings = self.model.forward(features)["sentence_embedding"]
+            if self.normalize_embeddings:
+                embeddings = self._torch.nn.functional.normalize(embeddings, p=2, dim=1)
+        return embeddings.cpu().float().numpy().tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        texts = [text.replace("\n", " ") for text in texts]
+        buckets = self._buckets(texts)
+        results: list[list[float]] = [None] * len(texts)
+        features = [self._tokenize([texts[i] for i in bucket]) for bucket in buckets]
+        encoded = self._pool.map(self._forward, features)
+        for bucket, vectors in zip(buckets, encoded):
+            for i, vector in zip(bucket, vectors):
+                results[i] = vector
+        return results
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._forward(self._tokenize([text.replace("\n", " ")]))[0]
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embed many queries in batches, same vectors as embed_query()."""
+        return self.embed_documents(texts)
@@ -4,7 +4,7 @@ langchain_community.vectorstores.elasticsearch is deprecated since langchain-com
 """
 
 
-from collections.abc import Iterable, Iterator
+from collections.abc import Callable, Iterable, Iterator
 from elasticsearch import Elasticsearch
 from langchain_community.document_loaders.blob_loaders import BlobLoader
 from langchain_community.document_loaders.blob_loaders.file_system import (
@@ -17,9 +17,39 @@ from langchain_community.vectorstores import VectorStore
 from langchain_community.vectorstores.elasticsearch import ElasticsearchStore
 from langchain_core.documents import Document
 from langchain_core.tools import Tool
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.tools.retriever import create_retriever_tool
 from tqdm import tqdm
+from .chunk_dedup import ChunkDeduplicator
+from .compressed_io import CompressedFileSystemBlobLoader
+from .cpu_embeddings import CPUEmbeddings
+from .es_bulk_writer import ESBulkWriter
+from .ingest_manifest import IngestManifest
+from .ingest_pipeline import IngestPipeline, split_blob
+from .offset_splitter import OffsetTextSplitter
+from .shared_metadata import SharedMetadata, SharedMetadataRetriever
+import contextlib
+import time
+
+
+def _approx_tokens(text: str) -> int:
+    """Cheap token estimate used for batch budgets, one token per whitespace-separated word."""
+    return len(text.split())
+
+
+def _default_embeddings():
+    import torch
+
+    if torch.cuda.is_available():
+        return HuggingFaceEmbeddings(model_kwargs={"device": "cuda"})
+    return CPUEmbeddings()
+
+
+def _throughput(stats: dict, start: float) -> dict[str, float]:
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    return {
+        "documents_per_sec": stats["documents"] / elapsed,
+        "chunks_per_sec": stats["chunks"] / elapsed,
+    }
 
 
 class Database:
@@ -32,20 +62,21 @@ class Database:
         embeddings=None,
         vectorstore: VectorStore | None = None,
         retriever=None,
+        length_function: Callable[[str], int] | None = None,
+        manifest: IngestManifest | None = None,
+        deduplicator: ChunkDeduplicator | None = None,
+        indexer: ESBulkWriter | None = None,
+        metadata_store: SharedMetadata | None = None,
     ) -> None:
         self.path = path
         self.blob_loader = (
-            blob_loader if blob_loader else FileSystemBlobLoader(path=path)
+            blob_loader if blob_loader else CompressedFileSystemBlobLoader(path=path)
         )
         self.blob_parser = blob_parser if blob_parser else TextParser()
         self.text_splitter = (
-            text_splitter if text_splitter else RecursiveCharacterTextSplitter()
-        )
-        self.embeddings = (
-            embeddings
-            if embeddings
-            else HuggingFaceEmbeddings(model_kwargs={"device": "cuda"})
+            text_splitter if text_splitter else OffsetTextSplitter()
         )
+        self.embeddings = embeddings if embeddings else _default_embeddings()
         if vectorstore:
             self.vectorstore = vectorstore
         else:
@@ -56,38 +87,287 @@ class Database:
                 es_connection=es_connection,
             )
         self.retriever = retriever if retriever else self.vectorstore.as_retriever()
+        if metadata_store:
+            # chunks are stored with compacted metadata, expand it for consumers
+            self.retriever = SharedMetadataRetriever(
+                retriever=self.retriever,
+                metadata_store=metadata_store,
+                name=self.retriever.name,
+            )
+        self.length_function = length_function if length_function else _approx_tokens
+        self.manifest = manifest
+        self.deduplicator = deduplicator
+        self.indexer = indexer
+        self.metadata_store = metadata_store
+        if self.indexer and self.manifest:
+            self.indexer.on_written = self.manifest.written
+        if self.deduplicator and self.manifest:
+            self.deduplicator.id_key = self.manifest.chunk_id_key
 
     def _file2blobs(self) -> Iterator[Blob]:
         for blob in self.blob_loader.yield_blobs():
             yield blob
 
+    def _changed_blobs(self, blobs: Iterable[Blob]) -> Iterator[Blob]:
+        """
+        Filter blobs through self.manifest: skip unchanged files, delete the old
+        chunks of changed files, and delete the chunks of files under self.path
+        that no longer exist. Files skipped earlier whose duplicates pointed to
+        deleted chunks are then read again and yielded too.
+        """
+        seen = []
+        for blob in blobs:
+            seen.append(str(blob.path))
+            if self._check_blob(blob):
+                yield blob
+        stale = self.manifest.prune(seen, prefix=self.path)
+        if stale:
+            self._delete_chunks(stale)
+        while requeued := self.manifest.requeued(seen):
+            for blob in self._file2blobs():
+                if str(blob.path) in requeued and self._check_blob(blob):
+                    yield blob
+
+    def _check_blob(self, blob: Blob) -> bool:
+        """Check blob against self.manifest and delete its old chunks if it must be ingested."""
+        stale = self.manifest.check(blob.path)
+        if stale is None:
+            return False
+        if stale:
+            self._delete_chunks(stale)
+        return True
+
+    def _delete_chunks(self, chunk_ids: list[str]) -> None:
+        """Delete stored chunks, and forget them in self.deduplicator so their text is kept again."""
+        self.vectorstore.delete(chunk_ids)
+        if self.deduplicator:
+            self.deduplicator.forget(chunk_ids)
+
+    def _track_chunks(
+        self, blob: Blob, chunks: list[Document], finished: bool = False
+    ) -> None:
+        """Record chunks of blob in self.manifest before they are written."""
+        if self.manifest:
+            self.manifest.expect(blob.path, chunks)
+            if finished:
+                self.manifest.finish(blob.path)
+
     def _blob2document(self, blob: Blob) -> Iterator[Document]:
         yield from self.blob_parser.lazy_parse(blob)
 
     def _documents2chunks(self, documents: Iterable[Document]) -> list[Document]:
         return self.text_splitter.split_documents(documents)
 
+    def _blob2chunks(self, blob: Blob) -> Iterator[tuple[int, list[Document]]]:
+        """Yield (number of documents, chunks) per document or record batch."""
+        if (
+            type(self)._blob2document is Database._blob2document
+            and type(self)._documents2chunks is Database._documents2chunks
+        ):
+            yield from split_blob(self.blob_parser, self.text_splitter, blob)
+            return
+        # a subclass parses or splits documents its own way
+        for document in self._blob2document(blob):
+            yield 1, self._documents2chunks([document])
+
+    def _dedup_chunks(self, chunks: list[Document]) -> list[Document]:
+        """
+        Drop duplicate chunks with self.deduplicator before they are embedded.
+        Kept chunks get a copy of their metadata, which the deduplicator keeps
+        adding aliases to while they are embedded and written on other threads.
+        """
+        if not self.deduplicator:
+            return chunks
+        kept, dropped, survivors = [], [], []
+        for chunk in chunks:
+            survivor = self.deduplicator.match(chunk)
+            if survivor is None:
+                kept.append(chunk)
+            else:
+                dropped.append(chunk)
+                survivors.append(survivor)
+        if self.manifest and dropped:
+            key = self.manifest.chunk_id_key
+            self.manifest.discard(
+                self._chunk_ids(dropped), [survivor.get(key) for survivor in survivors]
+            )
+        for chunk in kept:
+            chunk.metadata = dict(chunk.metadata)
+        return kept
+
     def _chunks2embeddings(self, chunks: Iterable[Document]) -> list[list[float]]:
         """Use _chunks2store() instead if possible. This method gets metadata lost."""
         return self.embeddings.embed_documents(
             list(map(lambda x: x.page_content, chunks))
         )
 
+    def _chunk_ids(self, chunks: list[Document]) -> list[str] | None:
+        if not self.manifest:
+            return None
+        return [chunk.metadata[self.manifest.chunk_id_key] for chunk in chunks]
+
     def _chunks2store(self, chunks: list[Document]) -> None:
-        self.vectorstore.add_documents(chunks)
+        if self.indexer:
+            self._batch2store(chunks)
+        elif self.manifest:
+            self.vectorstore.add_documents(chunks, ids=self._chunk_ids(chunks))
+            self.manifest.written(self._chunk_ids(chunks))
+        else:
+            self.vectorstore.add_documents(chunks)
+
+    def _chunks2batches(
+        self,
+        chunks: Iterable[Document],
+        batch_size: int | None = None,
+        batch_tokens: int | None = None,
+    ) -> Iterator[list[Document]]:
+        """
+        Group chunks, possibly from different documents, into batches.
+        A batch is closed as soon as adding the next chunk would exceed
+        batch_size chunks or batch_tokens tokens. A single chunk larger than
+        batch_tokens still makes up a batch of its own.
+        """
+        batch: list[Document] = []
+        tokens = 0
+        for chunk in chunks:
+            chunk_tokens = self.length_function(chunk.page_content)
+            if batch and (
+                (batch_size and len(batch) >= batch_size)
+                or (batch_tokens and tokens + chunk_tokens > batch_tokens)
+            ):
+                yield batch
+                batch = []
+                tokens = 0
+            batch.append(chunk)
+            tokens += chunk_tokens
+        if batch:
+            yield batch
+
+    def _batch2embeddings(self, chunks: list[Document]) -> list[list[float]] | None:
+        """
+        Embed a batch of chunks with one embed_documents call. Returns None if
+        the vectorstore cannot take precomputed embeddings, in which case the
+        vectorstore embeds the chunks itself in _embeddings2store().
+        """
+        if not self.indexer and not hasattr(self.vectorstore, "add_embeddings"):
+            return None
+        embeddings = self.vectorstore.embeddings or self.embeddings
+        return embeddings.embed_documents([chunk.page_content for chunk in chunks])
+
+    def _embeddings2store(
+        self, chunks: list[Document], vectors: list[list[float]] | None
+    ) -> None:
+        """Write a batch of chunks and their embeddings with one bulk request."""
+        if vectors is None:
+            self._chunks2store(chunks)
+            return
+        if self.indexer:
+            # the manifest is told by indexer.on_written once the bulk requests succeed
+            self.indexer.write(
+                [chunk.page_content for chunk in chunks],
+                vectors,
+                [chunk.metadata for chunk in chunks],
+                self._chunk_ids(chunks),
+            )
+            return
+        self.vectorstore.add_embeddings(
+            list(zip([chunk.page_content for chunk in chunks], vectors)),
+            metadatas=[chunk.metadata for chunk in chunks],
+            ids=self._chunk_ids(chunks),
+            bulk_kwargs={"chunk_size": len(chunks)},
+        )
+        if self.manifest:
+            self.manifest.written(self._chunk_ids(chunks))
+
+    def _batch2store(self, chunks: list[Document]) -> None:
+        self._embeddings2store(chunks, self._batch2embeddings(chunks))
+
+    def _blobs2chunks(self, blobs: Iterable[Blob], stats: dict) -> Iterator[Document]:
+        for blob in blobs:
+            for n_documents, chunks in self._blob2chunks(blob):
+                self._track_chunks(blob, chunks)
+                stats["documents"] += n_documents
+                yield from self._dedup_chunks(chunks)
+            self._track_chunks(blob, [], finished=True)
+
+    def store(
+        self,
+        path: str = "",
+        batch_size: int | None = None,
+        batch_tokens: int | None = None,
+        workers: int = 0,
+    ) -> dict[str, float]:
+        """
+        Parse, split and store all files under path.
 
-    def store(self, path: str = "") -> None:
+        By default the chunks of every document are stored right after the
+        document is split. If batch_size or batch_tokens is given, chunks are
+        collected across documents until one of the budgets is reached, then
+        embedded with a single call and written with a single bulk request.
+        With workers, parsing and splitting run in a process pool while
+        embedding and indexing run in their own stages, see IngestPipeline.
+        With self.manifest, only new and changed files are ingested, see
+        IngestManifest. With self.deduplicator, duplicate chunks are dropped
+        before embedding, see ChunkDeduplicator. With self.indexer, embedded
+        batches are written by a parallel, retrying ESBulkWriter with index
+        refresh disabled until the load is done, and its worker threads
+        shut down when store() returns.
+        :param path: directory or file to store, defaults to self.path
+        :param batch_size: maximum number of chunks per batch
+        :param batch_tokens: maximum number of tokens per batch, counted with self.length_function
+        :param workers: if > 0, run the staged multi-process IngestPipeline with this many parse/split processes
+        :return: dict of documents, chunks, seconds, documents_per_sec, chunks_per_sec and, with a deduplicator, duplicates
+        """
         if path != "":
             # TODO better way to init blob_loader?
             self.path = path
-            self.blob_loader = FileSystemBlobLoader(path=path)
-        for blob in tqdm(self._file2blobs()):
-            for document in self._blob2document(blob):
-                chunks = self._documents2chunks([document])
-                self._chunks2store(chunks)
+            self.blob_loader = CompressedFileSystemBlobLoader(path=path)
+        stats = {"documents": 0, "chunks": 0}
+        start = time.perf_counter()
+        progress = tqdm(self._file2blobs(), unit="file")
+        blobs = self._changed_blobs(progress) if self.manifest else progress
+        with self.indexer if self.indexer else contextlib.nullcontext():
+            if workers > 0:
+                pipeline = IngestPipeline(
+                    self,
+                    workers=workers,
+                    batch_size=batch_size if batch_size or batch_tokens else 256,
+                    batch_tokens=batch_tokens,
+                )
+                stats = pipeline.run(
+                    blobs,
+                    on_batch=lambda s: progress.set_postfix(
+                        _throughput(s, start), refresh=False
+                    ),
+                )
+            elif batch_size or batch_tokens:
+                chunks = self._blobs2chunks(blobs, stats)
+                for batch in self._chunks2batches(chunks, batch_size, batch_tokens):
+                    self._batch2store(batch)
+                    stats["chunks"] += len(batch)
+                    progress.set_postfix(_throughput(stats, start), refresh=False)
+            else:
+                for blob in blobs:
+                    for n_documents, chunks in self._blob2chunks(blob):
+                        self._track_chunks(blob, chunks)
+                        chunks = self._dedup_chunks(chunks)
+                        if chunks:
+                            self._chunks2store(chunks)
+                        stats["documents"] += n_documents
+                        stats["chunks"] += len(chunks)
+                    self._track_chunks(blob, [], finished=True)
+                    progress.set_postfix(_throughput(stats, start), refresh=False)
+        if self.deduplicator:
+            stats["duplicates"] = self.deduplicator.n_exact + self.deduplicator.n_near
+        stats["seconds"] = time.perf_counter() - start
+        stats.update(_throughput(stats, start))
+        return stats
 
     def retrieve(self, query: str) -> list[Document]:
-        return self.vectorstore.similarity_search(query)
+        documents = self.vectorstore.similarity_search(query)
+        if self.metadata_store:
+            documents = self.metadata_store.expand_documents(documents)
+        return documents
 
     def retriever_as_tool(self) -> Tool:
         return create_retriever_tool(
@@ -0,0 +1,191 @@
+"""
+Content-addressed, on-disk cache for embeddings.
+
+Vectors are keyed by (model name, sha256 of text), so re-indexing, index
+migrations and paragraphs repeated across papers only pay for the embedding
+once per model.
+"""
+
+
+from array import array
+from langchain_core.embeddings import Embeddings
+import hashlib
+import json
+import sqlite3
+import threading
+
+
+def _text_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf8")).digest()
+
+
+# attributes of common Embeddings classes that change the vectors of a model
+_OUTPUT_SETTINGS = (
+    "quantize",
+    "normalize_embeddings",
+    "encode_kwargs",
+    "query_encode_kwargs",
+    "dimensions",
+    "embed_instruction",
+    "query_instruction",
+)
+
+
+def _namespace(embeddings: Embeddings) -> str:
+    """model name of embeddings plus the settings of it that change its vectors."""
+    model_name = getattr(embeddings, "model_name", None) or getattr(
+        embeddings, "model", None
+    )
+    if not isinstance(model_name, str):
+        raise ValueError(
+            f"cannot find the model name of {type(embeddings).__name__}, "
+            "pass model_name to CachedEmbeddings"
+        )
+    settings = {
+        name: getattr(embeddings, name)
+        for name in _OUTPUT_SETTINGS
+        if getattr(embeddings, name, None)
+    }
+    if not settings:
+        return model_name
+    return f"{model_name}:{json.dumps(settings, sort_keys=True, default=str)}"
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wrap an Embeddings model with a SQLite-backed vector cache.
+
+    Lookups are batched, only misses are sent to the wrapped model, and the
+    cache can be capped to max_entries, evicting least recently used vectors.
+    Use the same instance for both Database and ElasticsearchStore:
+
+        embedding = CachedEmbeddings(HuggingFaceEmbeddings(), "./cache/embeddings.sqlite")
+        es_store = ElasticsearchStore(index_name=..., embedding=embedding, es_connection=es)
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        path: str,
+        model_name: str | None = None,
+        max_entries: int | None = None,
+        batch_size: int = 500,
+    ) -> None:
+        """
+        :param embeddings: the model whose vectors are cached.
+        :param path: sqlite file to keep vectors in, created if missing, may be shared by processes.
+        :param model_name: cache namespace, defaults to embeddings.model_name (or .model)
+            plus the settings of embeddings that change its vectors, such as
+            quantize, normalize_embeddings, encode_kwargs and dimensions.
+            Required if embeddings has no model name.
+        :param max_entries: maximum number of cached vectors, unlimited if None.
+        :param batch_size: number of keys per lookup query.
+        """
+        self.embeddings = embeddings
+        self.path = path
+        self.model_name = model_name or _namespace(embeddings)
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                used INTEGER NOT NULL,
+                PRIMARY KEY (model, hash)
+            );
+            CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings (used);
+            """
+        )
+        self._clock, self._count = self._conn.execute(
+            "SELECT COALESCE(MAX(used), 0), COUNT(*) FROM embeddings"
+        ).fetchone()
+
+    def _lookup(self, model: str, hashes: list[bytes]) -> dict[bytes, list[float]]:
+        found: dict[bytes, list[float]] = {}
+        for i in range(0, len(hashes), self.batch_size):
+            keys = hashes[i : i + self.batch_size]
+            rows = self._conn.execute(
+                "SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN "
+                f"({','.join('?' * len(keys))})",
+                (model, *keys),
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = array("f", blob).tolist()
+        if found:
+            self._clock += 1
+            self._conn.executemany(
+                "UPDATE embeddings SET used = ? WHERE model = ? AND hash = ?",
+                [(self._clock, model, key) for key in found],
+            )
+        return found
+
+    def _insert(self, model: str, items: list[tuple[bytes, list[float]]]) -> None:
+        self._clock += 1
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, hash, vector, used) "
+            "VALUES (?, ?, ?, ?)",
+            [
+                (model, key, array("f", vector).tobytes(), self._clock)
+                for key, vector in items
+            ],
+        )
+        self._count += len(items)
+        if self.max_entries is not None and self._count > self.max_entries:
+            # Other processes may share the file, so recount before evicting.
+            self._count = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()[0]
+            if self._count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM "
+                    "embeddings ORDER BY used LIMIT ?)",
+                    (self._count - self.max_entries,),
+                )
+                self._count = self.max_entries
+
+    def _embed(self, model: str, texts: list[str], embed_func) -> list[list[float]]:
+        hashes = [_text_hash(text) for text in texts]
+        with self._lock:
+            found = self._lookup(model, list(set(hashes)))
+            self._conn.commit()
+        missing: dict[bytes, str] = {}
+        for key, text in zip(hashes, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            vectors = embed_func(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            with self._lock:
+                self._insert(model, list(computed.items()))
+                self._conn.commit()
+            found.update(computed)
+        return [found[key] for key in hashes]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(self.model_name, texts, self.embeddings.embed_documents)
+
+    def _embed_queries(self, texts: list[str]) -> list[list[float]]:
+        embed_queries = getattr(self.embeddings, "embed_queries", None)
+        if embed_queries is not None:
+            return embed_queries(texts)
+        return [self.embeddings.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embed many queries, the misses with one embed_queries() call of the wrapped model if it has one."""
+        # Some models embed queries differently from documents, keep them apart.
+        return self._embed(f"{self.model_name}:query", texts, self._embed_queries)
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,265 @@
+"""
+Parallel, retrying bulk writer for Elasticsearch, used as the indexing stage
+of Database in place of ElasticsearchStore.add_documents().
+
+Documents are written in the ElasticsearchStore layout ({text_field,
+vector_field, "metadata"}), so the index stays searchable through
+ElasticsearchStore and ESQueryRetriever.
+"""
+
+
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from elasticsearch import ApiError, ConnectionError, ConnectionTimeout, Elasticsearch
+from elasticsearch.helpers import BulkIndexError
+import random
+import threading
+import time
+import uuid
+
+RETRY_STATUS = {429, 502, 503, 504}
+
+
+class ESBulkWriter:
+    """
+    Send bulk requests from several worker threads.
+
+    Use it as a context manager around a large load: on enter the index
+    refresh is disabled, on exit all pending requests are awaited, the
+    previous refresh_interval is restored, the index is refreshed once and the
+    worker threads are shut down (see close()).
+    Items rejected with 429 (or 502/503/504) are retried with exponential
+    backoff and jitter; items failing for other reasons are collected and
+    raised as a BulkIndexError when the writer is flushed.
+    """
+
+    def __init__(
+        self,
+        client: Elasticsearch,
+        index_name: str,
+        text_field: str = "text",
+        vector_field: str = "vector",
+        batch_size: int = 500,
+        workers: int = 4,
+        max_retries: int = 8,
+        initial_backoff: float = 0.5,
+        max_backoff: float = 60.0,
+        on_written: Callable[[list[str]], None] | None = None,
+        ensure_index: Callable[[int], None] | None = None,
+    ) -> None:
+        """
+        :param client: Elasticsearch client.
+        :param index_name: index to write to.
+        :param text_field: field the chunk text is stored in.
+        :param vector_field: field the embedding is stored in.
+        :param batch_size: number of documents per bulk request.
+        :param workers: number of bulk requests in flight.
+        :param max_retries: retries of a rejected item before it counts as failed.
+        :param initial_backoff: seconds before the first retry, doubled on every retry.
+        :param max_backoff: upper bound of the wait between retries.
+        :param on_written: called from a worker thread with the ids of each written batch.
+        :param ensure_index: called with the vector dimension before the first write.
+        """
+        self.client = client
+        self.index_name = index_name
+        self.text_field = text_field
+        self.vector_field = vector_field
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.on_written = on_written
+        self.ensure_index = ensure_index
+        self.written = 0
+        self.retried = 0
+        self.failed: list[dict] = []
+        self._executor: ThreadPoolExecutor | None = None
+        self._futures: set[Future] = set()
+        self._errors: list[BaseException] = []
+        # bounds the number of batches queued in the executor
+        self._slots = threading.Semaphore(2 * workers)
+        self._lock = threading.Lock()
+        self._refresh_interval = None
+        self._refresh_disabled = False
+        self._loading = False
+        self._index_ready = ensure_index is None
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, **kwargs) -> "ESBulkWriter":
+        """Build a writer for the index of an ElasticsearchStore."""
+        return cls(
+            vectorstore.client,
+            vectorstore.index_name,
+            text_field=vectorstore.query_field,
+            vector_field=vectorstore.vector_query_field,
+            ensure_index=lambda dims: vectorstore._create_index_if_not_exists(
+                index_name=vectorstore.index_name, dims_length=dims
+            ),
+            **kwargs,
+        )
+
+    def __enter__(self) -> "ESBulkWriter":
+        self._loading = True
+        self.begin_load()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            self.flush(raise_on_error=exc_type is None)
+        finally:
+            self._loading = False
+            try:
+                self.end_load()
+            finally:
+                self.close()
+
+    def begin_load(self) -> None:
+        """Disable refresh on the index, remembering the current interval."""
+        if not self.client.indices.exists(index=self.index_name):
+            return
+        settings = self.client.indices.get_settings(
+            index=self.index_name, name="index.refresh_interval"
+        )
+        self._refresh_interval = (
+            settings.get(self.index_name, {})
+            .get("settings", {})
+            .get("index", {})
+            .get("refresh_interval")
+        )
+        self.client.indices.put_settings(
+            index=self.index_name, settings={"index": {"refresh_interval": "-1"}}
+        )
+        self._refresh_disabled = True
+
+    def end_load(self) -> None:
+        """Restore the refresh interval and make the loaded documents searchable."""
+        if not self._refresh_disabled:
+            if self.client.indices.exists(index=self.index_name):
+                self.client.indices.refresh(index=self.index_name)
+            return
+        # None resets the setting to the index default
+        self.client.indices.put_settings(
+            index=self.index_name,
+            settings={"index": {"refresh_interval": self._refresh_interval}},
+        )
+        self._refresh_disabled = False
+        self.client.indices.refresh(index=self.index_name)
+
+    def write(
+        self,
+        texts: list[str],
+        vectors: list[list[float]],
+        metadatas: list[dict] | None = None,
+        ids: list[str] | None = None,
+    ) -> list[str]:
+        """
+        Queue documents for writing. Blocks while 2 * workers batches are queued.
+        :return: the document ids.
+        """
+        if not texts:
+            return []
+        if not self._index_ready:
+            self.ensure_index(len(vectors[0]))
+            self._index_ready = True
+            if self._loading and not self._refresh_disabled:
+                self.begin_load()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        metadatas = metadatas if metadatas else [{} for _ in texts]
+        ids = ids if ids else [str(uuid.uuid4()) for _ in texts]
+        for start in range(0, len(texts), self.batch_size):
+            stop = start + self.batch_size
+            actions = [
+                (
+                    doc_id,
+                    {
+                        self.text_field: text,
+                        self.vector_field: vector,
+                        "metadata": metadata,
+                    },
+                )
+                for doc_id, text, vector, metadata in zip(
+                    ids[start:stop],
+                    texts[start:stop],
+                    vectors[start:stop],
+                    metadatas[start:stop],
+                )
+            ]
+            self._slots.acquire()
+            future = self._executor.submit(self._send, actions)
+            with self._lock:
+                self._futures.add(future)
+            future.add_done_callback(self._done)
+        return ids
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._futures.discard(future)
+            if future.exception() is not None:
+                self._errors.append(future.exception())
+        self._slots.release()
+
+    def _backoff(self, attempt: int) -> None:
+        delay = min(self.max_backoff, self.initial_backoff * 2**attempt)
+        time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def _send(self, actions: list[tuple[str, dict]]) -> None:
+        attempt = 0
+        while actions:
+            operations = []
+            for doc_id, source in actions:
+                operations.append({"index": {"_index": self.index_name, "_id": doc_id}})
+                operations.append(source)
+            try:
+                response = self.client.bulk(operations=operations, refresh=False)
+            except (ConnectionError, ConnectionTimeout, ApiError) as e:
+                status = getattr(e, "status_code", None)
+                if isinstance(e, ApiError) and status not in RETRY_STATUS:
+                    raise
+                if attempt >= self.max_retries:
+                    raise
+                self._backoff(attempt)
+                attempt += 1
+                continue
+            retry, done = [], []
+            for action, item in zip(actions, response["items"]):
+                result = item["index"]
+                if 200 <= result.get("status", 500) < 300:
+                    done.append(action[0])
+                elif result.get("status") in RETRY_STATUS and attempt < self.max_retries:
+                    retry.append(action)
+                else:
+                    with self._lock:
+                        self.failed.append(item)
+            with self._lock:
+                self.written += len(done)
+                self.retried += len(retry)
+            if done and self.on_written:
+                self.on_written(done)
+            actions = retry
+            if actions:
+                self._backoff(attempt)
+                attempt += 1
+
+    def flush(self, raise_on_error: bool = True) -> None:
+        """Wait for all queued batches."""
+        with self._lock:
+            futures = set(self._futures)
+        wait(futures)
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if raise_on_error and errors:
+            raise errors[0]
+        if raise_on_error and self.failed:
+            failed, self.failed = self.failed, []
+            raise BulkIndexError(f"{len(failed)} document(s) failed to index.", failed)
+
+    def close(self) -> None:
+        """
+        Wait for all queued batches and shut down the worker threads.
+        The writer can still be used, a later write() starts new workers.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,251 @@
+"""
+Hybrid lexical + vector retrieval.
+
+HybridRetriever sends the query to several retrievers at once, typically
+ESQueryRetriever and ElasticsearchStore.as_retriever(), and fuses their
+rankings, so the latency is that of the slowest retriever instead of the sum:
+
+    HybridRetriever(
+        retrievers=[
+            ESQueryRetriever(index=..., id_key="chunk_id"),
+            es_store.as_retriever(),
+        ],
+        k=4,
+    )
+
+ESQueryRetriever(id_key="chunk_id") reports the ES _id as chunk_id, but the
+documents of es_store.as_retriever() only carry a chunk_id if one was written
+into their metadata (e.g. by IngestManifest); otherwise the same chunk found
+by both retrievers is only merged when their texts are identical.
+"""
+
+
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.pydantic_v1 import PrivateAttr
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStoreRetriever
+from typing import List, Literal, Optional
+import asyncio
+import threading
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[str]], weights: List[float], k: int = 60
+) -> dict[str, float]:
+    """:return: sum over rankings of weight / (k + rank) of every key, rank starting at 1."""
+    scores: dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+    return scores
+
+
+def weighted_score_fusion(
+    scores: List[List[float]], rankings: List[List[str]], weights: List[float]
+) -> dict[str, float]:
+    """:return: sum over rankings of weight * min-max normalized score of every key."""
+    fused: dict[str, float] = {}
+    for ranking, values, weight in zip(rankings, scores, weights):
+        if not values:
+            continue
+        low, high = min(values), max(values)
+        for key, value in zip(ranking, values):
+            normalized = (value - low) / (high - low) if high > low else 1.0
+            fused[key] = fused.get(key, 0.0) + weight * normalized
+    return fused
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Run retrievers concurrently and fuse their results.
+
+    Documents are identified by metadata[id_key] (e.g. the chunk_id assigned
+    by IngestManifest, or the _id added by ESQueryRetriever with id_key), or
+    by their text if it is missing, and each document appears once in the
+    result, as returned by the first retriever that found it.
+
+    fusion="rrf" ranks by reciprocal rank fusion; fusion="score" by the sum of
+    min-max normalized metadata[score_key] values, so every retriever must put
+    its scores there (see ESQueryRetriever.score_key). The exception are
+    similarity retrievers of vector stores (vectorstore.as_retriever()), which
+    report no scores: they are queried through
+    similarity_search_with_relevance_scores() instead, and the relevance score
+    is put into metadata[score_key] of a copy of each document.
+
+    batch_retrieve() runs the batch_retrieve() of the retrievers that have one
+    (ESQueryRetriever, ESVectorRetriever), batch() of the others, and fuses
+    the results of each query.
+
+    ainvoke() and abatch_retrieve() await the retrievers concurrently on the
+    event loop instead of using threads.
+
+    Each HybridRetriever runs its retrievers on a thread pool of its own, so a
+    HybridRetriever among the retrievers of another never waits for threads
+    its parent holds.
+    """
+
+    retrievers: List[BaseRetriever]
+    weights: Optional[List[float]] = None
+    fusion: Literal["rrf", "score"] = "rrf"
+    rrf_k: int = 60
+    k: int = 4
+    id_key: str = "chunk_id"
+    score_key: str = "_score"
+
+    _executor: Optional[ThreadPoolExecutor] = PrivateAttr(default=None)
+    _executor_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    thread_name_prefix="hybrid-retriever"
+                )
+            return self._executor
+
+    def _key(self, document: Document) -> str:
+        key = document.metadata.get(self.id_key)
+        return str(key) if key is not None else document.page_content
+
+    def _score(self, document: Document) -> float:
+        if self.score_key not in document.metadata:
+            raise ValueError(
+                f"fusion='score' needs metadata[{self.score_key!r}] on all documents"
+            )
+        return document.metadata[self.score_key]
+
+    def _scores_vectorstore(self, retriever: BaseRetriever) -> bool:
+        return (
+            self.fusion == "score"
+            and isinstance(retriever, VectorStoreRetriever)
+            and retriever.search_type == "similarity"
+        )
+
+    def _with_scores(self, pairs) -> List[Document]:
+        return [
+            Document(
+                page_content=document.page_content,
+                metadata={**document.metadata, self.score_key: score},
+            )
+            for document, score in pairs
+        ]
+
+    def _retrieve(self, retriever: BaseRetriever, query: str, config) -> List[Document]:
+        if self._scores_vectorstore(retriever):
+            return self._with_scores(
+                retriever.vectorstore.similarity_search_with_relevance_scores(
+                    query, **retriever.search_kwargs
+                )
+            )
+        return retriever.invoke(query, config)
+
+    async def _aretrieve(
+        self, retriever: BaseRetriever, query: str, config
+    ) -> List[Document]:
+        if self._scores_vectorstore(retriever):
+            return self._with_scores(
+                await retriever.vectorstore.asimilarity_search_with_relevance_scores(
+                    query, **retriever.search_kwargs
+                )
+            )
+        return await retriever.ainvoke(query, config)
+
+    def _fuse(self, results: List[List[Document]]) -> List[Document]:
+        weights = self.weights if self.weights else [1.0] * len(results)
+        documents: dict[str, Document] = {}
+        legs = []
+        for result in results:
+            seen, leg = set(), []
+            for document in result:
+                key = self._key(document)
+                if key in seen:
+                    continue
+                seen.add(key)
+                leg.append((key, document))
+                documents.setdefault(key, document)
+            legs.append(leg)
+        rankings = [[key for key, _ in leg] for leg in legs]
+        if self.fusion == "rrf":
+            scores = reciprocal_rank_fusion(rankings, weights, self.rrf_k)
+        else:
+            values = [[self._score(document) for _, document in leg] for leg in legs]
+            scores = weighted_score_fusion(values, rankings, weights)
+        ranked = sorted(scores, key=scores.__getitem__, reverse=True)
+        return [documents[key] for key in ranked[: self.k]]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        executor = self._get_executor()
+        futures = [
+            executor.submit(
+                self._retrieve,
+                retriever,
+                query,
+                {"callbacks": run_manager.get_child(f"retriever_{i}")},
+            )
+            for i, retriever in enumerate(self.retrievers)
+        ]
+        return self._fuse([future.result() for future in futures])
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        results = await asyncio.gather(
+            *(
+                self._aretrieve(
+                    retriever,
+                    query,
+                    {"callbacks": run_manager.get_child(f"retriever_{i}")},
+                )
+                for i, retriever in enumerate(self.retrievers)
+            )
+        )
+        return self._fuse(list(results))
+
+    def _batch(
+        self, retriever: BaseRetriever, queries: List[str]
+    ) -> List[List[Document]]:
+        if self._scores_vectorstore(retriever):
+            return [self._retrieve(retriever, query, None) for query in queries]
+        if hasattr(retriever, "batch_retrieve"):
+            return retriever.batch_retrieve(queries)
+        return retriever.batch(queries)
+
+    def batch_retrieve(self, queries: List[str]) -> List[List[Document]]:
+        """:return: the fused documents of each query, in the order of queries."""
+        executor = self._get_executor()
+        futures = [
+            executor.submit(self._batch, retriever, queries)
+            for retriever in self.retrievers
+        ]
+        results = [future.result() for future in futures]
+        return [self._fuse(list(legs)) for legs in zip(*results)]
+
+    async def _abatch(
+        self, retriever: BaseRetriever, queries: List[str]
+    ) -> List[List[Document]]:
+        if self._scores_vectorstore(retriever):
+            return list(
+                await asyncio.gather(
+                    *(self._aretrieve(retriever, query, None) for query in queries)
+                )
+            )
+        if hasattr(retriever, "abatch_retrieve"):
+            return await retriever.abatch_retrieve(queries)
+        return await retriever.abatch(queries)
+
+    async def abatch_retrieve(self, queries: List[str]) -> List[List[Document]]:
+        """async version of batch_retrieve."""
+        results = await asyncio.gather(
+            *(self._abatch(retriever, queries) for retriever in self.retrievers)
+        )
+        return [self._fuse(list(legs)) for legs in zip(*results)]
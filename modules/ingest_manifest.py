@@ -0,0 +1,265 @@
+"""
+Persistent ingest manifest, used by Database.store() for incremental and
+resumable ingestion.
+
+Every ingested file is recorded with its size, mtime, content hash and the ids
+of the chunks it produced. On the next run unchanged files are skipped, the
+chunks of changed files are replaced, and the chunks of deleted files are
+removed. A file is only marked done once all of its chunks are written, so an
+interrupted run picks up where it stopped.
+
+Chunks dropped as duplicates are recorded against the chunk that survived.
+When a surviving chunk is deleted because its file changed or disappeared,
+the files of its duplicates are requeued, so their text is ingested again
+instead of being lost.
+"""
+
+
+from collections.abc import Iterable
+from langchain_core.documents import Document
+import hashlib
+import os
+import sqlite3
+import threading
+
+
+def file_sha256(path: str, buffer_size: int = 1 << 20) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(buffer_size):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class IngestManifest:
+    """
+    SQLite-backed record of which files have been ingested and into which chunks.
+    Chunk ids are deterministic in (path, content hash, position), so writing
+    the same file twice overwrites rather than duplicates its chunks.
+    """
+
+    def __init__(self, path: str, chunk_id_key: str = "chunk_id") -> None:
+        """
+        :param path: sqlite file to keep the manifest in, created if missing.
+        :param chunk_id_key: metadata key the chunk id is written to.
+        """
+        self.path = path
+        self.chunk_id_key = chunk_id_key
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                sha256 TEXT NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                path TEXT NOT NULL,
+                chunk_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_path ON chunks (path);
+            CREATE TABLE IF NOT EXISTS aliases (
+                survivor TEXT NOT NULL,
+                path TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS aliases_survivor ON aliases (survivor);
+            CREATE INDEX IF NOT EXISTS aliases_path ON aliases (path);
+            """
+        )
+        self._conn.commit()
+        # files whose chunks are not all written yet: path -> [n_chunks_not_written, finished]
+        self._inflight: dict[str, list] = {}
+        # chunk id -> path, for chunks handed to expect() but not written yet
+        self._owner: dict[str, str] = {}
+        self._next_index: dict[str, int] = {}
+        self._hashes: dict[str, str] = {}
+        # files to ingest again because a chunk their duplicates pointed to was deleted
+        self._requeued: set[str] = set()
+
+    def _chunk_ids(self, path: str) -> list[str]:
+        rows = self._conn.execute(
+            "SELECT chunk_id FROM chunks WHERE path = ?", (path,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _requeue_aliases(self, chunk_ids: list[str], path: str | None = None) -> None:
+        """Mark the files whose duplicates point to the deleted chunk_ids as not done."""
+        paths = set()
+        for i in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[i : i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT DISTINCT path FROM aliases WHERE survivor IN ({placeholders})",
+                batch,
+            ).fetchall()
+            paths.update(row[0] for row in rows)
+        paths.discard(path)
+        for alias_path in paths:
+            self._conn.execute("DELETE FROM aliases WHERE path = ?", (alias_path,))
+            self._conn.execute(
+                "UPDATE files SET done = 0 WHERE path = ?", (alias_path,)
+            )
+        self._requeued.update(paths)
+
+    def requeued(self, seen: Iterable[str]) -> set[str]:
+        """
+        :return: files of seen that must be ingested again because chunks their
+            duplicates pointed to were deleted after they were checked.
+        """
+        with self._lock:
+            paths = self._requeued.intersection(map(str, seen))
+            self._requeued -= paths
+        return paths
+
+    def check(self, path: str) -> list[str] | None:
+        """
+        Compare a file against the manifest.
+        :return: None if the file is unchanged and fully ingested, otherwise the
+            ids of the chunks previously stored for it (empty for a new file),
+            which the caller must delete before writing the new chunks.
+        """
+        path = str(path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime, sha256, done FROM files WHERE path = ?", (path,)
+            ).fetchone()
+        if row and row[3] and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return None
+        sha256 = file_sha256(path)
+        with self._lock:
+            if row and row[3] and row[2] == sha256:
+                self._conn.execute(
+                    "UPDATE files SET size = ?, mtime = ? WHERE path = ?",
+                    (stat.st_size, stat.st_mtime, path),
+                )
+                self._conn.commit()
+                return None
+            stale = self._chunk_ids(path) if row else []
+            self._conn.execute("DELETE FROM chunks WHERE path = ?", (path,))
+            self._conn.execute("DELETE FROM aliases WHERE path = ?", (path,))
+            self._requeue_aliases(stale, path)
+            self._requeued.discard(path)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime, sha256, done) "
+                "VALUES (?, ?, ?, ?, 0)",
+                (path, stat.st_size, stat.st_mtime, sha256),
+            )
+            self._conn.commit()
+            self._hashes[path] = sha256
+            self._next_index[path] = 0
+            self._inflight[path] = [0, False]
+            return stale
+
+    def expect(self, path: str, chunks: Iterable[Document]) -> None:
+        """
+        Assign chunk ids to chunks of a file accepted by check() and record them
+        before they are written. May be called several times per file.
+        """
+        path = str(path)
+        with self._lock:
+            index = self._next_index[path]
+            prefix = hashlib.sha1(path.encode()).hexdigest()[:16]
+            ids = []
+            for chunk in chunks:
+                chunk_id = f"{prefix}-{self._hashes[path][:16]}-{index}"
+                chunk.metadata[self.chunk_id_key] = chunk_id
+                self._owner[chunk_id] = path
+                ids.append((path, chunk_id))
+                index += 1
+            self._next_index[path] = index
+            self._inflight[path][0] += len(ids)
+            self._conn.executemany(
+                "INSERT INTO chunks (path, chunk_id) VALUES (?, ?)", ids
+            )
+            self._conn.commit()
+
+    def finish(self, path: str) -> None:
+        """Mark that all chunks of a file have been handed to expect()."""
+        path = str(path)
+        with self._lock:
+            self._inflight[path][1] = True
+            self._checkpoint([path])
+
+    def written(self, chunk_ids: Iterable[str]) -> None:
+        """
+        Report that chunks are stored. Files whose chunks are now all stored
+        are marked done.
+        """
+        with self._lock:
+            self._checkpoint(self._release(chunk_ids))
+
+    def discard(
+        self, chunk_ids: Iterable[str], survivors: Iterable[str] | None = None
+    ) -> None:
+        """
+        Report that chunks handed to expect() will not be stored, e.g. because
+        they were dropped as duplicates, so they are never deleted later.
+        :param survivors: for duplicates, the id of the stored chunk each one duplicates.
+            If that chunk is deleted later, the file of the duplicate is requeued.
+        """
+        chunk_ids = list(chunk_ids)
+        with self._lock:
+            if survivors is not None:
+                self._conn.executemany(
+                    "INSERT INTO aliases (survivor, path) VALUES (?, ?)",
+                    [
+                        (survivor, self._owner[chunk_id])
+                        for chunk_id, survivor in zip(chunk_ids, survivors)
+                        if survivor is not None
+                    ],
+                )
+            self._conn.executemany(
+                "DELETE FROM chunks WHERE chunk_id = ?", [(i,) for i in chunk_ids]
+            )
+            self._checkpoint(self._release(chunk_ids))
+
+    def _release(self, chunk_ids: Iterable[str]) -> set[str]:
+        paths = set()
+        for chunk_id in chunk_ids:
+            path = self._owner.pop(chunk_id)
+            self._inflight[path][0] -= 1
+            paths.add(path)
+        return paths
+
+    def _checkpoint(self, paths: Iterable[str]) -> None:
+        done = []
+        for path in paths:
+            remaining, finished = self._inflight[path]
+            if finished and remaining == 0:
+                del self._inflight[path], self._next_index[path], self._hashes[path]
+                done.append((path,))
+        if done:
+            self._conn.executemany("UPDATE files SET done = 1 WHERE path = ?", done)
+        self._conn.commit()
+
+    def prune(self, seen: Iterable[str], prefix: str = "") -> list[str]:
+        """
+        Forget files under prefix that were not seen in this run.
+        :return: ids of the chunks of the removed files, to be deleted by the caller.
+        """
+        seen = set(map(str, seen))
+        prefix = os.path.normpath(prefix) if prefix else ""
+        with self._lock:
+            paths = [
+                row[0]
+                for row in self._conn.execute("SELECT path FROM files").fetchall()
+                if row[0] not in seen
+                and (not prefix or os.path.normpath(row[0]).startswith(prefix))
+            ]
+            stale = []
+            for path in paths:
+                stale.extend(self._chunk_ids(path))
+                self._conn.execute("DELETE FROM chunks WHERE path = ?", (path,))
+                self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+                self._conn.execute("DELETE FROM aliases WHERE path = ?", (path,))
+                self._requeued.discard(path)
+            self._requeue_aliases(stale)
+            self._conn.commit()
+        return stale
+
+    def close(self) -> None:
+        self._conn.close()
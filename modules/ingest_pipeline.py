@@ -0,0 +1,240 @@
+"""
+Staged, multi-process ingestion engine for Database.
+
+    blobs --> [process pool: parse + split] --> batches --> [embed thread] --> [index thread]
+
+Stages are connected by bounded queues, and at most max_pending blobs are in
+flight in the process pool, so memory stays flat no matter how big the corpus
+is. A slow stage blocks the stages in front of it instead of piling up work.
+"""
+
+
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from langchain_community.document_loaders.blob_loaders.schema import Blob
+from langchain_core.documents import Document
+import multiprocessing
+import os
+import queue
+import threading
+
+
+_worker_parser = None
+_worker_splitter = None
+
+
+def _init_worker(parser, splitter) -> None:
+    # With the "fork" start method initargs are inherited rather than pickled,
+    # so parsers built from lambdas (see examples/) work in the pool as well.
+    global _worker_parser, _worker_splitter
+    _worker_parser = parser
+    _worker_splitter = splitter
+
+
+def split_blob(
+    parser, splitter, blob: Blob, part: int | None = None
+) -> Iterator[tuple[int, list[Document]]]:
+    """
+    Parse and split blob, yielding (number of documents, chunks) for every
+    record batch of parsers with lazy_parse_batches(), e.g. ArrowParser, and
+    for every document of other parsers.
+    :param part: only this part of blob, for parsers with parts(), e.g. a Parquet row group.
+    """
+    if hasattr(parser, "lazy_parse_batches"):
+        batches = (
+            parser.lazy_parse_batches(blob)
+            if part is None
+            else parser.lazy_parse_batches(blob, part)
+        )
+        for texts, metadatas in batches:
+            yield len(texts), splitter.create_documents(texts, metadatas)
+    else:
+        for document in parser.lazy_parse(blob):
+            yield 1, splitter.split_documents([document])
+
+
+def _parse_and_split(
+    blob: Blob, part: int | None = None
+) -> tuple[int, list[Document]]:
+    n_documents, chunks = 0, []
+    for n, batch in split_blob(_worker_parser, _worker_splitter, blob, part):
+        n_documents += n
+        chunks.extend(batch)
+    return n_documents, chunks
+
+
+_DONE = object()
+
+
+class IngestPipeline:
+    """
+    Run Database ingestion as three concurrent stages.
+
+    Parsing and splitting are CPU-bound and run in a pool of worker processes.
+    Embedding and indexing each get a thread of their own, so that the
+    embedding model and Elasticsearch are kept busy at the same time.
+    """
+
+    def __init__(
+        self,
+        database,
+        workers: int | None = None,
+        batch_size: int | None = 256,
+        batch_tokens: int | None = None,
+        queue_size: int = 4,
+        max_pending: int | None = None,
+    ) -> None:
+        """
+        :param database: Database whose parser, splitter, embeddings and vectorstore are used.
+        :param workers: number of parse/split processes, defaults to os.cpu_count()
+        :param batch_size: maximum number of chunks per embedding/indexing batch
+        :param batch_tokens: maximum number of tokens per embedding/indexing batch
+        :param queue_size: number of batches buffered between two stages
+        :param max_pending: number of blobs in flight in the process pool, defaults to 2 * workers
+        """
+        self.database = database
+        self.workers = workers if workers else os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.queue_size = queue_size
+        self.max_pending = max_pending if max_pending else 2 * self.workers
+        self._error: BaseException | None = None
+        self._failed = threading.Event()
+
+    def _put(self, q: queue.Queue, item) -> None:
+        # Never block forever on a queue whose consumer has died.
+        while not self._failed.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue):
+        while not self._failed.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, error: BaseException) -> None:
+        if self._error is None:
+            self._error = error
+        self._failed.set()
+
+    def _embed_stage(self, inbox: queue.Queue, outbox: queue.Queue) -> None:
+        try:
+            while (batch := self._get(inbox)) is not _DONE:
+                self._put(outbox, (batch, self.database._batch2embeddings(batch)))
+            self._put(outbox, _DONE)
+        except BaseException as e:
+            self._fail(e)
+
+    def _index_stage(
+        self,
+        inbox: queue.Queue,
+        stats: dict,
+        on_batch: Callable[[dict], None] | None,
+    ) -> None:
+        try:
+            while (item := self._get(inbox)) is not _DONE:
+                batch, vectors = item
+                self.database._embeddings2store(batch, vectors)
+                stats["chunks"] += len(batch)
+                if on_batch:
+                    on_batch(stats)
+        except BaseException as e:
+            self._fail(e)
+
+    def _parts(self, blob: Blob) -> list[int | None]:
+        """Parts of blob parsed as separate tasks, [None] for the whole blob."""
+        parser = self.database.blob_parser
+        n_parts = parser.parts(blob) if hasattr(parser, "parts") else 1
+        return list(range(n_parts)) if n_parts > 1 else [None]
+
+    def _chunks(
+        self, blobs: Iterable[Blob], executor: ProcessPoolExecutor, stats: dict
+    ) -> Iterator[Document]:
+        """
+        Yield chunks in blob order while keeping at most max_pending tasks in
+        flight. A task is a blob, or a part of it, e.g. a Parquet row group,
+        so large columnar files don't come back from a worker in one piece.
+        """
+        pending: deque[tuple[Blob, Future, bool]] = deque()
+        for blob in blobs:
+            parts = self._parts(blob)
+            for i, part in enumerate(parts):
+                if self._failed.is_set():
+                    return
+                future = executor.submit(_parse_and_split, blob, part)
+                pending.append((blob, future, i == len(parts) - 1))
+                if len(pending) >= self.max_pending:
+                    yield from self._collect(*pending.popleft(), stats)
+        while pending and not self._failed.is_set():
+            yield from self._collect(*pending.popleft(), stats)
+
+    def _collect(
+        self, blob: Blob, future: Future, last: bool, stats: dict
+    ) -> list[Document]:
+        n_documents, chunks = future.result()
+        self.database._track_chunks(blob, chunks, finished=last)
+        stats["documents"] += n_documents
+        return self.database._dedup_chunks(chunks)
+
+    def run(
+        self,
+        blobs: Iterable[Blob],
+        on_batch: Callable[[dict], None] | None = None,
+    ) -> dict[str, int]:
+        """
+        Ingest blobs through the pipeline.
+        :param blobs: blobs to ingest, e.g. Database._file2blobs()
+        :param on_batch: called with the running stats after each indexed batch
+        :return: dict of documents and chunks processed
+        """
+        stats = {"documents": 0, "chunks": 0}
+        embed_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        index_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        stages = [
+            threading.Thread(
+                target=self._embed_stage, args=(embed_queue, index_queue), daemon=True
+            ),
+            threading.Thread(
+                target=self._index_stage,
+                args=(index_queue, stats, on_batch),
+                daemon=True,
+            ),
+        ]
+        context = (
+            multiprocessing.get_context("fork")
+            if "fork" in multiprocessing.get_all_start_methods()
+            else None
+        )
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.database.blob_parser, self.database.text_splitter),
+        ) as executor:
+            # Spawn the worker processes before any stage thread exists.
+            executor.submit(os.getpid).result()
+            for stage in stages:
+                stage.start()
+            try:
+                chunks = self._chunks(blobs, executor, stats)
+                for batch in self.database._chunks2batches(
+                    chunks, self.batch_size, self.batch_tokens
+                ):
+                    self._put(embed_queue, batch)
+                self._put(embed_queue, _DONE)
+            except BaseException as e:
+                self._fail(e)
+            for stage in stages:
+                stage.join()
+            if self._failed.is_set():
+                executor.shutdown(cancel_futures=True)
+        if self._error is not None:
+            raise self._error
+        return stats
@@ -2,22 +2,61 @@ from collections.abc import Callable, Iterator
 from langchain_community.document_loaders import Blob
 from langchain_community.document_loaders.base import BaseBlobParser
 from langchain_core.documents import Document
+from .compressed_io import open_blob
+from .shared_metadata import SharedMetadata
 import json
 
 
+def _with_item(skeleton: dict | list, keys: list[str], item) -> dict | list:
+    """Copy of skeleton with the array at keys replaced by [item]."""
+    if not keys:
+        return [item]
+    node = skeleton.get(keys[0], {}) if isinstance(skeleton, dict) else {}
+    return {**skeleton, keys[0]: _with_item(node, keys[1:], item)}
+
+
 class JsonParser(BaseBlobParser):
     """
     A custom implementation of json parser.
+
+    With item_path, e.g. "paragraphs[*]", the file is parsed incrementally
+    with ijson and content_func and metadata_func are called once per array
+    element, on the document with that array replaced by a one-element list.
+    Existing funcs such as `lambda x: [i["paragraph"] for i in x["paragraphs"]]`
+    work unchanged, and memory is bounded by the largest element instead of
+    the file. While reading the array, only the fields that precede it in the
+    file are known. If a func raises KeyError for an element, e.g. because
+    "title" follows "paragraphs", that element and the rest of the array are
+    kept until the end of the file and parsed with all fields, so such files
+    take memory in proportion to the array.
+
+    gzip, zstd and bz2 files are decompressed on the fly, see compressed_io.
+    With metadata_store, fields shared by the documents of a record are
+    stored once and referenced by id, see SharedMetadata.
     """
 
     def __init__(
         self,
         content_func: Callable[[dict | list], str | list[str]],
         metadata_func: Callable[[dict | list], dict | list[dict]],
+        item_path: str | None = None,
+        metadata_store: SharedMetadata | None = None,
     ) -> None:
+        """
+        :param item_path: array to stream, as dotted keys ending in [*], e.g. "paragraphs[*]", "data.items[*]" or "[*]" for a top-level array.
+        :param metadata_store: store to move shared metadata fields to.
+        """
         super().__init__()
         self.content_func = content_func
         self.metadata_func = metadata_func
+        self.item_path = item_path
+        self.metadata_store = metadata_store
+        if item_path is not None:
+            if not item_path.endswith("[*]") or "[*]" in item_path[:-3]:
+                raise ValueError(
+                    f"item_path must contain exactly one trailing [*], got {item_path}"
+                )
+            self._keys = [key for key in item_path[:-3].split(".") if key]
 
     def _align_documents(
         self, contents: str | list[str], metadatas: dict | list[dict]
@@ -40,16 +79,85 @@ class JsonParser(BaseBlobParser):
                 f"len(contents) and len(metadatas) not aligned: {len(contents)}, {len(metadatas)}"
             )
 
+    def _metadatas(self, data: dict | list) -> dict | list[dict]:
+        metadatas = self.metadata_func(data)
+        if self.metadata_store:
+            metadatas = self.metadata_store.compact_all(metadatas)
+        return metadatas
+
+    def _stream_items(self, blob: Blob) -> Iterator[tuple]:
+        """
+        Yield (skeleton, element) for each element of the array at self.item_path.
+        skeleton is the ijson.ObjectBuilder of everything outside the array,
+        complete once the generator is exhausted.
+        """
+        try:
+            import ijson
+        except ImportError as e:
+            raise ImportError(
+                "JsonParser with item_path requires ijson, `pip install ijson`"
+            ) from e
+
+        array = ".".join(self._keys)
+        item = f"{array}.item" if array else "item"
+        # everything outside the array, built as it is read
+        skeleton = ijson.ObjectBuilder()
+        builder, depth = None, 0
+        with open_blob(blob) as f:
+            for prefix, event, value in ijson.parse(f, use_float=True):
+                if builder is None and prefix != item:
+                    if prefix != array or event not in ("start_array", "end_array"):
+                        skeleton.event(event, value)
+                    continue
+                if builder is None:
+                    builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                if event in ("start_map", "start_array"):
+                    depth += 1
+                elif event in ("end_map", "end_array"):
+                    depth -= 1
+                if depth == 0:
+                    yield skeleton, builder.value
+                    builder = None
+
     def lazy_parse(self, blob: Blob) -> Iterator[Document]:
         """
-        **Warning: This method reads the entire blob into memory.**
+        **Warning: Without item_path, this method reads the entire blob into memory.**
 
         This is not true *lazy* parse. This method name is used for
-        compatibility with other workflows.
+        compatibility with other workflows. Set item_path to parse the
+        blob incrementally.
         """
-        if blob.path:
-            with open(blob.path, "r") as f:
+        if self.item_path is not None:
+            skeleton, deferred = None, []
+            for skeleton, item in self._stream_items(blob):
+                if deferred:
+                    deferred.append(item)
+                    continue
+                data = _with_item(getattr(skeleton, "value", {}), self._keys, item)
+                try:
+                    contents = self.content_func(data)
+                    metadatas = self._metadatas(data)
+                except KeyError:
+                    # may be a field that follows the array, retry at the end of the file
+                    deferred.append(item)
+                    continue
+                yield from self._align_documents(contents, metadatas)
+            for item in deferred:
+                data = _with_item(getattr(skeleton, "value", {}), self._keys, item)
+                try:
+                    contents = self.content_func(data)
+                    metadatas = self._metadatas(data)
+                except KeyError as e:
+                    raise KeyError(
+                        f"{blob.source}: content_func or metadata_func needs {e}, "
+                        f"which is neither in the elements of {self.item_path} "
+                        f"nor anywhere else in the file"
+                    ) from e
+                yield from self._align_documents(contents, metadatas)
+        elif blob.path:
+            with open_blob(blob) as f:
                 data = json.load(f)
                 contents = self.content_func(data)
-                metadatas = self.metadata_func(data)
+                metadatas = self._metadatas(data)
                 yield from self._align_documents(contents, metadatas)
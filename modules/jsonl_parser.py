@@ -1,49 +1,239 @@
+from collections import deque
 from collections.abc import Callable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from langchain_community.document_loaders import Blob
 from langchain_community.document_loaders.base import BaseBlobParser
 from langchain_core.documents import Document
+from .compressed_io import blob_compression, open_blob
+from .record_index import RecordIndex
+from .shared_metadata import SharedMetadata
 import json
+import mmap
+import multiprocessing
+
+
+_worker_parser = None
+
+
+def _init_worker(parser) -> None:
+    # Inherited through fork, so content_func and metadata_func may be lambdas.
+    global _worker_parser
+    _worker_parser = parser
+
+
+def _parse_range(path: str, start: int, end: int) -> tuple[list, list]:
+    # Plain tuples pickle several times faster than Documents.
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            data = m[start:end]
+    return _worker_parser._parse_lines(data, start)
+
+
+def _parse_bytes(data: bytes, offset: int) -> tuple[list, list]:
+    return _worker_parser._parse_lines(data, offset)
+
+
+def _default_loads() -> Callable[[bytes | str], object]:
+    try:
+        import orjson
+
+        return orjson.loads
+    except ImportError:
+        return json.loads
 
 
 class JsonlParser(BaseBlobParser):
+    """
+    Parse a JSON object per line.
+
+    With workers, the file is memory-mapped and cut into newline-aligned
+    byte ranges of about range_bytes, which a pool of processes decodes in
+    parallel. Documents are yielded in file order if ordered, otherwise as
+    soon as their range is decoded.
+
+    gzip, zstd and bz2 files are decompressed on the fly, see compressed_io.
+    With workers, the decompressed stream is read in this process and cut
+    into blocks of about range_bytes for the pool. The pool needs the "fork"
+    start method, so the funcs can be lambdas: where fork is unavailable, or
+    inside a daemonic process such as an IngestPipeline worker, which may not
+    have children, the file is read in this process as with workers=0.
+
+    With record_index, the byte offset and length of every record are
+    written to the index once the blob is parsed, and the metadata of each
+    document gets the record key under record_id_key, see RecordIndex.
+    With metadata_store, fields shared by the documents of a record are
+    stored once and referenced by id, see SharedMetadata.
+    """
+
     def __init__(
         self,
         content_func: Callable[[dict | list], str | list[str]],
         metadata_func: Callable[[dict | list], dict | list[dict]],
+        workers: int = 0,
+        range_bytes: int = 16 << 20,
+        ordered: bool = True,
+        loads: Callable[[bytes | str], object] | None = None,
+        record_index: RecordIndex | None = None,
+        record_id_key: str = "record_id",
+        metadata_store: SharedMetadata | None = None,
     ) -> None:
+        """
+        :param workers: number of decoding processes, 0 reads the file line by line in this process.
+        :param range_bytes: approximate size of the byte range decoded by one task.
+        :param ordered: yield documents in file order.
+        :param loads: JSON decoder taking bytes, defaults to orjson.loads if installed, else json.loads.
+        :param record_index: index to record the location of every record in.
+        :param record_id_key: metadata key of the record key, if record_index is set.
+        :param metadata_store: store to move shared metadata fields to.
+        """
         super().__init__()
         self.content_func = content_func
         self.metadata_func = metadata_func
+        self.workers = workers
+        self.range_bytes = range_bytes
+        self.ordered = ordered
+        self.loads = loads if loads else _default_loads()
+        self.record_index = record_index
+        self.record_id_key = record_id_key
+        self.metadata_store = metadata_store
 
     def _align_documents(
         self, contents: str | list[str], metadatas: dict | list[dict]
     ) -> Iterator[Document]:
+        for content, metadata in self._align(contents, metadatas):
+            yield Document(page_content=content, metadata=metadata)
+
+    def _align(
+        self, contents: str | list[str], metadatas: dict | list[dict]
+    ) -> Iterator[tuple[str, dict]]:
         if type(contents) == str:
             if type(metadatas) == dict:
-                yield Document(page_content=contents, metadata=metadatas)
+                yield contents, metadatas
             else:
                 raise TypeError(
                     f"metadatas must be dict not {type(metadatas)} if contents is of type str"
                 )
         elif type(metadatas) == dict:
             for content in contents:
-                yield Document(page_content=content, metadata=metadatas)
+                yield content, metadatas
         elif len(contents) == len(metadatas):
-            for i in range(len(contents)):
-                yield Document(page_content=contents[i], metadata=metadatas[i])
+            yield from zip(contents, metadatas)
         else:
             raise ValueError(
                 f"len(contents) and len(metadatas) not aligned: {len(contents)}, {len(metadatas)}"
             )
 
+    def _ranges(self, path: str) -> Iterator[tuple[int, int]]:
+        """Newline-aligned (start, end) byte ranges covering the file."""
+        with open(path, "rb") as f:
+            size = f.seek(0, 2)
+            if size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                start = 0
+                while start < size:
+                    end = m.find(b"\n", min(start + self.range_bytes, size) - 1)
+                    end = size if end == -1 else end + 1
+                    yield start, end
+                    start = end
+
+    def _blocks(self, blob: Blob) -> Iterator[tuple[int, bytes]]:
+        """Newline-aligned blocks of the decompressed blob, with their offsets."""
+        offset = 0
+        with open_blob(blob) as f:
+            while block := f.read(self.range_bytes):
+                block += f.readline()
+                yield offset, block
+                offset += len(block)
+
+    def _parse_lines(
+        self, data: bytes, offset: int = 0
+    ) -> tuple[list[tuple[str, dict]], list[tuple[object, int, int]]]:
+        """
+        Decode the lines of data, which starts at byte offset of its file.
+        :return: (content, metadata) pairs and, with self.record_index, (record key, offset, length) entries
+        """
+        pairs, entries = [], []
+        for line in data.split(b"\n"):
+            start = offset
+            offset += len(line) + 1
+            if not line.strip():
+                continue
+            record = self.loads(line)
+            metadatas = self.metadata_func(record)
+            if self.metadata_store:
+                metadatas = self.metadata_store.compact_all(metadatas)
+            aligned = self._align(self.content_func(record), metadatas)
+            if self.record_index is None:
+                pairs.extend(aligned)
+                continue
+            key = self.record_index.key_of(record)
+            entries.append((key, start, len(line)))
+            pairs.extend(
+                (content, {**metadata, self.record_id_key: key})
+                for content, metadata in aligned
+            )
+        return pairs, entries
+
+    def _parallel_parse(self, blob: Blob) -> Iterator[Document]:
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_worker,
+            initargs=(self,),
+        ) as executor:
+            pending = deque()
+            if blob.data is None and blob_compression(blob) is None:
+                path = str(blob.path)
+                tasks = (
+                    executor.submit(_parse_range, path, start, end)
+                    for start, end in self._ranges(path)
+                )
+            else:
+                tasks = (
+                    executor.submit(_parse_bytes, data, offset)
+                    for offset, data in self._blocks(blob)
+                )
+            entries = []
+            for task in tasks:
+                pending.append(task)
+                # keep 2 ranges per worker in flight
+                while len(pending) >= 2 * self.workers:
+                    yield from self._collect(pending, entries)
+            while pending:
+                yield from self._collect(pending, entries)
+        if self.record_index is not None:
+            entries.sort(key=lambda entry: entry[1])
+            self.record_index.write_segment(str(blob.path), entries)
+
+    def _collect(self, pending: deque, entries: list) -> Iterator[Document]:
+        if self.ordered:
+            done = [pending.popleft()]
+        else:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+        for future in done:
+            pairs, range_entries = future.result()
+            entries.extend(range_entries)
+            for content, metadata in pairs:
+                yield Document(page_content=content, metadata=metadata)
+
+    def _can_fork(self) -> bool:
+        return (
+            "fork" in multiprocessing.get_all_start_methods()
+            and not multiprocessing.current_process().daemon
+        )
+
     def lazy_parse(self, blob: Blob) -> Iterator[Document]:
-        if blob.path:
-            with open(blob.path, "r") as f:
-                while True:
-                    text = f.readline()
-                    if not text:
-                        break
-                    data = json.loads(text)
-                    contents = self.content_func(data)
-                    metadatas = self.metadata_func(data)
-                    yield from self._align_documents(contents, metadatas)
+        if blob.path and self.workers > 0 and self._can_fork():
+            yield from self._parallel_parse(blob)
+        elif blob.path:
+            entries = []
+            for offset, data in self._blocks(blob):
+                pairs, block_entries = self._parse_lines(data, offset)
+                entries.extend(block_entries)
+                for content, metadata in pairs:
+                    yield Document(page_content=content, metadata=metadata)
+            if self.record_index is not None:
+                self.record_index.write_segment(str(blob.path), entries)
@@ -0,0 +1,489 @@
+"""
+Embedded vector index, a VectorStore that needs no Elasticsearch.
+
+Layout of the index directory:
+
+    meta.json       dimension, number of rows, distance
+    vectors.f32     float32 row-major vectors, memory-mapped
+    docs.jsonl      {"id", "text", "metadata"} per row
+    docs.offsets    uint64 byte offset of every row in docs.jsonl, memory-mapped
+    deleted.u64     uint64 row numbers of deleted rows
+    ivf.*.npy       optional IVF partitioning, see LocalVectorStore.build_ivf()
+    codes.bin       optional compressed codes, see LocalVectorStore.quantize()
+    quantizer.npz   parameters of the quantizer that produced codes.bin
+
+Opening an index maps the files; nothing is loaded until it is searched.
+"""
+
+
+from collections.abc import Callable, Iterable
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from typing import Any, Literal
+from .vector_quantization import QUANTIZATIONS, Quantizer, kmeans, make_quantizer
+import json
+import numpy as np
+import os
+import uuid
+
+DISTANCES = Literal["cosine", "dot_product"]
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Vectors in a contiguous float32 memory-mapped array, searched exactly with a
+    batched matrix multiply, or approximately through an IVF index once
+    build_ivf() has been called.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        embedding: Embeddings | None = None,
+        distance: DISTANCES = "cosine",
+        nprobe: int = 8,
+        block_size: int = 1 << 16,
+        rescore: int = 4,
+    ) -> None:
+        """
+        :param path: index directory, created if missing.
+        :param embedding: model used to embed texts and queries.
+        :param distance: "cosine" normalizes vectors when they are added, "dot_product" keeps them as is.
+        :param nprobe: number of IVF lists scanned per query.
+        :param block_size: number of rows multiplied at once in exact search.
+        :param rescore: with quantize(), k * rescore candidates are rescored in full precision.
+        """
+        self.path = path
+        self.embedding = embedding
+        self.nprobe = nprobe
+        self.block_size = block_size
+        os.makedirs(path, exist_ok=True)
+        self._meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r") as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {"dim": None, "count": 0, "docs_bytes": 0, "distance": distance}
+        self.distance = self.meta["distance"]
+        self._vectors: np.ndarray | None = None
+        self._offsets: np.ndarray | None = None
+        self._deleted: np.ndarray | None = None
+        self._ids: dict[str, int] | None = None
+        self._ivf: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+        self._ivf_count = 0
+        self.rescore = rescore
+        self.quantizer: Quantizer | None = None
+        self._codes: np.ndarray | None = None
+        self._load_ivf()
+        self._load_quantizer()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @property
+    def embeddings(self) -> Embeddings | None:
+        return self.embedding
+
+    @property
+    def count(self) -> int:
+        return self.meta["count"]
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """All vectors, shape (count, dim), memory-mapped read-only."""
+        if self._vectors is None or len(self._vectors) != self.count:
+            if self.count == 0:
+                return np.empty((0, self.meta["dim"] or 0), dtype=np.float32)
+            self._vectors = np.memmap(
+                self._file("vectors.f32"),
+                dtype=np.float32,
+                mode="r",
+                shape=(self.count, self.meta["dim"]),
+            )
+        return self._vectors
+
+    def _doc_offsets(self) -> np.ndarray:
+        if self._offsets is None or len(self._offsets) != self.count:
+            if self.count == 0:
+                # docs.offsets is only written by the first add
+                return np.empty(0, dtype=np.uint64)
+            self._offsets = np.memmap(
+                self._file("docs.offsets"),
+                dtype=np.uint64,
+                mode="r",
+                shape=(self.count,),
+            )
+        return self._offsets
+
+    def _deleted_mask(self) -> np.ndarray:
+        if self._deleted is None or len(self._deleted) != self.count:
+            mask = np.zeros(self.count, dtype=bool)
+            if os.path.exists(self._file("deleted.u64")):
+                mask[np.fromfile(self._file("deleted.u64"), dtype=np.uint64)] = True
+            self._deleted = mask
+        return self._deleted
+
+    def _id_map(self) -> dict[str, int]:
+        """id -> row, built by scanning docs.jsonl on first use."""
+        if self._ids is None:
+            self._ids = {}
+            if self.count:
+                with open(self._file("docs.jsonl"), "rb") as f:
+                    for row, line in enumerate(f):
+                        if row >= self.count:
+                            break
+                        self._ids[json.loads(line)["id"]] = row
+                deleted = self._deleted_mask()
+                self._ids = {i: row for i, row in self._ids.items() if not deleted[row]}
+        return self._ids
+
+    def _write_meta(self) -> None:
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self._meta_path)
+
+    def _truncate(self) -> None:
+        """Drop bytes a crashed add_embeddings() wrote past what meta.json accounts for."""
+        sizes = {
+            "vectors.f32": self.count * (self.meta["dim"] or 0) * 4,
+            "docs.jsonl": self.meta["docs_bytes"],
+            "docs.offsets": self.count * 8,
+        }
+        if self.quantizer is not None:
+            sizes["codes.bin"] = self._codes.nbytes
+        for name, size in sizes.items():
+            file = self._file(name)
+            if os.path.exists(file) and os.path.getsize(file) != size:
+                os.truncate(file, size)
+
+    def _mark_deleted(self, rows: list[int]) -> None:
+        if not rows:
+            return
+        with open(self._file("deleted.u64"), "ab") as f:
+            np.asarray(rows, dtype=np.uint64).tofile(f)
+        self._deleted = None
+
+    def add_embeddings(
+        self,
+        text_embeddings: Iterable[tuple[str, list[float]]],
+        metadatas: list[dict] | None = None,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        """Add precomputed embeddings. Rows whose id already exists are replaced."""
+        text_embeddings = list(text_embeddings)
+        if not text_embeddings:
+            return []
+        texts = [text for text, _ in text_embeddings]
+        vectors = np.asarray([v for _, v in text_embeddings], dtype=np.float32)
+        if self.meta["dim"] is None:
+            self.meta["dim"] = vectors.shape[1]
+        elif vectors.shape[1] != self.meta["dim"]:
+            raise ValueError(
+                f"embedding dimension {vectors.shape[1]} does not match "
+                f"index dimension {self.meta['dim']}"
+            )
+        if self.distance == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1, norms)
+        metadatas = metadatas if metadatas else [{} for _ in texts]
+        ids = ids if ids else [str(uuid.uuid4()) for _ in texts]
+        id_map = self._id_map()
+        self._mark_deleted([id_map[i] for i in ids if i in id_map])
+
+        start = self.count
+        self._truncate()
+        with open(self._file("vectors.f32"), "ab") as f:
+            vectors.tofile(f)
+        offsets = np.empty(len(texts), dtype=np.uint64)
+        with open(self._file("docs.jsonl"), "ab") as f:
+            for i, (doc_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                offsets[i] = f.tell()
+                line = json.dumps({"id": doc_id, "text": text, "metadata": metadata})
+                f.write(line.encode("utf8") + b"\n")
+            docs_bytes = f.tell()
+        with open(self._file("docs.offsets"), "ab") as f:
+            offsets.tofile(f)
+        if self.quantizer is not None:
+            codes = self.quantizer.encode(vectors)
+            with open(self._file("codes.bin"), "ab") as f:
+                codes.tofile(f)
+            self._codes = np.concatenate([self._codes, codes])
+        for i, doc_id in enumerate(ids):
+            id_map[doc_id] = start + i
+        self.meta["count"] = start + len(texts)
+        self.meta["docs_bytes"] = docs_bytes
+        self._write_meta()
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: list[dict] | None = None,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+        if self.embedding is None:
+            raise ValueError("LocalVectorStore needs an embedding to add texts")
+        vectors = self.embedding.embed_documents(texts)
+        return self.add_embeddings(zip(texts, vectors), metadatas, ids)
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool | None:
+        if not ids:
+            return False
+        id_map = self._id_map()
+        self._mark_deleted([id_map.pop(i) for i in ids if i in id_map])
+        return True
+
+    def get_documents(self, rows: Iterable[int]) -> list[Document]:
+        """Read rows from docs.jsonl."""
+        rows = list(rows)
+        if not rows:
+            return []
+        offsets = self._doc_offsets()
+        docs = []
+        with open(self._file("docs.jsonl"), "rb") as f:
+            for row in rows:
+                f.seek(int(offsets[row]))
+                record = json.loads(f.readline())
+                docs.append(
+                    Document(page_content=record["text"], metadata=record["metadata"])
+                )
+        return docs
+
+    def _prepare_queries(self, queries: np.ndarray) -> np.ndarray:
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.distance == "cosine":
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            queries = queries / np.where(norms == 0, 1, norms)
+        return queries
+
+    def _search_rows(
+        self,
+        queries: np.ndarray,
+        k: int,
+        rows: np.ndarray | None = None,
+        quantized: bool = False,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k over all rows, or over the given rows, for a batch of queries.
+        :param quantized: score against the codes instead of the full vectors.
+        :return: (rows, scores), both of shape (n_queries, k), padded with -1/-inf.
+        """
+        n = self.count if rows is None else len(rows)
+        best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        deleted = self._deleted_mask()
+        # codes are widened to float32 per block, keep those blocks cache-sized
+        step = min(self.block_size, 2048) if quantized else self.block_size
+        for start in range(0, n, step):
+            if rows is None:
+                block_rows = np.arange(start, min(start + step, n))
+            else:
+                block_rows = rows[start : start + step]
+            if quantized:
+                scores = self.quantizer.scores(queries, self._codes[block_rows])
+            elif rows is None:
+                scores = queries @ self.vectors[start : start + step].T
+            else:
+                scores = queries @ self.vectors[block_rows].T
+            scores[:, deleted[block_rows]] = -np.inf
+            merged_rows = np.concatenate(
+                [best_rows, np.broadcast_to(block_rows, scores.shape)], axis=1
+            )
+            merged_scores = np.concatenate([best_scores, scores], axis=1)
+            top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+            best_rows = np.take_along_axis(merged_rows, top, axis=1)
+            best_scores = np.take_along_axis(merged_scores, top, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        return (
+            np.take_along_axis(best_rows, order, axis=1),
+            np.take_along_axis(best_scores, order, axis=1),
+        )
+
+    def search_vectors(
+        self, queries: np.ndarray, k: int = 4, exact: bool | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k rows for a batch of query vectors.
+        :param exact: scan all full-precision rows, ignoring IVF and quantization.
+        :return: (rows, scores) of shape (n_queries, k), padded with -1/-inf.
+        """
+        queries = self._prepare_queries(queries)
+        if self.count == 0:
+            return (
+                np.full((len(queries), k), -1, dtype=np.int64),
+                np.full((len(queries), k), -np.inf, dtype=np.float32),
+            )
+        if exact:
+            return self._search_rows(queries, k)
+        quantized = self.quantizer is not None
+        n_candidates = k * self.rescore if quantized else k
+        if self._ivf is None:
+            rows, scores = self._search_rows(queries, n_candidates, quantized=quantized)
+        else:
+            centroids, order, offsets = self._ivf
+            probes = np.argsort(-(queries @ centroids.T), axis=1)[:, : self.nprobe]
+            tail = np.arange(self._ivf_count, self.count)
+            rows, scores = [], []
+            for query, lists in zip(queries, probes):
+                probed = np.concatenate(
+                    [order[offsets[i] : offsets[i + 1]] for i in lists] + [tail]
+                )
+                found_rows, found_scores = self._search_rows(
+                    query[None, :], n_candidates, probed, quantized
+                )
+                rows.append(found_rows[0])
+                scores.append(found_scores[0])
+            rows, scores = np.stack(rows), np.stack(scores)
+        if not quantized:
+            return rows, scores
+        return self._rescore(queries, rows, k)
+
+    def _rescore(
+        self, queries: np.ndarray, candidates: np.ndarray, k: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Exact top-k among candidate rows, reading only those rows from disk."""
+        rows, scores = [], []
+        for query, found in zip(queries, candidates):
+            found = found[found >= 0]
+            found_rows, found_scores = self._search_rows(query[None, :], k, found)
+            rows.append(found_rows[0])
+            scores.append(found_scores[0])
+        return np.stack(rows), np.stack(scores)
+
+    def build_ivf(
+        self,
+        n_lists: int | None = None,
+        n_iter: int = 10,
+        sample: int = 100_000,
+        seed: int = 0,
+    ) -> None:
+        """
+        Partition the current rows with k-means for approximate search. Rows added
+        later are scanned exactly until build_ivf() is called again.
+        :param n_lists: number of partitions, defaults to 4 * sqrt(count), at most count.
+        :param n_iter: k-means iterations.
+        :param sample: number of rows k-means is trained on.
+        """
+        n = self.count
+        n_lists = n_lists if n_lists else max(1, int(4 * np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        train = self._sample(sample, seed)
+        centroids = kmeans(train, n_lists, n_iter, seed, spherical=True)
+        assign = np.concatenate(
+            [
+                np.argmax(self.vectors[s : s + self.block_size] @ centroids.T, axis=1)
+                for s in range(0, n, self.block_size)
+            ]
+        )
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        sizes = np.bincount(assign, minlength=n_lists)
+        offsets = np.concatenate([[0], np.cumsum(sizes)])
+        np.save(self._file("ivf.centroids.npy"), centroids)
+        np.save(self._file("ivf.order.npy"), order)
+        np.save(self._file("ivf.offsets.npy"), offsets)
+        self.meta["ivf_count"] = n
+        self._write_meta()
+        self._load_ivf()
+
+    def _sample(self, size: int, seed: int = 0) -> np.ndarray:
+        if self.count == 0:
+            raise ValueError(
+                f"LocalVectorStore {self.path} is empty, add vectors before training on them"
+            )
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(self.count, size=min(size, self.count), replace=False)
+        return np.asarray(self.vectors[np.sort(rows)])
+
+    def quantize(
+        self, kind: QUANTIZATIONS, sample: int = 100_000, seed: int = 0, **kwargs: Any
+    ) -> None:
+        """
+        Train a quantizer on the current rows and encode all of them. From then on
+        the first search stage scans the in-memory codes, and only the top
+        k * rescore candidates are read from the full-precision vectors on disk.
+        Rows added later are encoded as they are added.
+        :param kind: "int8", "pq" or "binary", see modules.vector_quantization.
+        :param sample: number of rows the quantizer is trained on.
+        :param kwargs: passed to the quantizer, e.g. m for "pq".
+        """
+        quantizer = make_quantizer(kind, **kwargs)
+        quantizer.train(self._sample(sample, seed))
+        with open(self._file("codes.bin"), "wb") as f:
+            for start in range(0, self.count, self.block_size):
+                quantizer.encode(self.vectors[start : start + self.block_size]).tofile(f)
+        quantizer.save(self._file("quantizer.npz"))
+        self.meta["quantization"] = kind
+        self._write_meta()
+        self._load_quantizer()
+
+    def _load_quantizer(self) -> None:
+        if "quantization" not in self.meta:
+            return
+        self.quantizer = Quantizer.load(self._file("quantizer.npz"))
+        dtype = self.quantizer.encode(np.zeros((1, self.meta["dim"]), np.float32)).dtype
+        self._codes = np.fromfile(self._file("codes.bin"), dtype=dtype).reshape(
+            self.count, -1
+        )
+
+    def _load_ivf(self) -> None:
+        if "ivf_count" not in self.meta:
+            return
+        self._ivf = (
+            np.load(self._file("ivf.centroids.npy")),
+            np.load(self._file("ivf.order.npy"), mmap_mode="r"),
+            np.load(self._file("ivf.offsets.npy")),
+        )
+        self._ivf_count = self.meta["ivf_count"]
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: list[float], k: int = 4, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        rows, scores = self.search_vectors([embedding], k, kwargs.get("exact"))
+        hits = [
+            (row, score)
+            for row, score in zip(rows[0], scores[0])
+            if row >= 0 and score > -np.inf
+        ]
+        docs = self.get_documents(row for row, _ in hits)
+        return [(doc, float(score)) for doc, (_, score) in zip(docs, hits)]
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, **kwargs: Any
+    ) -> list[Document]:
+        hits = self.similarity_search_by_vector_with_score(embedding, k, **kwargs)
+        return [doc for doc, _ in hits]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(
+            self.embedding.embed_query(query), k, **kwargs
+        )
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[Document]:
+        hits = self.similarity_search_with_score(query, k, **kwargs)
+        return [doc for doc, _ in hits]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # scores are already similarities, higher is more relevant
+        return lambda score: score
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: list[dict] | None = None,
+        path: str = "./vectorstore",
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(path, embedding=embedding, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
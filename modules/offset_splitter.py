@@ -0,0 +1,170 @@
+"""
+Offset-based recursive text splitter, the default splitter of Database.
+
+OffsetTextSplitter reproduces the chunk boundaries of
+RecursiveCharacterTextSplitter (with keep_separator=True, its default), but
+works on (start, end) offsets into the source text instead of substrings:
+separators are searched in place with compiled patterns, merging only adds up
+lengths, and each chunk is sliced out of the source exactly once, when its
+Document is created. The offsets are recorded in the chunk metadata so a
+chunk can be traced back to its position in the source document.
+"""
+
+
+from collections.abc import Iterable
+from langchain.text_splitter import TextSplitter
+from langchain_core.documents import Document
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+Span = tuple[int, int]
+
+
+class OffsetTextSplitter(TextSplitter):
+    """
+    Drop-in replacement for RecursiveCharacterTextSplitter.
+
+    With the default length_function (len), lengths are computed from offsets
+    and no substring is created until the chunks are materialized. Any other
+    length_function is called on slices of the pieces being merged.
+    """
+
+    def __init__(
+        self,
+        separators: list[str] | None = None,
+        is_separator_regex: bool = False,
+        start_key: str = "start_index",
+        end_key: str = "end_index",
+        **kwargs,
+    ) -> None:
+        """
+        :param separators: separators tried in order, as in RecursiveCharacterTextSplitter.
+        :param is_separator_regex: whether separators are regular expressions.
+        :param start_key: metadata key of the chunk's start offset in the source text.
+        :param end_key: metadata key of the chunk's end offset in the source text.
+        """
+        if not kwargs.get("keep_separator", True):
+            raise ValueError(
+                "OffsetTextSplitter keeps separators, chunks must be contiguous spans"
+            )
+        super().__init__(**kwargs)
+        self._separators = separators or ["\n\n", "\n", " ", ""]
+        self._patterns = [
+            re.compile(s if is_separator_regex else re.escape(s)) if s else None
+            for s in self._separators
+        ]
+        self.start_key = start_key
+        self.end_key = end_key
+
+    def _length(self, text: str, start: int, end: int) -> int:
+        if self._length_function is len:
+            return end - start
+        return self._length_function(text[start:end])
+
+    def _strip(self, text: str, start: int, end: int) -> Span:
+        if self._strip_whitespace:
+            while start < end and text[start].isspace():
+                start += 1
+            while end > start and text[end - 1].isspace():
+                end -= 1
+        return start, end
+
+    def _pieces(
+        self, text: str, start: int, end: int, level: int
+    ) -> tuple[list[Span], int]:
+        """
+        Cut text[start:end] before every match of the first separator found in it.
+        :return: the non-empty pieces and the level of the separator used
+        """
+        for i in range(level, len(self._patterns)):
+            pattern = self._patterns[i]
+            if pattern is None:
+                # like RecursiveCharacterTextSplitter, never recurse past ""
+                return [(j, j + 1) for j in range(start, end)], len(self._patterns) - 1
+            cuts = [m.start() for m in pattern.finditer(text, start, end)]
+            if cuts:
+                bounds = [start] + cuts + [end]
+                pieces = [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+                return pieces, i
+        # no separator matched and "" is not a separator
+        return [(start, end)], len(self._patterns) - 1
+
+    def _merge(self, text: str, pieces: list[Span], lengths: list[int]) -> list[Span]:
+        """RecursiveCharacterTextSplitter._merge_splits() on contiguous pieces."""
+        chunks = []
+        first = 0  # index of the first piece of the current chunk
+        total = 0
+        for i, ((_, end), length) in enumerate(zip(pieces, lengths)):
+            if total + length > self._chunk_size:
+                if total > self._chunk_size:
+                    logger.warning(
+                        f"Created a chunk of size {total}, "
+                        f"which is longer than the specified {self._chunk_size}"
+                    )
+                if first < i:
+                    span = self._strip(text, pieces[first][0], pieces[i - 1][1])
+                    if span[0] < span[1]:
+                        chunks.append(span)
+                    while total > self._chunk_overlap or (
+                        total + length > self._chunk_size and total > 0
+                    ):
+                        total -= lengths[first]
+                        first += 1
+            total += length
+        if first < len(pieces):
+            span = self._strip(text, pieces[first][0], pieces[-1][1])
+            if span[0] < span[1]:
+                chunks.append(span)
+        return chunks
+
+    def _split(self, text: str, start: int, end: int, level: int) -> list[Span]:
+        pieces, level = self._pieces(text, start, end, level)
+        chunks = []
+        good, good_lengths = [], []
+        for a, b in pieces:
+            length = self._length(text, a, b)
+            if length < self._chunk_size:
+                good.append((a, b))
+                good_lengths.append(length)
+                continue
+            if good:
+                chunks.extend(self._merge(text, good, good_lengths))
+                good, good_lengths = [], []
+            if level + 1 >= len(self._patterns):
+                chunks.append((a, b))
+            else:
+                chunks.extend(self._split(text, a, b, level + 1))
+        if good:
+            chunks.extend(self._merge(text, good, good_lengths))
+        return chunks
+
+    def split_spans(self, text: str) -> list[Span]:
+        """:return: (start, end) offsets of the chunks of text."""
+        return self._split(text, 0, len(text), 0)
+
+    def split_text(self, text: str) -> list[str]:
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def create_documents(
+        self, texts: list[str], metadatas: list[dict] | None = None
+    ) -> list[Document]:
+        metadatas = metadatas if metadatas else [{}] * len(texts)
+        documents = []
+        for text, metadata in zip(texts, metadatas):
+            for start, end in self.split_spans(text):
+                documents.append(
+                    Document(
+                        page_content=text[start:end],
+                        metadata={**metadata, self.start_key: start, self.end_key: end},
+                    )
+                )
+        return documents
+
+    def split_documents(self, documents: Iterable[Document]) -> list[Document]:
+        texts, metadatas = [], []
+        for document in documents:
+            texts.append(document.page_content)
+            metadatas.append(document.metadata)
+        return self.create_documents(texts, metadatas)
@@ -0,0 +1,200 @@
+"""
+Byte-offset index of the records of JSONL corpus files.
+
+JsonlParser records (record key, byte offset, length) of every line it parses
+and tags each chunk with the key of its record, so the full source record of
+a retrieved chunk is one seek and one decode away:
+
+    index = RecordIndex("./data/records/", key="doi")
+    parser = JsonlParser(content_func, metadata_func, record_index=index)
+    ...
+    index.get(chunk.metadata["record_id"])
+
+Layout of the index directory:
+
+    segments/<sha1(file)[:16]>.npz  keys, offsets and lengths of one file,
+                                    rewritten when the file is parsed again
+    keys.npy                        sorted 64-bit key hashes, memory-mapped
+    files.npy offsets.npy lengths.npy
+                                    location of the record of each key
+    files.json                      file paths, indexed by files.npy
+
+Segments are written by the parser, also from pipeline worker processes, and
+merged into the memory-mapped arrays when the index is opened or refreshed.
+"""
+
+
+from collections.abc import Callable, Iterable
+from langchain_community.document_loaders.blob_loaders.schema import Blob
+from .compressed_io import blob_compression, open_blob
+import hashlib
+import json
+import numpy as np
+import os
+
+
+def key_hash(key) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "little"
+    )
+
+
+class RecordIndex:
+    """
+    Map record keys to (file, byte offset, length).
+
+    Keys are stored as 64-bit hashes; get() checks the key of the decoded
+    record, so a hash collision or a stale entry returns None instead of the
+    wrong record.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        key: str | Callable[[dict], object] = "id",
+        loads: Callable[[bytes], dict] = json.loads,
+    ) -> None:
+        """
+        :param path: index directory, created if missing.
+        :param key: record field, or function of the record, whose value identifies the record.
+        :param loads: JSON decoder used by get().
+        """
+        self.path = path
+        self.key = key
+        self.loads = loads
+        os.makedirs(os.path.join(path, "segments"), exist_ok=True)
+        self.refresh()
+
+    def key_of(self, record: dict):
+        return self.key(record) if callable(self.key) else record[self.key]
+
+    def _segment_path(self, file: str) -> str:
+        name = hashlib.sha1(os.path.abspath(file).encode()).hexdigest()[:16]
+        return os.path.join(self.path, "segments", f"{name}.npz")
+
+    def write_segment(
+        self, file: str, entries: Iterable[tuple[object, int, int]]
+    ) -> None:
+        """
+        Replace the entries of file.
+        :param entries: (record key, byte offset, length) of the records of file.
+        """
+        keys, offsets, lengths = [], [], []
+        for key, offset, length in entries:
+            keys.append(key_hash(key))
+            offsets.append(offset)
+            lengths.append(length)
+        target = self._segment_path(file)
+        # np.savez appends .npz to names without it
+        tmp = f"{target}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp,
+            path=np.array(os.path.abspath(file)),
+            keys=np.array(keys, dtype=np.uint64),
+            offsets=np.array(offsets, dtype=np.uint64),
+            lengths=np.array(lengths, dtype=np.uint32),
+        )
+        os.replace(tmp, target)
+
+    def _segments(self) -> list[str]:
+        segments = os.path.join(self.path, "segments")
+        return sorted(
+            os.path.join(segments, name)
+            for name in os.listdir(segments)
+            if name.endswith(".npz") and ".tmp." not in name
+        )
+
+    def _stale(self) -> bool:
+        keys = os.path.join(self.path, "keys.npy")
+        if not os.path.exists(keys):
+            return True
+        built = os.path.getmtime(keys)
+        segments = self._segments()
+        if any(os.path.getmtime(segment) > built for segment in segments):
+            return True
+        with open(os.path.join(self.path, "files.json")) as f:
+            return len(json.load(f)) != len(segments)
+
+    def _build(self) -> None:
+        files, keys, file_ids, offsets, lengths = [], [], [], [], []
+        for name in self._segments():
+            with np.load(name) as segment:
+                keys.append(segment["keys"])
+                offsets.append(segment["offsets"])
+                lengths.append(segment["lengths"])
+                file_ids.append(np.full(len(segment["keys"]), len(files), np.uint32))
+                files.append(str(segment["path"]))
+        keys = np.concatenate(keys) if keys else np.zeros(0, np.uint64)
+        order = np.argsort(keys, kind="stable")
+        arrays = {
+            "keys": keys,
+            "files": np.concatenate(file_ids) if file_ids else np.zeros(0, np.uint32),
+            "offsets": np.concatenate(offsets) if offsets else np.zeros(0, np.uint64),
+            "lengths": np.concatenate(lengths) if lengths else np.zeros(0, np.uint32),
+        }
+        with open(os.path.join(self.path, "files.json.tmp"), "w") as f:
+            json.dump(files, f)
+        os.replace(
+            os.path.join(self.path, "files.json.tmp"),
+            os.path.join(self.path, "files.json"),
+        )
+        # Replace rather than overwrite files that may be memory-mapped;
+        # keys.npy goes last, its mtime marks the build.
+        for name in ["files", "offsets", "lengths", "keys"]:
+            target = os.path.join(self.path, f"{name}.npy")
+            np.save(f"{target}.tmp.npy", arrays[name][order])
+            os.replace(f"{target}.tmp.npy", target)
+
+    def refresh(self) -> None:
+        """Merge new segments, then memory-map the index."""
+        if self._stale():
+            self._build()
+        self._keys, self._files, self._offsets, self._lengths = (
+            np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+            for name in ["keys", "files", "offsets", "lengths"]
+        )
+        with open(os.path.join(self.path, "files.json")) as f:
+            self.files = json.load(f)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def locate(self, key) -> list[tuple[str, int, int]]:
+        """:return: (file, byte offset, length) of every entry whose key hash matches."""
+        h = np.uint64(key_hash(key))
+        start = int(np.searchsorted(self._keys, h, side="left"))
+        stop = int(np.searchsorted(self._keys, h, side="right"))
+        return [
+            (
+                self.files[self._files[i]],
+                int(self._offsets[i]),
+                int(self._lengths[i]),
+            )
+            for i in range(start, stop)
+        ]
+
+    def _read(self, file: str, offset: int, length: int) -> bytes:
+        blob = Blob.from_path(file)
+        if blob_compression(blob) is None:
+            with open(file, "rb") as f:
+                f.seek(offset)
+                return f.read(length)
+        # offsets of compressed files are in the decompressed stream
+        with open_blob(blob) as f:
+            while offset > 0:
+                skipped = len(f.read(min(offset, 1 << 20)))
+                if not skipped:
+                    return b""
+                offset -= skipped
+            return f.read(length)
+
+    def get(self, key) -> dict | None:
+        """:return: the record with this key, or None."""
+        for file, offset, length in self.locate(key):
+            try:
+                record = self.loads(self._read(file, offset, length))
+                if str(self.key_of(record)) == str(key):
+                    return record
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+        return None
@@ -0,0 +1,258 @@
+"""
+Retrieval quality and latency benchmark.
+
+Runs a labelled query set against retrieval backends and reports, for each
+backend, recall@k and MRR, and the latency percentiles and QPS of the query
+set at several concurrency levels:
+
+    queries = load_queries("./data/queries.jsonl")
+    results = run_benchmark(
+        {"bm25": BM25IndexRetriever(index=...), "vector": store.as_retriever(), "db": db.retrieve},
+        queries,
+        key="title",
+        corpus=snapshot_id("./data/240229-10k/"),
+    )
+    write_results(results, "./benchmarks/retrieval.json")
+    print(compare(read_results("./benchmarks/baseline.json"), results))
+
+A backend is a retriever or a function from query to documents. The query
+set is a JSONL file of {"query": str, "relevant": [key, ...]} lines, where
+the keys identify relevant documents by a metadata field (key), e.g. the
+title of the relevant papers or the chunk_id of the relevant chunks.
+Several chunks with the same key count once.
+
+The results are plain JSON, so runs on the same corpus snapshot can be
+compared with compare() or any other tool.
+"""
+
+
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+import datetime
+import hashlib
+import json
+import numpy as np
+import os
+import platform
+import subprocess
+import time
+
+
+def load_queries(path: str) -> list[dict]:
+    """:return: [{"query", "relevant"}] of a JSONL query set."""
+    queries = []
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            queries.append(
+                {"query": record["query"], "relevant": list(record["relevant"])}
+            )
+    return queries
+
+
+def snapshot_id(path: str) -> str:
+    """:return: hash of the relative paths and sizes of the files under path."""
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file = os.path.join(root, name)
+            digest.update(
+                f"{os.path.relpath(file, path)}\0{os.path.getsize(file)}\n".encode()
+            )
+    return digest.hexdigest()[:16]
+
+
+def _keys(documents: list[Document], key: str | Callable[[Document], str]) -> list:
+    """Keys of documents, in order, without repeats."""
+    keys = []
+    for document in documents:
+        value = key(document) if callable(key) else document.metadata.get(key)
+        if value is not None and value not in keys:
+            keys.append(value)
+    return keys
+
+
+def recall_at_k(retrieved: list, relevant: Iterable, k: int) -> float:
+    relevant = set(relevant)
+    if not relevant:
+        return 0.0
+    return len(relevant.intersection(retrieved[:k])) / len(relevant)
+
+
+def reciprocal_rank(retrieved: list, relevant: Iterable, k: int) -> float:
+    relevant = set(relevant)
+    for rank, key in enumerate(retrieved[:k], start=1):
+        if key in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def _search_func(backend) -> Callable[[str], list[Document]]:
+    if isinstance(backend, BaseRetriever):
+        return backend.invoke
+    return backend
+
+
+def _timed(search: Callable[[str], list[Document]], query: str) -> tuple:
+    start = time.perf_counter()
+    documents = search(query)
+    return time.perf_counter() - start, documents
+
+
+def _run_level(
+    search: Callable[[str], list[Document]], queries: list[str], concurrency: int
+) -> tuple[dict, list[list[Document]]]:
+    start = time.perf_counter()
+    if concurrency == 1:
+        timed = [_timed(search, query) for query in queries]
+    else:
+        with ThreadPoolExecutor(concurrency) as executor:
+            timed = list(executor.map(lambda query: _timed(search, query), queries))
+    elapsed = time.perf_counter() - start
+    latencies = np.array([latency for latency, _ in timed]) * 1000
+    stats = {
+        "qps": len(queries) / elapsed,
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+    return stats, [documents for _, documents in timed]
+
+
+def run_backend(
+    backend,
+    queries: list[dict],
+    k: int = 10,
+    key: str | Callable[[Document], str] = "chunk_id",
+    concurrency: Iterable[int] = (1, 4, 16),
+    warmup: int = 5,
+) -> dict:
+    """
+    :param backend: retriever, or function from query to documents.
+    :param key: metadata field, or function of a document, matched against the relevant keys.
+    :param concurrency: numbers of queries in flight, each level runs the whole query set.
+    :param warmup: queries run before measuring, e.g. to load models and open connections.
+    :return: {"recall@k", "mrr", "concurrency": {level: {"qps", "mean_ms", "p50_ms", "p95_ms", "p99_ms"}}}
+    """
+    search = _search_func(backend)
+    texts = [query["query"] for query in queries]
+    for query in texts[:warmup]:
+        search(query)
+    levels, results = {}, None
+    for level in concurrency:
+        levels[str(level)], documents = _run_level(search, texts, level)
+        if results is None:
+            results = documents
+    recalls, ranks = [], []
+    for query, documents in zip(queries, results or []):
+        retrieved = _keys(documents, key)
+        recalls.append(recall_at_k(retrieved, query["relevant"], k))
+        ranks.append(reciprocal_rank(retrieved, query["relevant"], k))
+    return {
+        f"recall@{k}": float(np.mean(recalls)) if recalls else 0.0,
+        "mrr": float(np.mean(ranks)) if ranks else 0.0,
+        "concurrency": levels,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    backends: dict,
+    queries: list[dict],
+    k: int = 10,
+    key: str | Callable[[Document], str] = "chunk_id",
+    concurrency: Iterable[int] = (1, 4, 16),
+    corpus: str | None = None,
+    warmup: int = 5,
+) -> dict:
+    """
+    Run run_backend() for every backend.
+    :param backends: {name: retriever or function from query to documents}.
+    :param corpus: id of the corpus snapshot, e.g. snapshot_id(), compare() refuses to compare different snapshots.
+    :return: {"meta": {...}, "backends": {name: run_backend() results}}
+    """
+    concurrency = list(concurrency)
+    meta = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "corpus": corpus,
+        "queries": len(queries),
+        "k": k,
+        "concurrency": concurrency,
+    }
+    results = {
+        name: run_backend(backend, queries, k, key, concurrency, warmup)
+        for name, backend in backends.items()
+    }
+    return {"meta": meta, "backends": results}
+
+
+def write_results(results: dict, path: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def read_results(path: str) -> dict:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _rows(results: dict) -> dict[tuple[str, str], float]:
+    """{(backend, metric): value} of results, latency metrics as "<metric>@c<level>"."""
+    rows = {}
+    for name, backend in results["backends"].items():
+        for metric, value in backend.items():
+            if metric == "concurrency":
+                for level, stats in value.items():
+                    for stat, number in stats.items():
+                        rows[(name, f"{stat}@c{level}")] = number
+            else:
+                rows[(name, metric)] = value
+    return rows
+
+
+def format_results(results: dict) -> str:
+    lines = [f"{'backend':20s} {'metric':16s} {'value':>10s}"]
+    for (name, metric), value in _rows(results).items():
+        lines.append(f"{name:20s} {metric:16s} {value:10.4f}")
+    return "\n".join(lines)
+
+
+def compare(baseline: dict, current: dict) -> str:
+    """:return: table of the metrics of both runs and their relative change."""
+    if baseline["meta"].get("corpus") != current["meta"].get("corpus"):
+        raise ValueError(
+            f"runs are on different corpus snapshots: "
+            f"{baseline['meta'].get('corpus')} and {current['meta'].get('corpus')}"
+        )
+    before, after = _rows(baseline), _rows(current)
+    lines = [
+        f"{'backend':20s} {'metric':16s} {'baseline':>10s} {'current':>10s} {'change':>8s}"
+    ]
+    for row in after:
+        if row not in before:
+            continue
+        old, new = before[row], after[row]
+        change = f"{(new - old) / old:+8.1%}" if old else f"{'':>8s}"
+        lines.append(f"{row[0]:20s} {row[1]:16s} {old:10.4f} {new:10.4f} {change}")
+    return "\n".join(lines)
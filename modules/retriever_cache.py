@@ -0,0 +1,401 @@
+"""
+Result cache for retrievers.
+
+Agents often send the same query, or a slightly reworded one, a few seconds
+apart. CachedRetriever answers those from a RetrievalCache instead of
+searching again:
+
+    cache = RetrievalCache(ttl=300, path="./cache/retrieval.sqlite", embedding=embedding)
+    retriever = CachedRetriever(retriever=ESQueryRetriever(index=...), cache=cache)
+
+Tiers, checked in order:
+
+    memory      {normalized query: documents}, LRU with max_entries and ttl
+    disk        optional SQLite file with ttl, shared by processes
+    semantic    optional, the documents of a cached query whose embedding has
+                a cosine similarity of at least similarity_threshold
+
+Entries are namespaced by the search configuration of the retriever (class,
+index, k, fields, search type, ...), so one cache can serve several
+retrievers. Wrap the embedding model in CachedEmbeddings when
+the vector store retriever uses the same model, so a semantic miss does not
+embed the query twice.
+"""
+
+
+from collections import OrderedDict
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from typing import List, Optional
+import hashlib
+import json
+import numpy as np
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+def normalize_query(query: str) -> str:
+    """:return: query in NFKC form, lowercased, with whitespace runs collapsed."""
+    return " ".join(unicodedata.normalize("NFKC", query).lower().split())
+
+
+# retriever fields that don't change the results
+_UNCONFIGURED = {"callbacks", "callback_manager", "tags", "metadata", "verbose", "name"}
+# attributes naming the data or model behind an object, e.g. a vector store or embeddings
+_IDENTIFYING = ("index_name", "collection_name", "path", "model_name")
+
+
+def _config(value):
+    """JSON-like form of a retriever field, objects reduced to their class and identifying attributes."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, BaseRetriever):
+        return retriever_config(value)
+    if isinstance(value, dict):
+        return {str(key): _config(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [_config(item) for item in value]
+    config = {"class": type(value).__name__}
+    for name in _IDENTIFYING:
+        attribute = getattr(value, name, None)
+        if isinstance(attribute, str):
+            config[name] = attribute
+    return config
+
+
+def retriever_config(retriever: BaseRetriever) -> dict:
+    """:return: the fields of a retriever that decide its results, e.g. index, k, fields, search_kwargs."""
+    config = {"class": type(retriever).__name__}
+    for key, value in vars(retriever).items():
+        if key not in _UNCONFIGURED and not key.startswith("_"):
+            config[key] = _config(value)
+    return config
+
+
+def retriever_namespace(retriever: BaseRetriever) -> str:
+    """
+    :return: "<class>:<index>:<k>:<hash of retriever_config()>", so retrievers
+        that differ in any search option, e.g. fields or search_type, never share entries.
+    """
+    index = getattr(retriever, "index", None)
+    k = getattr(retriever, "k", None)
+    vectorstore = getattr(retriever, "vectorstore", None)
+    if vectorstore is not None:
+        index = getattr(vectorstore, "index_name", None) or getattr(
+            vectorstore, "path", None
+        )
+        k = retriever.search_kwargs.get("k", 4)
+    if not isinstance(index, str):
+        index = getattr(index, "path", None)
+    encoded = json.dumps(retriever_config(retriever), sort_keys=True, default=str)
+    digest = hashlib.sha1(encoded.encode("utf8")).hexdigest()[:16]
+    return f"{type(retriever).__name__}:{index}:{k}:{digest}"
+
+
+def _copy(documents: List[Document]) -> List[Document]:
+    # callers may change the metadata of the documents they get
+    return [
+        Document(page_content=document.page_content, metadata=dict(document.metadata))
+        for document in documents
+    ]
+
+
+class RetrievalCache:
+    """
+    Exact, on-disk and semantic tiers of cached retrieval results.
+
+    hits, disk_hits and semantic_hits count the lookups answered by each tier,
+    misses the lookups answered by none, see stats(). With a semantic tier,
+    a miss is counted by get_similar(), which follows a miss of get().
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        max_entries: int = 1024,
+        path: str | None = None,
+        embedding: Embeddings | None = None,
+        similarity_threshold: float = 0.95,
+        semantic_entries: int = 256,
+    ) -> None:
+        """
+        :param ttl: seconds a result stays valid in every tier.
+        :param max_entries: results kept in memory, least recently used are evicted.
+        :param path: sqlite file of the shared on-disk tier, created if missing, no disk tier if None.
+        :param embedding: model embedding queries for the semantic tier, no semantic tier if None.
+        :param similarity_threshold: minimum cosine similarity of a semantic hit.
+        :param semantic_entries: query embeddings kept per namespace.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.embedding = embedding
+        self.similarity_threshold = similarity_threshold
+        self.semantic_entries = semantic_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        # (namespace, query): (expiry, documents)
+        self._memory: OrderedDict[tuple, tuple[float, List[Document]]] = OrderedDict()
+        # namespace: {query: (expiry, unit vector, documents)}
+        self._semantic: dict[str, OrderedDict] = {}
+        self._matrices: dict[str, tuple[list, np.ndarray]] = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        if path is not None:
+            self._connection()
+
+    def _connection(self) -> sqlite3.Connection:
+        # A connection must not be used across fork, reopen in worker processes.
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=60)
+            self._conn.executescript(
+                """
+                PRAGMA journal_mode = WAL;
+                PRAGMA synchronous = NORMAL;
+                CREATE TABLE IF NOT EXISTS results (
+                    namespace TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    expires REAL NOT NULL,
+                    documents TEXT NOT NULL,
+                    PRIMARY KEY (namespace, query)
+                );
+                CREATE INDEX IF NOT EXISTS results_expires ON results (expires);
+                """
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    def _memory_get(self, key: tuple, now: float) -> List[Document] | None:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return entry[1]
+
+    def _memory_put(self, key: tuple, expires: float, documents: List[Document]) -> None:
+        self._memory[key] = (expires, documents)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: tuple, now: float) -> tuple[float, List[Document]] | None:
+        row = self._connection().execute(
+            "SELECT expires, documents FROM results "
+            "WHERE namespace = ? AND query = ? AND expires > ?",
+            (*key, now),
+        ).fetchone()
+        if row is None:
+            return None
+        documents = [
+            Document(page_content=content, metadata=metadata)
+            for content, metadata in json.loads(row[1])
+        ]
+        return row[0], documents
+
+    def _disk_put(self, key: tuple, expires: float, documents: List[Document]) -> None:
+        encoded = json.dumps(
+            [[document.page_content, document.metadata] for document in documents],
+            ensure_ascii=False,
+            default=str,
+        )
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+            (*key, expires, encoded),
+        )
+        conn.execute("DELETE FROM results WHERE expires <= ?", (time.time(),))
+        conn.commit()
+
+    def _unit(self, vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _semantic_get(
+        self, namespace: str, vector: np.ndarray, now: float
+    ) -> List[Document] | None:
+        entries = self._semantic.get(namespace)
+        if not entries:
+            return None
+        cached = self._matrices.get(namespace)
+        if cached is None:
+            cached = (list(entries), np.stack([entry[1] for entry in entries.values()]))
+            self._matrices[namespace] = cached
+        queries, matrix = cached
+        similarities = matrix @ vector
+        for i in np.argsort(-similarities):
+            if similarities[i] < self.similarity_threshold:
+                return None
+            expires, _, documents = entries[queries[i]]
+            if expires > now:
+                return documents
+        return None
+
+    def _semantic_put(
+        self,
+        namespace: str,
+        query: str,
+        vector: np.ndarray,
+        expires: float,
+        documents: List[Document],
+    ) -> None:
+        entries = self._semantic.setdefault(namespace, OrderedDict())
+        entries[query] = (expires, vector, documents)
+        entries.move_to_end(query)
+        now = time.time()
+        for stale in [query for query, entry in entries.items() if entry[0] <= now]:
+            del entries[stale]
+        while len(entries) > self.semantic_entries:
+            entries.popitem(last=False)
+        self._matrices.pop(namespace, None)
+
+    def get(self, namespace: str, query: str) -> List[Document] | None:
+        """
+        Look a normalized query up in the memory and disk tiers.
+        :return: a copy of the cached documents, None on a miss.
+        """
+        key = (namespace, query)
+        now = time.time()
+        with self._lock:
+            documents = self._memory_get(key, now)
+            if documents is not None:
+                self.hits += 1
+                return _copy(documents)
+            if self.path is not None:
+                entry = self._disk_get(key, now)
+                if entry is not None:
+                    self._memory_put(key, *entry)
+                    self.disk_hits += 1
+                    return _copy(entry[1])
+            if self.embedding is None:
+                self.misses += 1
+        return None
+
+    def get_similar(
+        self, namespace: str, vector: List[float]
+    ) -> List[Document] | None:
+        """
+        Look a query embedding up in the semantic tier.
+        :return: a copy of the documents of the most similar cached query, None on a miss.
+        """
+        with self._lock:
+            documents = self._semantic_get(namespace, self._unit(vector), time.time())
+            if documents is None:
+                self.misses += 1
+                return None
+            self.semantic_hits += 1
+            return _copy(documents)
+
+    def put(
+        self,
+        namespace: str,
+        query: str,
+        documents: List[Document],
+        vector: List[float] | None = None,
+    ) -> None:
+        key = (namespace, query)
+        expires = time.time() + self.ttl
+        documents = _copy(documents)
+        with self._lock:
+            self._memory_put(key, expires, documents)
+            if self.path is not None:
+                self._disk_put(key, expires, documents)
+            if vector is not None:
+                self._semantic_put(
+                    namespace, query, self._unit(vector), expires, documents
+                )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._semantic.clear()
+            self._matrices.clear()
+            if self.path is not None:
+                self._connection().execute("DELETE FROM results")
+                self._conn.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.semantic_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+            "entries": len(self._memory),
+        }
+
+    def close(self) -> None:
+        if self.path is not None:
+            self._conn.close()
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    Serve the results of a retriever from a RetrievalCache.
+
+    namespace defaults to retriever_namespace(retriever).
+    """
+
+    retriever: BaseRetriever
+    cache: RetrievalCache
+    namespace: Optional[str] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _namespace(self) -> str:
+        return self.namespace or retriever_namespace(self.retriever)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        namespace, key = self._namespace(), normalize_query(query)
+        embedding = self.cache.embedding
+        documents = self.cache.get(namespace, key)
+        if documents is not None:
+            return documents
+        vector = None
+        if embedding is not None:
+            vector = embedding.embed_query(query)
+            documents = self.cache.get_similar(namespace, vector)
+            if documents is not None:
+                return documents
+        documents = self.retriever.invoke(
+            query, {"callbacks": run_manager.get_child()}
+        )
+        self.cache.put(namespace, key, documents, vector)
+        return documents
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        namespace, key = self._namespace(), normalize_query(query)
+        embedding = self.cache.embedding
+        documents = self.cache.get(namespace, key)
+        if documents is not None:
+            return documents
+        vector = None
+        if embedding is not None:
+            vector = await embedding.aembed_query(query)
+            documents = self.cache.get_similar(namespace, vector)
+            if documents is not None:
+                return documents
+        documents = await self.retriever.ainvoke(
+            query, {"callbacks": run_manager.get_child()}
+        )
+        self.cache.put(namespace, key, documents, vector)
+        return documents
@@ -1,6 +1,12 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import asyncio
+import functools
 import requests
-from typing import Literal, Optional
+from typing import Callable, Literal, Optional
 import re
+import threading
+import time
+import urllib3
 import wikipediaapi
 
 from duckduckgo_search import DDGS
@@ -18,6 +24,84 @@ search_url = {
     "bing": "https://www.bing.com/search?q="
 }
 SEARCH_ENGINES = Literal["baidu", "duckduckgo", "wikipedia", "bing"]
+# seconds allowed for one request, and for a whole search
+REQUEST_TIMEOUT = 5.0
+SEARCH_DEADLINE = 10.0
+# bytes of a response body read at most, the text of a page is cut to ~1000 chars anyway
+MAX_RESPONSE_BYTES = 1 << 20
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(32, thread_name_prefix="web-search")
+        return _executor
+
+
+def _first_results(
+    tasks: list[Callable[[], Optional[dict]]], max_results: int, deadline: float
+) -> list:
+    """
+    run tasks concurrently, and return as soon as max_results of them returned a result.
+    :param tasks: functions returning a result dictionary, or None if they found nothing.
+    :param deadline: time.monotonic() after which the tasks still running are abandoned.
+    :return: the results, in the order of tasks.
+    """
+    futures = {_get_executor().submit(task): i for i, task in enumerate(tasks)}
+    results = {}
+    pending = set(futures)
+    while pending and len(results) < max_results:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception:
+                continue
+            if result:
+                results[futures[future]] = result
+    for future in pending:
+        # fetches already running stop reading at their own timeout, see _get_text
+        future.cancel()
+    return [results[i] for i in sorted(results)][:max_results]
+
+
+def _timeout(request_timeout: float, deadline: float) -> float:
+    """:return: timeout of a request that must end before deadline."""
+    return max(min(request_timeout, deadline - time.monotonic()), 0.001)
+
+
+def _get_text(url: str, timeout: float, **kwargs) -> tuple[int, dict, str]:
+    """
+    GET url, and read its body until timeout seconds have passed or
+    MAX_RESPONSE_BYTES are read, whichever comes first.
+    The timeout of requests only bounds each socket read, so a page sent
+    slowly would otherwise hold its worker thread long after the search ended.
+    :return: status code, headers and text of the response.
+    """
+    deadline = time.monotonic() + timeout
+    with requests.get(url, timeout=timeout, stream=True, **kwargs) as response:
+        # read1 returns what one socket read gives instead of waiting for a full block
+        read = getattr(response.raw, "read1", response.raw.read)
+        chunks, size = [], 0
+        try:
+            while size < MAX_RESPONSE_BYTES and time.monotonic() < deadline:
+                chunk = read(1 << 14, decode_content=True)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+        except urllib3.exceptions.HTTPError as e:
+            # raised by raw reads, requests only wraps them in iter_content
+            raise requests.ConnectionError(e) from e
+        text = b"".join(chunks).decode(response.encoding or "utf-8", errors="replace")
+        return response.status_code, response.headers, text
 
 
 def web_search(
@@ -25,6 +109,8 @@ def web_search(
     search_engine: SEARCH_ENGINES = "bing",
     search_site: str | None = None,
     max_results: int = 2,
+    request_timeout: float = REQUEST_TIMEOUT,
+    deadline: float = SEARCH_DEADLINE,
 ) -> list:
     """
     get web search results, and return a list of dictionaries, each consists of title, href and body
@@ -32,21 +118,34 @@ def web_search(
     :param search_engine: 'baidu' and 'duckduckgo' is available
     :param search_site: specific the site you want to search on
     :param max_results: mark the maximum number of web search results.
+    :param request_timeout: seconds allowed for each request.
+    :param deadline: seconds allowed for the whole bing or baidu search, results found by then are returned.
     :return: list of dictionaries, [{'title', 'href', 'body'}]
     """
     if search_engine == "baidu":
         result = baidu_search(
-            search=search, search_site=search_site, search_max_results=max_results
+            search=search,
+            search_site=search_site,
+            search_max_results=max_results,
+            request_timeout=request_timeout,
+            deadline=deadline,
         )
     elif search_engine == "duckduckgo":
         result = ddg_search(
             search=search, search_site=search_site, search_max_results=max_results
         )
     elif search_engine == "wikipedia":
-        result = wikipedia_search(search=search, search_max_results=max_results)
+        result = wikipedia_search(
+            search=search,
+            search_max_results=max_results,
+            request_timeout=request_timeout,
+        )
     elif search_engine == "bing":
         result = bing_search(
-            search=search, search_max_results=max_results
+            search=search,
+            search_max_results=max_results,
+            request_timeout=request_timeout,
+            deadline=deadline,
         )
     return result
 
@@ -54,16 +153,22 @@ def url_response_parse(
     url: str,
     header = default_headers,
     max_result_length: int = 1000,
+    timeout: float = REQUEST_TIMEOUT,
 ) -> Optional[str]:
     """
     parse the html page from input url, and get a long string of page content.
     :param url: string of html page.
     :param headers: User-Agent
     :param max_result_length: interger that used to mark the maximum length of result
+    :param timeout: seconds allowed for the request.
     :return: string of page text content.
     """
-    html = requests.get(url, headers=header)
-    soup = BeautifulSoup(html.text, 'html.parser')
+    _, _, html = _get_text(url, timeout, headers=header)
+    return _page_text(html, max_result_length)
+
+
+def _page_text(html: str, max_result_length: int = 1000) -> str:
+    soup = BeautifulSoup(html, 'html.parser')
 
     result_list = soup.find_all('p')
     result = "\n".join(r.text for r in result_list)
@@ -77,6 +182,8 @@ def baidu_search(
     search_site: str = None,
     search_max_results: int = 1,
     max_retry=3,
+    request_timeout: float = REQUEST_TIMEOUT,
+    deadline: float = SEARCH_DEADLINE,
 ) -> list:
     """
     get web search results given by baidu, and get a list of web search results, each consists of title, url and text content.
@@ -84,16 +191,32 @@ def baidu_search(
     :param headers: User-Agent
     :param search_site: specific the site you want to search on
     :param search_max_results: integer that used to mark the maxixum number of search results.
+    :param request_timeout: seconds allowed for each request.
+    :param deadline: seconds allowed for the whole search, results found by then are returned.
     :return: list of dictionaries, each consists of title, href, body.
     """
     url = search_url["baidu"]
     query = search if search_site is None else f"site:{search_site} " + search
+    deadline_at = time.monotonic() + deadline
 
     for _ in range(max_retry):
-        response = requests.get(url=url + query, headers=headers)
-        if response.status_code != 200:
+        if time.monotonic() >= deadline_at:
+            break
+        try:
+            status, _, html = _get_text(
+                url + query, _timeout(request_timeout, deadline_at), headers=headers
+            )
+        except requests.RequestException:
+            continue
+        if status != 200:
             continue
-        return _baidu_response_parse(response.text, search_site, search_max_results)
+        return _baidu_response_parse(
+            html,
+            search_site,
+            search_max_results,
+            request_timeout,
+            deadline_at - time.monotonic(),
+        )
 
     return []
 
@@ -102,21 +225,39 @@ def bing_search(
     header = default_headers,
     search_max_results: int = 1,
     max_retry = 3,
+    request_timeout: float = REQUEST_TIMEOUT,
+    deadline: float = SEARCH_DEADLINE,
 ) -> list:
     """
     get web search results given by bing, and get a list of web search results, each consists of title, url and text content.
     :param search: query
     :param headers: User-Agent
     :param search_max_results: integer that used to mark the maxixum number of search results.
+    :param request_timeout: seconds allowed for each request.
+    :param deadline: seconds allowed for the whole search, results found by then are returned.
     :return: list of dictionaries, each consists of title, href, body.
     """
     url = search_url["bing"]
+    deadline_at = time.monotonic() + deadline
 
     for _ in range(max_retry):
-        response = requests.get(url=url + search, headers=header)
-        if response.status_code != 200:
+        if time.monotonic() >= deadline_at:
+            break
+        try:
+            status, _, html = _get_text(
+                url + search, _timeout(request_timeout, deadline_at), headers=header
+            )
+        except requests.RequestException:
+            continue
+        if status != 200:
             continue
-        return _bing_response_parse(html = response.text, search_max_results=search_max_results)
+        return _bing_response_parse(
+            html=html,
+            header=header,
+            search_max_results=search_max_results,
+            request_timeout=request_timeout,
+            deadline=deadline_at - time.monotonic(),
+        )
     return []
 
 def wikipedia_search(
@@ -124,30 +265,33 @@ def wikipedia_search(
     search_max_results: int = 2,
     max_result_length: int = 500,
     max_retry: int = 3,
+    request_timeout: float = REQUEST_TIMEOUT,
 ) -> list:
     """
     get web search results on wikipedia, and get a list of web search results, each consists of title, url and text content.
     :param search: query
     :param search_max_results: integer that used to mark the maxixum number of search results.
     :param max_result_length: interger that used to mark the maximum length of each results
+    :param request_timeout: seconds allowed for each request.
     :return: list of dictionaries, each consists of title, href, body.
     """
     url = search_url["wikipedia"]
     header = {"User-Agent": "LangChainBot/0.0"}
-    wiki_search = wikipediaapi.Wikipedia(header["User-Agent"], "en")
+    wiki_search = wikipediaapi.Wikipedia(
+        header["User-Agent"], "en", timeout=request_timeout
+    )
     query = search
     result_list = []
 
     for _ in range(max_retry):
-        response = requests.get(url=url + query, headers=header)
-        if response.status_code != 200:
+        try:
+            status, _, html = _get_text(url + query, request_timeout, headers=header)
+        except requests.RequestException:
+            continue
+        if status != 200:
             continue
 
-        soup = BeautifulSoup(response.text, "html.parser")
-        title_list = []
-        search_result_list = soup.find_all(
-            class_="mw-search-result mw-search-result-ns-0"
-        )
+        search_result_list = _wikipedia_titles(html)
         if search_result_list == []:
             page = wiki_search.page(query)
             if page.exists():
@@ -161,10 +305,7 @@ def wikipedia_search(
             else:
                 return []
         else:
-            for r in search_result_list[:search_max_results]:
-                title_list.append(r.find("a")["title"])
-
-            for title in title_list:
+            for title in search_result_list[:search_max_results]:
                 page = wiki_search.page(title)
                 if page.exists():
                     result_list.append(
@@ -178,6 +319,15 @@ def wikipedia_search(
     return []
 
 
+def _wikipedia_titles(html: str) -> list:
+    """:return: titles of the pages found by a wikipedia search page."""
+    soup = BeautifulSoup(html, "html.parser")
+    search_result_list = soup.find_all(
+        class_="mw-search-result mw-search-result-ns-0"
+    )
+    return [r.find("a")["title"] for r in search_result_list]
+
+
 def ddg_search(
     search: str,
     search_site: str = None,
@@ -211,50 +361,62 @@ def _bing_response_parse(
     header = default_headers,
     search_max_results: int = 1,
     max_result_length: int = 1000,
+    request_timeout: float = REQUEST_TIMEOUT,
+    deadline: float = SEARCH_DEADLINE,
 ) -> list:
     """
     parse the html page given by bing, and get a list of web search results, each consists of title, url and text content.
+    The result pages are fetched concurrently, the first search_max_results pages with a body are returned.
     :param html: string of html page.
     :param header: User-Agent
     :param search_max_results: integer that used to mark the maxixum number of search results.
     :param max_result_length: interger that used to mark the maximum length of result
+    :param request_timeout: seconds allowed for each page.
+    :param deadline: seconds allowed for all pages, results found by then are returned.
     :return: list of dictionaries, each consists of title, href, body.
     """
-    soup = BeautifulSoup(html, "html.parser")
-    search_num_results = 0  # the number of search results(successfully parsed)
-    parsed_list = []
+    deadline_at = time.monotonic() + deadline
 
-    result_list = soup.find_all(class_ = 'b_algo')
+    def fetch(title: str, url: str) -> Optional[dict]:
+        body = url_response_parse(
+            url, header, max_result_length, _timeout(request_timeout, deadline_at)
+        )
+        if url != "" and title != "" and body != "":
+            return {"title": title, "href": url, "body": body}
+        return None
 
-    for r in result_list:
-        try:
-            title = r.find('h2').text
-            url = r.find('cite').text
-            body = url_response_parse(url, header, max_result_length)
-        except:
-            url = ""
-            title = ""
-            body = ""
+    tasks = [functools.partial(fetch, title, url) for title, url in _bing_results(html)]
+    return _first_results(tasks, search_max_results, deadline_at)
 
-        if url != "" and title != "" and body != "":
-            parsed_list.append({"title": title, "href": url, "body": body})
-            search_num_results += 1
-            if search_num_results >= search_max_results:
-                break
 
-    return parsed_list
+def _bing_results(html: str) -> list:
+    """:return: (title, url) of the results of a bing result page."""
+    soup = BeautifulSoup(html, "html.parser")
+    results = []
+    for r in soup.find_all(class_ = 'b_algo'):
+        try:
+            results.append((r.find('h2').text, r.find('cite').text))
+        except AttributeError:
+            continue
+    return results
 
-def _baidu_get_real_url(v_url: str):
+def _baidu_get_real_url(v_url: str, timeout: float = REQUEST_TIMEOUT):
     """
     get the real address from virtual url by baidu
     :param v_url: 百度链接地址
     :return: 真实地址
     """
-    r = requests.get(v_url, headers=default_headers, allow_redirects=False)  # 不允许重定向
-    if r.status_code == 302:  # 如果返回302，就从响应头获取真实地址
-        real_url = r.headers.get("Location")
+    status, headers, text = _get_text(
+        v_url, timeout, headers=default_headers, allow_redirects=False
+    )  # 不允许重定向
+    return _baidu_real_url(status, headers, text)
+
+
+def _baidu_real_url(status_code: int, headers, text: str) -> str:
+    if status_code == 302:  # 如果返回302，就从响应头获取真实地址
+        real_url = headers.get("Location")
     else:  # 否则从返回内容中用正则表达式提取出来真实地址
-        real_url = re.findall("URL='(.*?)'", r.text)[0]
+        real_url = re.findall("URL='(.*?)'", text)[0]
     # print('real_url is:', real_url)
     return real_url
 
@@ -263,62 +425,424 @@ def _baidu_response_parse(
     html: str,
     search_site: str = None,
     search_max_results: int = 1,
+    request_timeout: float = REQUEST_TIMEOUT,
+    deadline: float = SEARCH_DEADLINE,
 ) -> list:
     """
     parse the html page given by baidu, and get a list of web search results, each consists of title, url and text content.
+    The real urls are resolved concurrently, the first search_max_results resolved results are returned.
     :param html: string of html page.
     :param search_site: used to distinguish results between different search sites.
     :param search_max_results: integer that used to mark the maxixum number of search results.
+    :param request_timeout: seconds allowed for each request.
+    :param deadline: seconds allowed for all requests, results found by then are returned.
     :return: list of dictionaries, each consists of title, href, body.
     """
-    soup = BeautifulSoup(html, "html.parser")
-    search_num_results = 0  # the number of search results(successfully parsed)
-    parsed_list = []
+    deadline_at = time.monotonic() + deadline
+
+    def resolve(vurl: str, title: str, body: str) -> Optional[dict]:
+        url = _baidu_get_real_url(vurl, _timeout(request_timeout, deadline_at))
+        if url and title != "" and body != "":
+            return {"title": title, "href": url, "body": body}
+        return None
+
+    tasks = [
+        functools.partial(resolve, vurl, title, body)
+        for vurl, title, body in _baidu_results(html, search_site)
+    ]
+    return _first_results(tasks, search_max_results, deadline_at)
 
+
+def _baidu_results(html: str, search_site: str = None) -> list:
+    """:return: (virtual url, title, body) of the results of a baidu result page."""
+    soup = BeautifulSoup(html, "html.parser")
     if search_site:
         result_list = soup.find_all(
             class_="result-op c-container new-pmd"
         ) + soup.find_all(class_="result-op c-container xpath-log new-pmd")
-        for r in result_list:
-            try:
-                r_a = r.find("a")
-                vurl = r_a["href"]
-                url = _baidu_get_real_url(vurl)
-                title = r_a.text
-                body = r.find(class_="c-font-normal c-color-text").text
-            except:
-                url = ""
-                title = ""
-                body = ""
-
-            if url != "" and title != "" and body != "":
-                parsed_list.append({"title": title, "href": url, "body": body})
-                search_num_results += 1
-                if search_num_results >= search_max_results:
-                    break
     else:
         result_list = soup.find_all(
             class_="result c-container new-pmd"
         ) + soup.find_all(class_="result c-container xpath-log new-pmd")
-        for r in result_list:
-            try:
-                r_a = r.find("a")
-                vurl = r_a["href"]
-                url = _baidu_get_real_url(vurl)
-                title = r_a.text
+    results = []
+    for r in result_list:
+        try:
+            r_a = r.find("a")
+            if search_site:
+                body = r.find(class_="c-font-normal c-color-text").text
+            else:
                 body = r.find("span", class_="content-right_8Zs40").text
-            except:
-                url = ""
-                title = ""
-                body = ""
-
-            if url != "" and title != "" and body != "":
-                parsed_list.append({"title": title, "href": url, "body": body})
-                search_num_results += 1
-                if search_num_results >= search_max_results:
-                    break
+            results.append((r_a["href"], r_a.text, body))
+        except (AttributeError, KeyError, TypeError):
+            continue
+    return results
+
+
+
+# Async versions of the searches above, for event loops serving many searches
+# at once: the requests of a search are sent on an aiohttp session, and the
+# result pages are fetched concurrently.
+
 
-    return parsed_list
+def _aiohttp():
+    try:
+        import aiohttp
+    except ImportError as e:
+        raise ImportError(
+            "async web search requires aiohttp, `pip install aiohttp`"
+        ) from e
+    return aiohttp
+
+
+_sessions: dict = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Shared aiohttp.ClientSession of the running event loop, created on first
+    use, so that searches reuse its keep-alive connections instead of opening
+    a session per search. Close it with aclose_session() before the loop ends.
+    """
+    loop = asyncio.get_running_loop()
+    with _sessions_lock:
+        for closed in [other for other in _sessions if other.is_closed()]:
+            del _sessions[closed]
+        session = _sessions.get(loop)
+        if session is None or session.closed:
+            session = _sessions[loop] = _aiohttp().ClientSession()
+        return session
+
+
+async def aclose_session() -> None:
+    """Close the shared session of the running event loop, if any."""
+    with _sessions_lock:
+        session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+async def async_web_search(
+    search: str,
+    search_engine: SEARCH_ENGINES = "bing",
+    search_site: str | None = None,
+    max_results: int = 2,
+    session=None,
+    request_timeout: float = REQUEST_TIMEOUT,
+    deadline: float = SEARCH_DEADLINE,
+) -> list:
+    """
+    async version of web_search.
+    :param session: aiohttp.ClientSession used for the requests, a new one is opened for this search if None,
+        pass get_session() to share one between searches.
+    :return: list of dictionaries, [{'title', 'href', 'body'}]
+    """
+    if session is None:
+        async with _aiohttp().ClientSession() as session:
+            return await async_web_search(
+                search,
+                search_engine,
+                search_site,
+                max_results,
+                session,
+                request_timeout,
+                deadline,
+            )
+    if search_engine == "baidu":
+        result = await async_baidu_search(
+            search=search,
+            search_site=search_site,
+            search_max_results=max_results,
+            session=session,
+            request_timeout=request_timeout,
+            deadline=deadline,
+        )
+    elif search_engine == "duckduckgo":
+        result = await async_ddg_search(
+            search=search, search_site=search_site, search_max_results=max_results
+        )
+    elif search_engine == "wikipedia":
+        result = await async_wikipedia_search(
+            search=search,
+            search_max_results=max_results,
+            session=session,
+            request_timeout=request_timeout,
+        )
+    elif search_engine == "bing":
+        result = await async_bing_search(
+            search=search,
+            search_max_results=max_results,
+            session=session,
+            request_timeout=request_timeout,
+            deadline=deadline,
+        )
+    return result
+
+
+async def _async_first_results(coros: list, max_results: int, deadline: float) -> list:
+    """async version of _first_results, the coroutines still running are cancelled."""
+    tasks = {asyncio.ensure_future(coro): i for i, coro in enumerate(coros)}
+    results = {}
+    pending = set(tasks)
+    try:
+        while pending and len(results) < max_results:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(
+                pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None and task.result():
+                    results[tasks[task]] = task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        # wait for the cancellations, and drop the errors of the tasks abandoned
+        await asyncio.gather(*pending, return_exceptions=True)
+    return [results[i] for i in sorted(results)][:max_results]
+
+
+def _async_timeout(request_timeout: float, deadline: float):
+    """:return: aiohttp.ClientTimeout of a request that must end before deadline."""
+    return _aiohttp().ClientTimeout(total=_timeout(request_timeout, deadline))
+
+
+async def _async_get_text(session, url: str, **kwargs) -> tuple[int, str]:
+    """
+    async version of _get_text, reads at most MAX_RESPONSE_BYTES of the body.
+    :return: status code and text of the response.
+    """
+    async with session.get(url, **kwargs) as response:
+        chunks, size = [], 0
+        while size < MAX_RESPONSE_BYTES:
+            # read returns as soon as some data is there, up to the given size
+            chunk = await response.content.read(MAX_RESPONSE_BYTES - size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        text = b"".join(chunks).decode(response.charset or "utf-8", errors="replace")
+        return response.status, text
+
+
+async def async_url_response_parse(
+    session,
+    url: str,
+    header = default_headers,
+    max_result_length: int = 1000,
+    timeout: float = REQUEST_TIMEOUT,
+) -> Optional[str]:
+    """async version of url_response_parse."""
+    _, html = await _async_get_text(
+        session, url, headers=header, timeout=_aiohttp().ClientTimeout(total=timeout)
+    )
+    return _page_text(html, max_result_length)
+
+
+async def async_baidu_search(
+    search: str,
+    headers: dict = default_headers,
+    search_site: str = None,
+    search_max_results: int = 1,
+    max_retry=3,
+    session=None,
+    request_timeout: float = REQUEST_TIMEOUT,
+    deadline: float = SEARCH_DEADLINE,
+) -> list:
+    """async version of baidu_search, session is an aiohttp.ClientSession."""
+    url = search_url["baidu"]
+    query = search if search_site is None else f"site:{search_site} " + search
+    deadline_at = time.monotonic() + deadline
+
+    async def resolve(vurl: str, title: str, body: str) -> Optional[dict]:
+        url = await _async_baidu_get_real_url(
+            session, vurl, _timeout(request_timeout, deadline_at)
+        )
+        if url and title != "" and body != "":
+            return {"title": title, "href": url, "body": body}
+        return None
+
+    for _ in range(max_retry):
+        if time.monotonic() >= deadline_at:
+            break
+        try:
+            status, html = await _async_get_text(
+                session,
+                url + query,
+                headers=headers,
+                timeout=_async_timeout(request_timeout, deadline_at),
+            )
+        except (_aiohttp().ClientError, asyncio.TimeoutError):
+            continue
+        if status != 200:
+            continue
+        return await _async_first_results(
+            [
+                resolve(vurl, title, body)
+                for vurl, title, body in _baidu_results(html, search_site)
+            ],
+            search_max_results,
+            deadline_at,
+        )
+
+    return []
+
+
+async def _async_baidu_get_real_url(
+    session, v_url: str, timeout: float = REQUEST_TIMEOUT
+) -> str:
+    async with session.get(
+        v_url,
+        headers=default_headers,
+        allow_redirects=False,
+        timeout=_aiohttp().ClientTimeout(total=timeout),
+    ) as r:
+        return _baidu_real_url(r.status, r.headers, await r.text(errors="replace"))
+
+
+async def async_bing_search(
+    search: str,
+    header = default_headers,
+    search_max_results: int = 1,
+    max_retry = 3,
+    max_result_length: int = 1000,
+    session=None,
+    request_timeout: float = REQUEST_TIMEOUT,
+    deadline: float = SEARCH_DEADLINE,
+) -> list:
+    """async version of bing_search, session is an aiohttp.ClientSession."""
+    url = search_url["bing"]
+    deadline_at = time.monotonic() + deadline
+
+    async def fetch(title: str, url: str) -> Optional[dict]:
+        body = await async_url_response_parse(
+            session,
+            url,
+            header,
+            max_result_length,
+            _timeout(request_timeout, deadline_at),
+        )
+        if url != "" and title != "" and body:
+            return {"title": title, "href": url, "body": body}
+        return None
+
+    for _ in range(max_retry):
+        if time.monotonic() >= deadline_at:
+            break
+        try:
+            status, html = await _async_get_text(
+                session,
+                url + search,
+                headers=header,
+                timeout=_async_timeout(request_timeout, deadline_at),
+            )
+        except (_aiohttp().ClientError, asyncio.TimeoutError):
+            continue
+        if status != 200:
+            continue
+        return await _async_first_results(
+            [fetch(title, url) for title, url in _bing_results(html)],
+            search_max_results,
+            deadline_at,
+        )
+    return []
+
+
+async def _async_wikipedia_summary(
+    session, title: str, header: dict, timeout=None
+) -> str | None:
+    """:return: the plain text introduction of a wikipedia page, None if it does not exist."""
+    params = {
+        "action": "query",
+        "format": "json",
+        "prop": "extracts",
+        "exintro": 1,
+        "explaintext": 1,
+        "redirects": 1,
+        "titles": title,
+    }
+    async with session.get(
+        "https://en.wikipedia.org/w/api.php",
+        params=params,
+        headers=header,
+        timeout=timeout,
+    ) as response:
+        pages = (await response.json())["query"]["pages"]
+    page = next(iter(pages.values()))
+    if "missing" in page or "invalid" in page:
+        return None
+    return page.get("extract", "").strip()
+
+
+async def async_wikipedia_search(
+    search: str,
+    search_max_results: int = 2,
+    max_result_length: int = 500,
+    max_retry: int = 3,
+    session=None,
+    request_timeout: float = REQUEST_TIMEOUT,
+) -> list:
+    """
+    async version of wikipedia_search, session is an aiohttp.ClientSession.
+    Summaries are read from the MediaWiki API instead of wikipediaapi, which is blocking.
+    """
+    url = search_url["wikipedia"]
+    header = {"User-Agent": "LangChainBot/0.0"}
+    timeout = _aiohttp().ClientTimeout(total=request_timeout)
+
+    for _ in range(max_retry):
+        try:
+            status, html = await _async_get_text(
+                session, url + search, headers=header, timeout=timeout
+            )
+        except (_aiohttp().ClientError, asyncio.TimeoutError):
+            continue
+        if status != 200:
+            continue
+
+        title_list = _wikipedia_titles(html)
+        if title_list == []:
+            summary = await _async_wikipedia_summary(session, search, header, timeout)
+            if summary is None:
+                return []
+            return [{"title": search, "href": None, "body": summary[:max_result_length]}]
+
+        title_list = title_list[:search_max_results]
+        summaries = await asyncio.gather(
+            *(
+                _async_wikipedia_summary(session, title, header, timeout)
+                for title in title_list
+            )
+        )
+        return [
+            {"title": title, "href": None, "body": summary[:max_result_length]}
+            for title, summary in zip(title_list, summaries)
+            if summary is not None
+        ]
+    return []
+
+
+async def async_ddg_search(
+    search: str,
+    search_site: str = None,
+    search_region: str = "wt-wt",
+    search_max_results: int = 1,
+) -> list:
+    """
+    async version of ddg_search.
+    DDGS only has a blocking client, so the search runs in the default executor.
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        None,
+        functools.partial(
+            ddg_search,
+            search=search,
+            search_site=search_site,
+            search_region=search_region,
+            search_max_results=search_max_results,
+        ),
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,179 @@
+"""
+Paper-level metadata stored once and referenced by id from every chunk.
+
+The metadata functions of the examples copy the title and author list of a
+paper into the metadata of each of its paragraphs. With a SharedMetadata
+store, the parsers move those shared fields into the store, keyed by a
+content hash, and leave only the id and the per-paragraph fields in the
+chunk metadata, with interned strings. Consumers that need the full metadata
+call expand() or expand_documents(), e.g. Database.retrieve(), or get their
+documents through a SharedMetadataRetriever, e.g. Database.retriever and the
+agent tool of Database.retriever_as_tool().
+"""
+
+
+from collections.abc import Iterable
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from typing import List
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) == str else value
+
+
+class SharedMetadata:
+    """
+    SQLite-backed store of shared metadata dicts.
+
+    The id of a shared dict is a hash of its content, so parser processes of
+    IngestPipeline can add to the same file and agree on ids without talking
+    to each other.
+    """
+
+    def __init__(
+        self, path: str, shared_keys: Iterable[str], id_key: str = "shared_id"
+    ) -> None:
+        """
+        :param path: sqlite file, created if missing, may be shared by processes.
+        :param shared_keys: metadata keys whose values are shared by the chunks of a record, e.g. ["title", "author"].
+        :param id_key: metadata key of the shared metadata id.
+        """
+        self.path = path
+        self.shared_keys = [sys.intern(key) for key in shared_keys]
+        self.id_key = sys.intern(id_key)
+        # bounded sets of ids known to be stored and of expanded dicts
+        self._stored: set[str] = set()
+        self._cache: dict[str, dict] = {}
+        self.cache_size = 4096
+        self._last: tuple[dict, str] | None = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connection()
+
+    def _connection(self) -> sqlite3.Connection:
+        # A connection must not be used across fork, reopen in worker processes.
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(
+                self.path, check_same_thread=False, timeout=60
+            )
+            self._conn.executescript(
+                """
+                PRAGMA journal_mode = WAL;
+                PRAGMA synchronous = NORMAL;
+                CREATE TABLE IF NOT EXISTS shared (
+                    id TEXT PRIMARY KEY,
+                    metadata TEXT NOT NULL
+                );
+                """
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    def _put(self, shared: dict) -> str:
+        # the previous record usually has the same shared fields
+        if self._last is not None and self._last[0] == shared:
+            return self._last[1]
+        encoded = json.dumps(shared, sort_keys=True, ensure_ascii=False)
+        shared_id = hashlib.sha1(encoded.encode("utf8")).hexdigest()[:16]
+        if shared_id not in self._stored:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR IGNORE INTO shared VALUES (?, ?)", (shared_id, encoded)
+                )
+                conn.commit()
+            if len(self._stored) >= self.cache_size:
+                self._stored.clear()
+            self._stored.add(shared_id)
+        self._last = (shared, shared_id)
+        return shared_id
+
+    def compact(self, metadata: dict) -> dict:
+        """:return: metadata with the shared keys replaced by the id of their values."""
+        shared = {key: metadata[key] for key in self.shared_keys if key in metadata}
+        inline = {
+            sys.intern(key): _intern(value)
+            for key, value in metadata.items()
+            if key not in shared
+        }
+        if shared:
+            inline[self.id_key] = sys.intern(self._put(shared))
+        return inline
+
+    def compact_all(self, metadatas: dict | list[dict]) -> dict | list[dict]:
+        if type(metadatas) == dict:
+            return self.compact(metadatas)
+        return [self.compact(metadata) for metadata in metadatas]
+
+    def _get(self, shared_id: str) -> dict:
+        shared = self._cache.get(shared_id)
+        if shared is None:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT metadata FROM shared WHERE id = ?", (shared_id,)
+                ).fetchone()
+            if row is None:
+                raise KeyError(f"unknown shared metadata id {shared_id}")
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            shared = self._cache[shared_id] = json.loads(row[0])
+        return shared
+
+    def expand(self, metadata: dict) -> dict:
+        """:return: the full metadata of a compacted metadata dict."""
+        if self.id_key not in metadata:
+            return metadata
+        expanded = dict(self._get(metadata[self.id_key]))
+        expanded.update(
+            (key, value) for key, value in metadata.items() if key != self.id_key
+        )
+        return expanded
+
+    def expand_documents(self, documents: Iterable[Document]) -> list[Document]:
+        return [
+            Document(
+                page_content=document.page_content,
+                metadata=self.expand(document.metadata),
+            )
+            for document in documents
+        ]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class SharedMetadataRetriever(BaseRetriever):
+    """Retriever returning the documents of another retriever with their metadata expanded."""
+
+    retriever: BaseRetriever
+    metadata_store: SharedMetadata
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        documents = self.retriever.invoke(
+            query, {"callbacks": run_manager.get_child()}
+        )
+        return self.metadata_store.expand_documents(documents)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        documents = await self.retriever.ainvoke(
+            query, {"callbacks": run_manager.get_child()}
+        )
+        return self.metadata_store.expand_documents(documents)
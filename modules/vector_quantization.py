@@ -0,0 +1,203 @@
+"""
+Compressed codes for stored embeddings, used by LocalVectorStore.
+
+Every quantizer is trained on a sample of vectors, encodes vectors to compact
+codes, and scores a batch of queries against codes without decoding them.
+The scores approximate inner products, so the top candidates are rescored
+against the full-precision vectors, which stay on disk.
+
+    int8    per-dimension scalar quantization,    dim bytes per vector
+    pq      product quantization, 256 centroids,  m bytes per vector
+    binary  sign bits, asymmetric scoring,        dim / 8 bytes per vector
+"""
+
+
+from abc import ABC, abstractmethod
+from typing import Literal
+import numpy as np
+
+QUANTIZATIONS = Literal["int8", "pq", "binary"]
+
+
+def kmeans(
+    x: np.ndarray,
+    n_clusters: int,
+    n_iter: int = 10,
+    seed: int = 0,
+    spherical: bool = False,
+) -> np.ndarray:
+    """
+    Lloyd's k-means on the rows of x.
+    :param spherical: assign by inner product and keep centroids unit-normed, for cosine data.
+    :return: centroids, shape (n_clusters, x.shape[1])
+    """
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float32)
+    centroids = x[rng.choice(len(x), size=n_clusters, replace=len(x) < n_clusters)].copy()
+    for _ in range(n_iter):
+        assign = assign_clusters(x, centroids, spherical)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=n_clusters)
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+        if spherical:
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.maximum(norms, 1e-12)
+    return centroids
+
+
+def assign_clusters(
+    x: np.ndarray, centroids: np.ndarray, spherical: bool = False
+) -> np.ndarray:
+    if spherical:
+        return np.argmax(x @ centroids.T, axis=1)
+    # argmin ||x - c||^2 == argmax 2 x.c - ||c||^2
+    return np.argmax(2 * (x @ centroids.T) - (centroids**2).sum(axis=1), axis=1)
+
+
+class Quantizer(ABC):
+    kind: str = ""
+
+    @abstractmethod
+    def train(self, vectors: np.ndarray) -> None:
+        ...
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        ...
+
+    @abstractmethod
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Approximate inner products, shape (n_queries, n_codes)."""
+
+    @abstractmethod
+    def code_size(self, dim: int) -> int:
+        """Bytes per encoded vector."""
+
+    @abstractmethod
+    def state(self) -> dict[str, np.ndarray]:
+        ...
+
+    def save(self, path: str) -> None:
+        np.savez(path, kind=np.array(self.kind), **self.state())
+
+    @staticmethod
+    def load(path: str) -> "Quantizer":
+        with np.load(path) as data:
+            state = {key: data[key] for key in data.files}
+        quantizer = make_quantizer(str(state.pop("kind")))
+        for key, value in state.items():
+            setattr(quantizer, key, value)
+        return quantizer
+
+
+class ScalarQuantizer(Quantizer):
+    """x ~= low + scale * (code + 128), one int8 per dimension."""
+
+    kind = "int8"
+
+    def train(self, vectors: np.ndarray) -> None:
+        self.low = vectors.min(axis=0).astype(np.float32)
+        self.scale = ((vectors.max(axis=0) - self.low) / 255).astype(np.float32)
+        self.scale[self.scale == 0] = 1
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((vectors - self.low) / self.scale) - 128
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        return (queries * self.scale) @ (codes.astype(np.float32) + 128).T + (
+            queries @ self.low
+        )[:, None]
+
+    def code_size(self, dim: int) -> int:
+        return dim
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {"low": self.low, "scale": self.scale}
+
+
+class ProductQuantizer(Quantizer):
+    """Split vectors into m sub-vectors, each replaced by the id of one of 256 centroids."""
+
+    kind = "pq"
+
+    def __init__(self, m: int = 16, n_iter: int = 10, seed: int = 0) -> None:
+        self.m = m
+        self.n_iter = n_iter
+        self.seed = seed
+
+    def train(self, vectors: np.ndarray) -> None:
+        dim = vectors.shape[1]
+        if dim % self.m:
+            raise ValueError(f"dimension {dim} is not divisible by m={self.m}")
+        sub = dim // self.m
+        self.codebooks = np.stack(
+            [
+                kmeans(vectors[:, j * sub : (j + 1) * sub], 256, self.n_iter, self.seed)
+                for j in range(self.m)
+            ]
+        )
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        m, _, sub = self.codebooks.shape
+        return np.stack(
+            [
+                assign_clusters(vectors[:, j * sub : (j + 1) * sub], self.codebooks[j])
+                for j in range(m)
+            ],
+            axis=1,
+        ).astype(np.uint8)
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        m, _, sub = self.codebooks.shape
+        # lookup tables: (n_queries, m, 256) inner products of query parts with centroids
+        parts = queries.reshape(len(queries), m, sub)
+        tables = np.einsum("qms,mks->qmk", parts, self.codebooks)
+        codes = codes.astype(np.intp)
+        return np.stack(
+            [table[np.arange(m), codes].sum(axis=1) for table in tables]
+        )
+
+    def code_size(self, dim: int) -> int:
+        return int(self.codebooks.shape[0]) if hasattr(self, "codebooks") else self.m
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+
+class BinaryQuantizer(Quantizer):
+    """
+    One sign bit per dimension. Queries stay in full precision and are scored
+    against the +-1 code vectors (asymmetric scoring), which recalls better
+    than Hamming distance between two binary codes.
+    """
+
+    kind = "binary"
+
+    def train(self, vectors: np.ndarray) -> None:
+        self.center = vectors.mean(axis=0).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.packbits(vectors > self.center, axis=1)
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        signs = np.unpackbits(codes, axis=1, count=len(self.center)).astype(np.float32)
+        return 2 * (queries @ signs.T) - queries.sum(axis=1, keepdims=True)
+
+    def code_size(self, dim: int) -> int:
+        return (dim + 7) // 8
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {"center": self.center}
+
+
+def make_quantizer(kind: QUANTIZATIONS, **kwargs) -> Quantizer:
+    if kind == "int8":
+        return ScalarQuantizer()
+    if kind == "pq":
+        return ProductQuantizer(**kwargs)
+    if kind == "binary":
+        return BinaryQuantizer()
+    raise ValueError(f"unknown quantization {kind}, must be one of int8, pq, binary")
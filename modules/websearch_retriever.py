@@ -1,7 +1,11 @@
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
 from langchain_core.callbacks.base import Callbacks
 from langchain_core.documents import Document
 from langchain_core.retrievers import BaseRetriever
-from .search_utils import SEARCH_ENGINES, web_search
+from .search_utils import SEARCH_ENGINES, async_web_search, get_session, web_search
 from typing import Any, Dict, List, Optional
 
 
@@ -24,7 +28,9 @@ class WebSearchRetriever(BaseRetriever):
         )
         return doc
 
-    def get_relevant_documents(self, query: str) -> List[Document]:
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
         results_list = web_search(
             search=query,
             search_engine=self.search_engine,
@@ -33,6 +39,18 @@ class WebSearchRetriever(BaseRetriever):
         docs = [self._dict2doc(r) for r in results_list]
         return docs
 
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        results_list = await async_web_search(
+            search=query,
+            search_engine=self.search_engine,
+            max_results=self.k,
+            session=get_session(),
+        )
+        docs = [self._dict2doc(r) for r in results_list]
+        return docs
+
 
 class BaiduWebSearchRetriever(WebSearchRetriever):
     def __init__(self):